@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the device payload and persona hot paths.
+
+Cases:
+  template_render   cached compiled render of every payload template
+  template_batch    render_batch + encode for a block of device contexts
+  template_frame    pre-encoded PayloadFrame render
+  json_log          json_log -> LogWriter, written to /dev/null
+  vuln_headers      vuln_injector.apply_http_headers for every profile
+  vuln_client_id    vuln_injector.mutate_mqtt_client_id for every profile
+  build_mapping     mapper_service.build_mapping on synthetic /logs sets
+
+Each result has ops/sec and peak traced bytes per op (tracemalloc, taken on a
+shorter traced run). Results are printed as JSON events and written to
+``--output`` together with run metadata; ``--baseline`` compares against an
+earlier file and ``--max-regression`` turns slowdowns into a failing exit code.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from devices.common.payload_generator import TemplateCache  # noqa: E402
+from devices.common.vuln_injector import apply_http_headers, mutate_mqtt_client_id  # noqa: E402
+from devices.common.vulnerability_toggles import DEFAULT_PROFILES  # noqa: E402
+from devices.scripts.common import LOG_WRITER, json_log  # noqa: E402
+from scripts.mapper.mapper_service import build_mapping  # noqa: E402
+
+TEMPLATE_DIR = ROOT / "devices" / "common" / "payload_templates"
+CONTEXT = {"device_id": "bench-0001", "firmware_version": "1.2.3", "server_ip": "10.0.0.1"}
+HEADERS = {"Accept": "application/json", "User-Agent": "IOTDevice/1.2.3"}
+MAPPING_DEVICES = 5000  # distinct MACs behind the synthetic log sets
+
+
+def measure(case: str, name: str, op: Callable[[], Any], ops: int, traced: int, per_call: int = 1) -> dict[str, Any]:
+    """Time ``ops`` calls of ``op`` (each doing ``per_call`` operations), then trace ``traced`` calls for memory."""
+    op()  # warm up caches and lazily built state
+    start = time.perf_counter()
+    for _ in range(ops):
+        op()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    tracemalloc.start()
+    for _ in range(traced):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = op()
+        peak += tracemalloc.get_traced_memory()[1] - baseline
+        del result
+    tracemalloc.stop()
+    return {
+        "case": case,
+        "name": name,
+        "ops": ops * per_call,
+        "ops_per_sec": round(ops * per_call / elapsed, 1),
+        "peak_bytes_per_op": round(peak / max(1, traced * per_call), 1),
+    }
+
+
+def bench_templates(ops: int, traced: int, batch_size: int) -> list[dict[str, Any]]:
+    cache = TemplateCache()
+    contexts = [{**CONTEXT, "device_id": f"bench-{index:04d}"} for index in range(batch_size)]
+    results = []
+    for path in sorted(TEMPLATE_DIR.glob("*.json")):
+        template = cache.get(path)
+        frame = template.frame(CONTEXT)
+        results.append(measure("template_render", path.name, lambda: template.render(CONTEXT), ops, traced))
+        results.append(
+            measure(
+                "template_batch",
+                path.name,
+                lambda: template.encode_batch(contexts),
+                max(1, ops // batch_size),
+                max(1, traced // batch_size),
+                per_call=batch_size,
+            )
+        )
+        results.append(measure("template_frame", path.name, frame.render, ops, traced))
+    return results
+
+
+def bench_json_log(ops: int, traced: int) -> list[dict[str, Any]]:
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        dropped = LOG_WRITER.dropped_total
+        result = measure(
+            "json_log", "mqtt_publish", lambda: json_log("mqtt_publish", topic="bench/telemetry"), ops, traced
+        )
+        LOG_WRITER.flush()
+    result["dropped"] = LOG_WRITER.dropped_total - dropped
+    return [result]
+
+
+def bench_vuln_injector(ops: int, traced: int) -> list[dict[str, Any]]:
+    results = []
+    for name, profile in DEFAULT_PROFILES.items():
+        results.append(
+            measure("vuln_headers", name, lambda: apply_http_headers(HEADERS, profile, "1.2.3"), ops, traced)
+        )
+        results.append(
+            measure("vuln_client_id", name, lambda: mutate_mqtt_client_id("bench-0001", profile, "1.2.3"), ops, traced)
+        )
+    return results
+
+
+def mapping_logs(entries: int) -> dict[str, Any]:
+    """``/logs`` body of ``entries`` events: every third is a device_mapping for one of MAPPING_DEVICES MACs.
+
+    Entries are drawn from a fixed pool of dicts so a 1M-entry set costs a list, not a million dicts.
+    """
+    pool = []
+    for index in range(MAPPING_DEVICES):
+        mac = f"00:1d:9c:{(index >> 16) & 255:02x}:{(index >> 8) & 255:02x}:{index & 255:02x}"
+        pool.append(
+            {
+                "event": "device_mapping",
+                "mac": mac,
+                "device_type": "PLC_MODBUS",
+                "device_id": f"plc{index:05d}",
+                "firmware": "11.0.3",
+                "ip": f"10.0.{(index >> 8) & 255}.{index & 255}",
+                "timestamp": 1700000000.0 + index,
+            }
+        )
+        pool.append({"event": "mqtt_publish", "device_id": f"plc{index:05d}", "timestamp": 1700000000.0})
+        pool.append({"event": "rtsp_describe", "device_id": f"plc{index:05d}", "timestamp": 1700000000.0})
+    return {"logs": [pool[index % len(pool)] for index in range(entries)]}
+
+
+def bench_build_mapping(sizes: list[int], traced: int) -> list[dict[str, Any]]:
+    results = []
+    for size in sizes:
+        logs = mapping_logs(size)
+        result = measure("build_mapping", f"{size}_entries", lambda: build_mapping(logs), 3, min(traced, 1))
+        result["entries_per_sec"] = round(result["ops_per_sec"] * size, 1)
+        results.append(result)
+    return results
+
+
+def metadata() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "suite": "hot_paths",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: list[dict[str, Any]], baseline_path: Path) -> list[dict[str, Any]]:
+    """Annotate results with the baseline rate and the change in percent; returns the slower ones."""
+    baseline = {(item["case"], item["name"]): item for item in json.loads(baseline_path.read_text())["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["case"], result["name"]))
+        if previous is None or not previous.get("ops_per_sec"):
+            continue
+        result["baseline_ops_per_sec"] = previous["ops_per_sec"]
+        result["change_pct"] = round((result["ops_per_sec"] / previous["ops_per_sec"] - 1) * 100, 1)
+        if result["change_pct"] < 0:
+            regressions.append(result)
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark payload generator and persona hot paths.")
+    parser.add_argument("--ops", type=int, default=20000, help="Timed calls per case")
+    parser.add_argument("--traced", type=int, default=200, help="Calls per case under tracemalloc")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Contexts per template_batch call")
+    parser.add_argument("--log-sizes", default="10000,1000000", help="build_mapping log set sizes")
+    parser.add_argument("--cases", default="templates,json_log,vuln,mapping", help="Comma separated case groups")
+    parser.add_argument("--output", type=Path, default=Path("bench_hot_paths.json"), help="Results file")
+    parser.add_argument("--baseline", type=Path, help="Earlier results file to compare against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="Exit 1 if any case is more than this many percent slower than the baseline",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    cases = {item.strip() for item in args.cases.split(",") if item.strip()}
+    results: list[dict[str, Any]] = []
+    if "templates" in cases:
+        results += bench_templates(args.ops, args.traced, args.batch_size)
+    if "json_log" in cases:
+        results += bench_json_log(args.ops, args.traced)
+    if "vuln" in cases:
+        results += bench_vuln_injector(args.ops, args.traced)
+    if "mapping" in cases:
+        results += bench_build_mapping([int(item) for item in args.log_sizes.split(",") if item.strip()], args.traced)
+    regressions = compare(results, args.baseline) if args.baseline else []
+    for result in results:
+        print(json.dumps({"event": "bench_hot_paths", **result}), flush=True)
+    args.output.write_text(json.dumps({**metadata(), "results": results}, indent=2) + "\n")
+    print(json.dumps({"event": "bench_hot_paths_written", "path": str(args.output), "results": len(results)}))
+    if args.max_regression is not None:
+        failed = [item for item in regressions if item["change_pct"] < -args.max_regression]
+        for item in failed:
+            print(json.dumps({"event": "bench_hot_paths_regression", **item}), flush=True)
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Compare per-message cost of building a payload dict and ``json.dumps``-ing it
+against rendering a pre-encoded PayloadFrame that only re-encodes its dynamic
+slots. Memory is measured with tracemalloc as the peak traced bytes while
+producing one message (temporaries included), averaged; throughput is measured
+untraced.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from devices.common.payload_generator import TemplateCache, encoder  # noqa: E402
+
+TEMPLATE_DIR = ROOT / "devices" / "common" / "payload_templates"
+TEMPLATES = ("ecg_mqtt.json", "nvr_sim.json", "thermostat_mqtt.json")
+CONTEXT = {"device_id": "bench-0001", "firmware_version": "1.2.3", "server_ip": "10.0.0.1"}
+
+
+def peak_bytes(produce: Callable[[], bytes], messages: int) -> float:
+    """Mean high-water mark of traced memory above the baseline while producing one message."""
+    total = 0
+    tracemalloc.start()
+    for _ in range(messages):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        message = produce()
+        total += tracemalloc.get_traced_memory()[1] - baseline
+        del message
+    tracemalloc.stop()
+    return total / messages
+
+
+def throughput(produce: Callable[[], bytes], messages: int) -> float:
+    start = time.perf_counter()
+    for _ in range(messages):
+        produce()
+    return messages / (time.perf_counter() - start)
+
+
+def run(messages: int, traced: int, encodings: list[str]) -> list[dict[str, object]]:
+    cache = TemplateCache()
+    results = []
+    for name in TEMPLATES:
+        template = cache.get(TEMPLATE_DIR / name)
+        modes: dict[str, Callable[[], bytes]] = {
+            "dict_json_dumps": lambda: json.dumps(template.render(CONTEXT)).encode(),
+        }
+        for encoding in encodings:
+            try:
+                encoder(encoding)
+            except ValueError as exc:
+                print(json.dumps({"event": "bench_payload_frames_skipped", "encoding": encoding, "reason": str(exc)}))
+                continue
+            modes[f"frame_{encoding}"] = template.frame(CONTEXT, encoding).render
+        for mode, produce in modes.items():
+            produce()  # warm up lazily built state
+            results.append(
+                {
+                    "template": name,
+                    "mode": mode,
+                    "bytes": len(produce()),
+                    "messages_per_sec": round(throughput(produce, messages), 1),
+                    "peak_bytes_per_msg": round(peak_bytes(produce, traced), 1),
+                }
+            )
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark pre-encoded payload frames.")
+    parser.add_argument("--messages", type=int, default=50000, help="Messages per mode for throughput")
+    parser.add_argument("--traced", type=int, default=200, help="Messages per mode under tracemalloc")
+    parser.add_argument("--encodings", default="json,msgpack,cbor", help="Frame encodings to compare")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    for result in run(args.messages, args.traced, [item for item in args.encodings.split(",") if item]):
+        print(json.dumps({"event": "bench_payload_frames", **result}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Measure payload rendering cost (renders/sec) for every template under
+devices/common/payload_templates/: reading, parsing and compiling the
+template on every call, rendering the cached compiled template, and rendering
+plus encoding payloads for a block of device contexts with ``encode_batch``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from devices.common.payload_generator import TemplateCache, compile_template  # noqa: E402
+
+TEMPLATE_DIR = ROOT / "devices" / "common" / "payload_templates"
+CONTEXT = {"device_id": "bench-0001", "firmware_version": "1.2.3", "server_ip": "10.0.0.1"}
+
+
+def bench_uncached(path: Path, renders: int) -> float:
+    start = time.perf_counter()
+    for _ in range(renders):
+        compile_template(path).render(CONTEXT)
+    return time.perf_counter() - start
+
+
+def bench_cached(cache: TemplateCache, path: Path, renders: int) -> float:
+    cache.get(path)
+    start = time.perf_counter()
+    for _ in range(renders):
+        cache.get(path).render(CONTEXT)
+    return time.perf_counter() - start
+
+
+def bench_batch(cache: TemplateCache, path: Path, renders: int, batch_size: int) -> float:
+    template = cache.get(path)
+    contexts = [{**CONTEXT, "device_id": f"bench-{index:04d}"} for index in range(batch_size)]
+    start = time.perf_counter()
+    for _ in range(max(1, renders // batch_size)):
+        template.encode_batch(contexts)
+    return time.perf_counter() - start
+
+
+def run(renders: int, batch_size: int) -> list[dict[str, object]]:
+    cache = TemplateCache()
+    results = []
+    for path in sorted(TEMPLATE_DIR.glob("*.json")):
+        uncached = bench_uncached(path, renders)
+        cached = bench_cached(cache, path, renders)
+        batched = bench_batch(cache, path, renders, batch_size)
+        encoded = max(1, renders // batch_size) * batch_size
+        results.append(
+            {
+                "template": path.name,
+                "renders": renders,
+                "uncached_per_sec": round(renders / uncached, 1),
+                "cached_per_sec": round(renders / cached, 1),
+                "speedup": round(uncached / cached, 2),
+                "batch_encoded_per_sec": round(encoded / batched, 1),
+            }
+        )
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark payload template rendering.")
+    parser.add_argument("--renders", type=int, default=20000, help="Renders per template and mode")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Contexts per encode_batch call")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    for result in run(args.renders, args.batch_size):
+        print(json.dumps({"event": "bench_payload_templates", **result}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
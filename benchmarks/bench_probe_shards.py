@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Measure aggregate hub probe throughput (probes/sec) as the registry is split
+across 1..N connection_manager worker processes by the consistent-hash ring.
+
+Every worker reads only its own shard from a synthetic registry and sweeps it
+against local accept-and-close TCP listeners in TCP-connect probe mode (the
+listeners speak no protocol, so app-layer probes could never succeed);
+scaling efficiency is the aggregate rate divided by N times the single-worker
+rate. ``--min-efficiency`` turns poor scaling at the largest worker count into a
+failing exit code; run it on a machine with cores to spare for the listeners.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HUB_DIR = Path(__file__).resolve().parents[1] / "hub"
+if str(HUB_DIR) not in sys.path:
+    sys.path.insert(0, str(HUB_DIR))
+
+import connection_manager  # noqa: E402
+from connection_manager import ProbeTarget, sweep  # noqa: E402
+from registry_store import ConnectionPool, changes_in_ranges, init_db, registration_row, upsert_devices  # noqa: E402
+from shard_ring import HashRing  # noqa: E402
+
+
+def make_registry(db_path: Path, devices: int) -> None:
+    pool = ConnectionPool(db_path, size=1)
+    init_db(pool)
+    now = time.time()
+    rows = [
+        registration_row(f"cam{index:06d}", "CAMERA_RTSP", "server", "127.0.0.1", ["RTSP"], now, None, None)
+        for index in range(devices)
+    ]
+    with pool.transaction() as conn:
+        upsert_devices(conn, rows)
+    pool.close()
+
+
+def serve(sock: socket.socket) -> None:
+    while True:
+        conn, _ = sock.accept()
+        conn.close()
+
+
+def probe_worker(
+    db_path: Path,
+    worker_id: str,
+    workers: list[str],
+    port: int,
+    rounds: int,
+    concurrency: int,
+    start,
+    results,
+) -> None:
+    sys.stdout = open(os.devnull, "w")  # per-probe log events are not what is being measured
+    connection_manager.PROBE_MODE = "tcp"  # regardless of HUB_PROBE_MODE in the environment
+    pool = ConnectionPool(db_path, size=1)
+    with pool.connection() as conn:
+        _, devices = changes_in_ranges(conn, HashRing(workers).ranges(worker_id))
+    targets = [ProbeTarget(str(device["device_id"]), "127.0.0.1", port, "RTSP") for device in devices]
+    start.wait()
+    began = time.perf_counter()
+    failed = 0
+    for _ in range(rounds):
+        failed += asyncio.run(sweep(targets, concurrency))["failed"]
+    results.put((worker_id, len(targets) * rounds, failed, time.perf_counter() - began))
+
+
+def bench_workers(db_path: Path, count: int, port: int, rounds: int, concurrency: int) -> dict[str, object]:
+    workers = [f"probe-{index}" for index in range(count)]
+    start = multiprocessing.Event()
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(
+            target=probe_worker,
+            args=(db_path, worker_id, workers, port, rounds, concurrency, start, results),
+        )
+        for worker_id in workers
+    ]
+    for proc in procs:
+        proc.start()
+    start.set()
+    outcomes = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    probes = sum(outcome[1] for outcome in outcomes)
+    elapsed = max(outcome[3] for outcome in outcomes)
+    shard_sizes = [outcome[1] // rounds for outcome in outcomes]
+    return {
+        "workers": count,
+        "probes": probes,
+        "failed": sum(outcome[2] for outcome in outcomes),
+        "duration_s": round(elapsed, 3),
+        "probes_per_sec": round(probes / elapsed, 1),
+        "max_shard_skew": round(max(shard_sizes) * count / max(1, sum(shard_sizes)), 3),
+    }
+
+
+def run(
+    devices: int,
+    worker_counts: list[int],
+    listeners: int,
+    rounds: int,
+    concurrency: int,
+) -> list[dict[str, object]]:
+    results = []
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(4096)
+    port = sock.getsockname()[1]
+    servers = [multiprocessing.Process(target=serve, args=(sock,), daemon=True) for _ in range(max(1, listeners))]
+    for server in servers:
+        server.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "registry.db"
+            make_registry(db_path, devices)
+            baseline = None
+            for count in worker_counts:
+                result = bench_workers(db_path, count, port, rounds, concurrency)
+                baseline = baseline or result["probes_per_sec"]
+                result["efficiency"] = round(result["probes_per_sec"] / (baseline * count), 3)
+                results.append(result)
+    finally:
+        for server in servers:
+            server.terminate()
+        sock.close()
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    cores = os.cpu_count() or 1
+    default_workers = sorted({1, *(count for count in (2, 4, 8, 16, 32) if count <= cores), cores})
+    parser = argparse.ArgumentParser(description="Benchmark sharded hub probe throughput.")
+    parser.add_argument("--devices", type=int, default=20000)
+    parser.add_argument(
+        "--workers",
+        default=",".join(str(count) for count in default_workers),
+        help="Comma separated worker process counts",
+    )
+    parser.add_argument(
+        "--listeners",
+        type=int,
+        default=max(1, cores // 4),
+        help="Accept-and-close listener processes serving the probes",
+    )
+    parser.add_argument("--rounds", type=int, default=3, help="Sweeps of its shard per worker")
+    parser.add_argument("--concurrency", type=int, default=256, help="Probes in flight per worker")
+    parser.add_argument(
+        "--min-efficiency",
+        type=float,
+        help="Exit 1 if scaling efficiency at the largest worker count is below this (e.g. 0.6)",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    worker_counts = [int(item) for item in args.workers.split(",") if item.strip()]
+    results = run(args.devices, worker_counts, args.listeners, args.rounds, args.concurrency)
+    for result in results:
+        print(json.dumps({"event": "bench_probe_shards", **result}), flush=True)
+    if args.min_efficiency is not None and results and results[-1]["efficiency"] < args.min_efficiency:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
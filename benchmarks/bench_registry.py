@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Measure hub registry write throughput (registrations/sec) for the legacy
+connect-per-request path, pooled single upserts and /register/batch style
+bulk upserts.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HUB_DIR = Path(__file__).resolve().parents[1] / "hub"
+if str(HUB_DIR) not in sys.path:
+    sys.path.insert(0, str(HUB_DIR))
+
+from registry_store import UPSERT_DEVICE_SQL, ConnectionPool, init_db, registration_row, upsert_devices  # noqa: E402
+from shard_ring import shard_key  # noqa: E402
+
+
+def make_rows(count: int, now: float) -> list[tuple]:
+    return [
+        registration_row(
+            f"dev{index:06d}",
+            "PLC_MODBUS",
+            "both",
+            f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}",
+            ["ModbusTCP"],
+            now,
+            "11.0.3",
+            f"00:1d:9c:{(index >> 16) & 255:02x}:{(index >> 8) & 255:02x}:{index & 255:02x}",
+        )
+        for index in range(count)
+    ]
+
+
+def bench_legacy(db_path: Path, rows: list[tuple]) -> float:
+    start = time.perf_counter()
+    for row in rows:
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(UPSERT_DEVICE_SQL, row + (0, shard_key(row[0])))
+            conn.commit()
+    return time.perf_counter() - start
+
+
+def bench_pooled(pool: ConnectionPool, rows: list[tuple]) -> float:
+    start = time.perf_counter()
+    for row in rows:
+        with pool.transaction() as conn:
+            upsert_devices(conn, [row])
+    return time.perf_counter() - start
+
+
+def bench_batch(pool: ConnectionPool, rows: list[tuple], batch_size: int) -> float:
+    start = time.perf_counter()
+    for offset in range(0, len(rows), batch_size):
+        with pool.transaction() as conn:
+            upsert_devices(conn, rows[offset : offset + batch_size])
+    return time.perf_counter() - start
+
+
+def run(sizes: list[int], batch_size: int, legacy_limit: int) -> list[dict[str, object]]:
+    results = []
+    for size in sizes:
+        rows = make_rows(size, time.time())
+        with tempfile.TemporaryDirectory() as tmp:
+            legacy_rows = rows[:legacy_limit]
+            legacy_path = Path(tmp) / "legacy.db"
+            init_db(ConnectionPool(legacy_path, size=1))
+            legacy = bench_legacy(legacy_path, legacy_rows)
+
+            pool = ConnectionPool(Path(tmp) / "pooled.db")
+            init_db(pool)
+            pooled = bench_pooled(pool, rows)
+            batch = bench_batch(pool, rows, batch_size)
+            pool.close()
+        results.append(
+            {
+                "devices": size,
+                "legacy_per_sec": round(len(legacy_rows) / legacy, 1),
+                "pooled_per_sec": round(size / pooled, 1),
+                "batch_per_sec": round(size / batch, 1),
+                "batch_size": batch_size,
+            }
+        )
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark hub registry registrations/sec.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma separated device counts")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--legacy-limit",
+        type=int,
+        default=10000,
+        help="Cap on registrations timed for the connect-per-request baseline",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    sizes = [int(item) for item in args.sizes.split(",") if item.strip()]
+    for result in run(sizes, args.batch_size, args.legacy_limit):
+        print(json.dumps({"event": "bench_registry", **result}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Drive many paho MQTT clients from one selector thread.
+
+``loop_start()`` gives every client its own network thread. The fleet instead
+hooks each client's socket callbacks into a single ``selectors`` loop that
+reads, writes and runs ``loop_misc()`` (keepalive pings) for every session.
+Each client keeps its own client_id, keepalive and paho publish queue, and
+dropped sessions are reconnected with per-client backoff on a small helper
+pool, so a black-holed broker never blocks the loop.
+"""
+
+from __future__ import annotations
+
+import os
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict
+
+import paho.mqtt.client as mqtt
+
+from devices.scripts.common import DeviceContext, current_device, json_log, use_device
+
+MISC_INTERVAL = 1.0
+MAX_QUEUED = int(os.environ.get("DEVICE_MQTT_MAX_QUEUED", "1000"))
+RECONNECT_MIN = float(os.environ.get("DEVICE_MQTT_RECONNECT_MIN", "1"))
+RECONNECT_MAX = float(os.environ.get("DEVICE_MQTT_RECONNECT_MAX", "60"))
+RECONNECT_THREADS = int(os.environ.get("DEVICE_MQTT_RECONNECT_THREADS", "2"))
+
+
+@dataclass(eq=False)
+class _Session:
+    client: mqtt.Client
+    device: DeviceContext
+    sock: Any = None
+    closing: bool = False
+    reconnecting: bool = False
+    reconnect_at: float = 0.0
+    backoff: float = RECONNECT_MIN
+    reconnects: int = 0
+
+
+class MqttFleet:
+    def __init__(self, max_queued: int = MAX_QUEUED) -> None:
+        self.max_queued = max_queued
+        self._selector = selectors.DefaultSelector()
+        self._sessions: Dict[mqtt.Client, _Session] = {}
+        self._pending: Deque[Callable[[], None]] = deque()
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._reconnector = ThreadPoolExecutor(max_workers=RECONNECT_THREADS, thread_name_prefix="mqtt-reconnect")
+        self._thread: threading.Thread | None = None
+
+    def connect(self, client: mqtt.Client, host: str, port: int = 1883, keepalive: int = 60) -> mqtt.Client:
+        """Connect ``client`` (blocking, errors propagate) and hand its socket to the fleet loop."""
+        session = _Session(client, current_device())
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_register_write
+        client.on_socket_unregister_write = self._on_unregister_write
+        client.max_queued_messages_set(self.max_queued)
+        with self._lock:
+            self._sessions[client] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mqtt-fleet", daemon=True)
+                self._thread.start()
+        try:
+            client.connect(host, port, keepalive)
+        except Exception:
+            with self._lock:
+                self._sessions.pop(client, None)
+            raise
+        return client
+
+    def disconnect(self, client: mqtt.Client) -> None:
+        """Send DISCONNECT; the loop closes the socket once it is written and forgets the session."""
+        with self._lock:
+            session = self._sessions.get(client)
+            if session is None:
+                return
+            session.closing = True
+            if session.sock is None:
+                del self._sessions[client]
+                return
+        client.disconnect()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "sessions": len(sessions),
+            "connected": sum(1 for session in sessions if session.sock is not None),
+            "reconnects": sum(session.reconnects for session in sessions),
+        }
+
+    # paho socket callbacks; they fire on the fleet thread, a persona thread or a reconnect thread
+
+    def _on_socket_open(self, client: mqtt.Client, _userdata: Any, sock: Any) -> None:
+        self._call(lambda: self._register(client, sock))
+
+    def _on_socket_close(self, client: mqtt.Client, _userdata: Any, sock: Any) -> None:
+        self._call(lambda: self._unregister(client, sock))
+
+    def _on_register_write(self, client: mqtt.Client, _userdata: Any, sock: Any) -> None:
+        self._call(lambda: self._modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE))
+
+    def _on_unregister_write(self, client: mqtt.Client, _userdata: Any, sock: Any) -> None:
+        self._call(lambda: self._modify(sock, selectors.EVENT_READ))
+
+    def _call(self, op: Callable[[], None]) -> None:
+        if threading.current_thread() is self._thread:
+            op()
+            return
+        self._pending.append(op)
+        try:
+            self._wake_w.send(b"\0")
+        except BlockingIOError:
+            pass  # a wake-up is already pending
+
+    # selector bookkeeping, fleet thread only
+
+    def _register(self, client: mqtt.Client, sock: Any) -> None:
+        session = self._sessions.get(client)
+        if session is None or sock.fileno() < 0:
+            return
+        try:
+            self._selector.unregister(sock)  # a stale entry for a reused descriptor
+        except KeyError:
+            pass
+        self._selector.register(sock, selectors.EVENT_READ, session)
+        session.sock = sock
+        session.backoff = RECONNECT_MIN
+
+    def _unregister(self, client: mqtt.Client, sock: Any) -> None:
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        session = self._sessions.get(client)
+        if session is None or (session.sock is not None and session.sock is not sock):
+            return
+        session.sock = None
+        if session.closing:
+            with self._lock:
+                self._sessions.pop(client, None)
+        else:
+            session.reconnect_at = time.monotonic() + session.backoff
+            session.backoff = min(RECONNECT_MAX, session.backoff * 2)
+            with use_device(session.device):
+                json_log("mqtt_connection_lost", retry_in=round(session.reconnect_at - time.monotonic(), 1))
+
+    def _modify(self, sock: Any, events: int) -> None:
+        try:
+            key = self._selector.get_key(sock)
+        except (KeyError, ValueError):
+            return
+        self._selector.modify(sock, events, key.data)
+
+    def _reconnect(self, session: _Session) -> None:
+        with use_device(session.device):
+            try:
+                session.client.reconnect()
+                session.reconnects += 1
+                json_log("mqtt_reconnected", attempt=session.reconnects)
+            except Exception as exc:  # noqa: BLE001
+                session.reconnect_at = time.monotonic() + session.backoff
+                session.backoff = min(RECONNECT_MAX, session.backoff * 2)
+                json_log("mqtt_reconnect_error", error=str(exc))
+            finally:
+                session.reconnecting = False
+
+    def _misc(self, now: float) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            if session.sock is not None:
+                with use_device(session.device):
+                    try:
+                        session.client.loop_misc()
+                    except Exception as exc:  # noqa: BLE001
+                        json_log("mqtt_loop_error", error=str(exc))
+            elif not session.closing and not session.reconnecting and session.reconnect_at <= now:
+                session.reconnecting = True
+                self._reconnector.submit(self._reconnect, session)
+
+    def _run(self) -> None:
+        next_misc = time.monotonic() + MISC_INTERVAL
+        while True:
+            for key, mask in self._selector.select(max(0.0, next_misc - time.monotonic())):
+                session = key.data
+                if session is None:
+                    try:
+                        self._wake_r.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                client = session.client
+                with use_device(session.device):
+                    try:
+                        if mask & selectors.EVENT_READ:
+                            client.loop_read()
+                        if mask & selectors.EVENT_WRITE and session.sock is not None:
+                            client.loop_write()
+                    except Exception as exc:  # noqa: BLE001 - a user callback must not stop the fleet
+                        json_log("mqtt_loop_error", error=str(exc))
+            while self._pending:
+                self._pending.popleft()()
+            now = time.monotonic()
+            if now >= next_misc:
+                self._misc(now)
+                next_misc = now + MISC_INTERVAL
+
+
+MQTT_FLEET = MqttFleet()
@@ -7,81 +7,407 @@ from __future__ import annotations
 
 import argparse
 import json
-import math
+import os
 import random
+import threading
 import time
 import uuid
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterable, Iterator, Sequence
 
+import numpy as np
+
+from devices.common.timeseries import KINDS as SERIES_KINDS, Series, series_from_token
+from devices.common.waveforms import WAVEFORMS, WaveformSpec
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the image
+    orjson = None
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional binary encoding
+    msgpack = None
+try:
+    import cbor2
+except ImportError:  # pragma: no cover - optional binary encoding
+    cbor2 = None
 
 PLACEHOLDER_PREFIX = "{"
+CACHE_SIZE = int(os.environ.get("PAYLOAD_TEMPLATE_CACHE_SIZE", "64"))
+RECHECK_INTERVAL = float(os.environ.get("PAYLOAD_TEMPLATE_RECHECK", "5"))  # seconds between mtime checks
+BATCH_SIZE = int(os.environ.get("PAYLOAD_BATCH_SIZE", "1024"))
+PAYLOAD_ENCODING = os.environ.get("PAYLOAD_ENCODING", "json").lower()  # json, msgpack or cbor
 
+Renderer = Callable[[Dict[str, Any]], Any]
+BatchRenderer = Callable[[Sequence[Dict[str, Any]]], list]
+Encoder = Callable[[Any], bytes]
 
-def _random_choice(values: str) -> str:
-    options = [item.strip() for item in values.split(",") if item.strip()]
-    return random.choice(options)
+_RNG = np.random.default_rng()
 
 
-def _random_waveform(kind: str) -> Dict[str, Any]:
-    length = 20
-    if kind == "sinus":
-        return {
-            "type": "sinus",
-            "samples": [
-                round(math.sin((i / length) * math.tau) * 1.0 + random.uniform(-0.05, 0.05), 3)
-                for i in range(length)
-            ],
-        }
-    if kind == "square":
-        return {
-            "type": "square",
-            "samples": [1 if (i // 5) % 2 == 0 else -1 for i in range(length)],
+def _waveform_spec(args: str) -> tuple[str, WaveformSpec, bool]:
+    """``kind[:sample_rate[:samples]]``; the third item says whether the rate was given explicitly."""
+    kind, *options = args.split(":")
+    spec = WAVEFORMS.spec(
+        kind,
+        sample_rate=float(options[0]) if len(options) > 0 and options[0] else None,
+        samples=int(options[1]) if len(options) > 1 and options[1] else None,
+    )
+    return kind, spec, bool(options)
+
+
+def _compile_waveform(args: str) -> Renderer:
+    """The phase continues per device_id across payloads."""
+    kind, spec, explicit = _waveform_spec(args)
+    if explicit:
+        return lambda context: {
+            **WAVEFORMS.payload(kind, str(context.get("device_id", "")), spec),
+            "sample_rate": spec.sample_rate,
         }
-    return {"type": kind, "samples": [0.0] * length}
+    return lambda context: WAVEFORMS.payload(kind, str(context.get("device_id", "")), spec)
+
+
+def _bounds(token: str, cast: Callable[[str], Any]) -> tuple[Any, Any]:
+    low, high = (cast(bound) for bound in token.split(":", 1)[1].split("-"))
+    return low, high
+
+
+def _options(token: str) -> list[str]:
+    return [item.strip() for item in token.split(":", 1)[1].split(",") if item.strip()]
 
 
-def _render_placeholder(token: str, context: Dict[str, Any]) -> Any:
-    if token == "device_id":
-        return context.get("device_id")
-    if token == "firmware_version":
-        return context.get("firmware_version")
-    if token == "server_ip":
-        return context.get("server_ip")
+def _series(token: str, scope: Dict[str, Series] | None) -> Series | None:
+    """The template's shared Series for a time-series token, so every device's state lives in one array."""
+    if token.partition(":")[0] not in SERIES_KINDS:
+        return None
+    if scope is None:
+        return series_from_token(token)
+    if token not in scope:
+        scope[token] = series_from_token(token)
+    return scope[token]
+
+
+def _compile_placeholder(token: str, scope: Dict[str, Series] | None = None) -> Renderer:
+    """Parse a placeholder once and bind its arguments into a renderer."""
+    series = _series(token, scope)
+    if series is not None:
+        return lambda context: series.next_one(str(context.get("device_id", "")))
     if token == "uptime":
-        return int(time.time() - context.get("start_time", time.time()))
+        return lambda context: int(time.time() - context.get("start_time", time.time()))
     if token == "uuid":
-        return str(uuid.uuid4())
+        return lambda context: str(uuid.uuid4())
     if token.startswith("randint:"):
-        low, high = token.split(":", 1)[1].split("-")
-        return random.randint(int(low), int(high))
+        low, high = _bounds(token, int)
+        return lambda context: random.randint(low, high)
     if token.startswith("randfloat:"):
-        low, high = token.split(":", 1)[1].split("-")
-        return round(random.uniform(float(low), float(high)), 3)
+        low_f, high_f = _bounds(token, float)
+        return lambda context: round(random.uniform(low_f, high_f), 3)
     if token.startswith("choice:"):
-        return _random_choice(token.split(":", 1)[1])
+        options = _options(token)
+        return lambda context: random.choice(options)
     if token.startswith("waveform:"):
-        return _random_waveform(token.split(":", 1)[1])
-    return context.get(token, token)
+        return _compile_waveform(token.split(":", 1)[1])
+    if token in ("device_id", "firmware_version", "server_ip"):
+        return lambda context: context.get(token)
+    return lambda context: context.get(token, token)
 
 
-def _render_value(value: Any, context: Dict[str, Any]) -> Any:
+def _compile_value(value: Any, scope: Dict[str, Series] | None = None) -> Renderer:
     if isinstance(value, str) and value.startswith(PLACEHOLDER_PREFIX) and value.endswith("}"):
-        token = value[1:-1]
-        return _render_placeholder(token, context)
+        return _compile_placeholder(value[1:-1], scope)
     if isinstance(value, list):
-        return [_render_value(item, context) for item in value]
+        items = [_compile_value(item, scope) for item in value]
+        return lambda context: [render(context) for render in items]
     if isinstance(value, dict):
-        return {key: _render_value(val, context) for key, val in value.items()}
-    return value
+        fields = [(key, _compile_value(val, scope)) for key, val in value.items()]
+        return lambda context: {key: render(context) for key, render in fields}
+    return lambda context: value  # JSON scalars are immutable; containers above are rebuilt per render
+
+
+def _uuid_column(count: int) -> list[str]:
+    raw = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    return [str(uuid.UUID(bytes=row.tobytes())) for row in raw]
+
+
+def _compile_batch_waveform(args: str) -> BatchRenderer:
+    kind, spec, explicit = _waveform_spec(args)
+    extra = {"sample_rate": spec.sample_rate} if explicit else {}
+
+    def render(contexts: Sequence[Dict[str, Any]]) -> list[Any]:
+        strips = WAVEFORMS.batch(kind, [str(context.get("device_id", "")) for context in contexts], spec)
+        return [{"type": kind, "samples": samples, **extra} for samples in np.round(strips, 3).tolist()]
+
+    return render
+
+
+def _compile_batch_placeholder(token: str, scope: Dict[str, Series] | None = None) -> BatchRenderer:
+    """Like ``_compile_placeholder`` but renders a column: one value per context, random draws in one block."""
+    series = _series(token, scope)
+    if series is not None:
+        return lambda contexts: series.next([str(context.get("device_id", "")) for context in contexts])
+    if token == "uptime":
+
+        def uptime(contexts: Sequence[Dict[str, Any]]) -> list[Any]:
+            now = time.time()
+            return [int(now - context.get("start_time", now)) for context in contexts]
+
+        return uptime
+    if token == "uuid":
+        return lambda contexts: _uuid_column(len(contexts))
+    if token.startswith("randint:"):
+        low, high = _bounds(token, int)
+        return lambda contexts: _RNG.integers(low, high, len(contexts), endpoint=True).tolist()
+    if token.startswith("randfloat:"):
+        low_f, high_f = _bounds(token, float)
+        return lambda contexts: np.round(_RNG.uniform(low_f, high_f, len(contexts)), 3).tolist()
+    if token.startswith("choice:"):
+        options = _options(token)
+        return lambda contexts: [options[index] for index in _RNG.integers(0, len(options), len(contexts))]
+    if token.startswith("waveform:"):
+        return _compile_batch_waveform(token.split(":", 1)[1])
+    if token in ("device_id", "firmware_version", "server_ip"):
+        return lambda contexts: [context.get(token) for context in contexts]
+    return lambda contexts: [context.get(token, token) for context in contexts]
+
+
+def _compile_batch_value(value: Any, scope: Dict[str, Series] | None = None) -> BatchRenderer:
+    if isinstance(value, str) and value.startswith(PLACEHOLDER_PREFIX) and value.endswith("}"):
+        return _compile_batch_placeholder(value[1:-1], scope)
+    if isinstance(value, list):
+        items = [_compile_batch_value(item, scope) for item in value]
+        if not items:
+            return lambda contexts: [[] for _ in contexts]
+        return lambda contexts: [list(row) for row in zip(*(render(contexts) for render in items))]
+    if isinstance(value, dict):
+        keys = list(value)
+        columns = [_compile_batch_value(val, scope) for val in value.values()]
+        return lambda contexts: _zip_dicts(keys, [render(contexts) for render in columns], len(contexts))
+    return lambda contexts: [value] * len(contexts)
+
+
+def _zip_dicts(keys: list[str], columns: list[list[Any]], count: int) -> list[Dict[str, Any]]:
+    if not keys:
+        return [{} for _ in range(count)]
+    return [dict(zip(keys, row)) for row in zip(*columns)]
+
+
+def encode_payload(payload: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload)
+        except TypeError:  # values orjson rejects (e.g. >64-bit ints) go through json
+            pass
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+_PACKERS = threading.local()
+
+
+def _pack_msgpack(value: Any) -> bytes:
+    # msgpack.packb builds a Packer (and its 256 KiB buffer) per call; keep one per thread instead.
+    packer = getattr(_PACKERS, "packer", None)
+    if packer is None:
+        packer = _PACKERS.packer = msgpack.Packer()
+    return packer.pack(value)
+
+
+CONTENT_TYPES = {"json": "application/json", "msgpack": "application/msgpack", "cbor": "application/cbor"}
+
+
+def encoder(encoding: str) -> Encoder:
+    """JSON always; MessagePack and CBOR when ``msgpack`` / ``cbor2`` are installed."""
+    if encoding == "json":
+        return encode_payload
+    if encoding == "msgpack":
+        if msgpack is None:
+            raise ValueError("PAYLOAD_ENCODING=msgpack needs the msgpack package")
+        return _pack_msgpack
+    if encoding == "cbor":
+        if cbor2 is None:
+            raise ValueError("PAYLOAD_ENCODING=cbor needs the cbor2 package")
+        return cbor2.dumps
+    raise ValueError(f"Unknown payload encoding {encoding}")
+
+
+_DYNAMIC_PREFIXES = ("randint:", "randfloat:", "choice:", "waveform:")
+
+
+def _is_dynamic(token: str) -> bool:
+    return token in ("uptime", "uuid") or token.startswith(_DYNAMIC_PREFIXES) or token.partition(":")[0] in SERIES_KINDS
+
+
+class PayloadFrame:
+    """A payload encoded once for one device, with byte slots for the fields that change per message.
+
+    Context fields (device_id, firmware_version, ...) and literals are encoded
+    when the frame is built. ``render`` encodes only the dynamic placeholders
+    (uptime, uuid, random and waveform fields) and joins them between the
+    static chunks. JSON, MessagePack and CBOR containers are delimited by
+    element counts rather than byte lengths, so the splice is valid for all three.
+    """
+
+    def __init__(
+        self, template: CompiledTemplate, context: Dict[str, Any], encoding: str = PAYLOAD_ENCODING
+    ) -> None:
+        self.template = template
+        self.encoding = encoding
+        self.content_type = CONTENT_TYPES[encoding]
+        self.context = context if "start_time" in context else {**context, "start_time": time.time()}
+        self._encode = encoder(encoding)
+        self.slots: list[Renderer] = []
+        marker = f"\0slot-{uuid.uuid4().hex}-"
+        frame = self._encode(self._freeze(template.template, marker))
+        self.offsets: list[int] = []  # where each slot starts in the static frame
+        self.chunks: list[bytes] = []
+        position = 0
+        for index in range(len(self.slots)):
+            sentinel = self._encode(f"{marker}{index:06d}")
+            offset = frame.index(sentinel, position)
+            self.offsets.append(offset)
+            self.chunks.append(frame[position:offset])
+            position = offset + len(sentinel)
+        self.chunks.append(frame[position:])
+
+    def _freeze(self, value: Any, marker: str) -> Any:
+        if isinstance(value, str) and value.startswith(PLACEHOLDER_PREFIX) and value.endswith("}"):
+            token = value[1:-1]
+            if not _is_dynamic(token):
+                return _compile_placeholder(token)(self.context)
+            self.slots.append(_compile_placeholder(token, self.template.series))
+            return f"{marker}{len(self.slots) - 1:06d}"
+        if isinstance(value, list):
+            return [self._freeze(item, marker) for item in value]
+        if isinstance(value, dict):
+            return {key: self._freeze(val, marker) for key, val in value.items()}
+        return value
+
+    def render(self) -> bytes:
+        parts = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            parts.append(self._encode(slot(self.context)))
+            parts.append(chunk)
+        return b"".join(parts)
+
+
+class CompiledTemplate:
+    """A payload template parsed into a tree of renderers; ``render`` does no I/O or parsing."""
+
+    def __init__(self, template: Dict[str, Any], path: Path | None = None) -> None:
+        self.path = path
+        self.template = template
+        self._batch: BatchRenderer | None = None  # compiled on first batch render
+        self.series: Dict[str, Series] = {}  # time-series state shared by render, render_batch and frames
+        self.fields = [(key, _compile_value(val, self.series)) for key, val in template.items()]
+
+    def render(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        if "start_time" not in context:
+            context = {**context, "start_time": time.time()}
+        return {key: render(context) for key, render in self.fields}
+
+    def render_batch(self, contexts: Sequence[Dict[str, Any]]) -> list[Dict[str, Any]]:
+        """One payload per context; random fields are drawn as NumPy blocks rather than per payload."""
+        if self._batch is None:
+            self._batch = _compile_batch_value(self.template, self.series)
+        return self._batch(contexts)
+
+    def encode_batch(self, contexts: Sequence[Dict[str, Any]]) -> list[bytes]:
+        return [encode_payload(payload) for payload in self.render_batch(contexts)]
+
+    def frame(self, context: Dict[str, Any], encoding: str = PAYLOAD_ENCODING) -> PayloadFrame:
+        return PayloadFrame(self, context, encoding)
+
+
+def compile_template(template_path: Path) -> CompiledTemplate:
+    return CompiledTemplate(json.loads(template_path.read_text()), template_path)
+
+
+class TemplateCache:
+    """LRU of compiled templates keyed by path, recompiled when the file's mtime changes.
+
+    The mtime is checked at most every ``recheck`` seconds per template, so
+    steady-state rendering does not touch the filesystem.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE, recheck: float = RECHECK_INTERVAL) -> None:
+        self.size = max(1, size)
+        self.recheck = recheck
+        self._entries: OrderedDict[str, tuple[int, float, CompiledTemplate]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_path: Path) -> CompiledTemplate:
+        key = str(template_path)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.recheck:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+        mtime = template_path.stat().st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == mtime:
+                self._entries[key] = (mtime, now, entry[2])
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+        compiled = compile_template(template_path)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (mtime, now, compiled)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+TEMPLATES = TemplateCache()
 
 
 def build_payload(template_path: Path, context: Dict[str, Any]) -> Dict[str, Any]:
-    raw = json.loads(template_path.read_text())
-    context = dict(context)
-    context.setdefault("start_time", time.time())
-    rendered = {key: _render_value(val, context) for key, val in raw.items()}
-    return rendered
+    return TEMPLATES.get(template_path).render(context)
+
+
+def build_frame(
+    template_path: Path,
+    context: Dict[str, Any],
+    encoding: str = PAYLOAD_ENCODING,
+    previous: PayloadFrame | None = None,
+) -> PayloadFrame:
+    """Frame for ``context``; ``previous`` is reused while its template file is unchanged."""
+    template = TEMPLATES.get(template_path)
+    if previous is not None and previous.template is template and previous.encoding == encoding:
+        return previous
+    return template.frame(context, encoding)
+
+
+def build_payloads(template_path: Path, contexts: Sequence[Dict[str, Any]]) -> list[Dict[str, Any]]:
+    return TEMPLATES.get(template_path).render_batch(contexts)
+
+
+def stream_payloads(
+    template_path: Path, contexts: Iterable[Dict[str, Any]], batch_size: int = BATCH_SIZE
+) -> Iterator[bytes]:
+    """Encoded payloads for ``contexts``, rendered ``batch_size`` at a time (the iterable may be endless)."""
+    template = TEMPLATES.get(template_path)
+    batch: list[Dict[str, Any]] = []
+    for context in contexts:
+        batch.append(context)
+        if len(batch) >= batch_size:
+            yield from template.encode_batch(batch)
+            batch = []
+    if batch:
+        yield from template.encode_batch(batch)
 
 
 def parse_args() -> argparse.Namespace:
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Stateful per-device time series for telemetry fields.
+
+A ``Series`` keeps one value per device in a NumPy array (devices are mapped
+to slots on first use), so advancing any number of devices is one vectorized
+step. Template placeholders select a series and its bounds, ``kind:low-high``
+with an optional third argument:
+
+    {walk:30.0-55.0[:step]}       bounded random walk, Gaussian steps of ``step``
+    {ar1:55-120[:phi]}            AR(1) around the midpoint, stationary spread ~ range / 6
+    {diurnal:100.0-900.0[:hour]}  daily cosine peaking at ``hour`` (local time) plus noise
+    {drain:35-100[:rate]}         falls by about ``rate`` per message, refills to high at low
+    {step:0-1100[:probability]}   holds a level, jumps to a new one with ``probability``
+
+Integer bounds produce integers; otherwise values are rounded to 3 places.
+Batches step with NumPy; a single device (a per-message render) steps with
+plain floats, since NumPy's per-call overhead dwarfs one-element arrays.
+"""
+
+from __future__ import annotations
+
+import math
+import random
+import re
+import threading
+import time
+from typing import Dict, Sequence
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400.0
+BOUNDS = re.compile(r"(-?[\d.]+)-(-?[\d.]+)")  # either bound may be negative: -10.0-5.0
+
+
+class Series:
+    kind = ""
+
+    def __init__(self, low: float, high: float, option: float | None = None, integer: bool = False) -> None:
+        self.low = low
+        self.high = high
+        self.span = high - low
+        self.integer = integer
+        self.option = self.default_option() if option is None else option
+        self.rng = np.random.default_rng()
+        self.values = np.zeros(0)
+        self.slots: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def default_option(self) -> float:
+        return 0.0
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _grow(self, size: int) -> None:
+        capacity = max(64, len(self.values))
+        while capacity < size:
+            capacity *= 2
+        if capacity > len(self.values):
+            self._resize(capacity)
+
+    def _resize(self, capacity: int) -> None:
+        self.values = np.resize(self.values, capacity)
+
+    def _slots(self, device_ids: Sequence[str]) -> np.ndarray:
+        fresh = [device_id for device_id in dict.fromkeys(device_ids) if device_id not in self.slots]
+        if fresh:
+            first = len(self.slots)
+            self._grow(first + len(fresh))
+            for offset, device_id in enumerate(fresh):
+                self.slots[device_id] = first + offset
+            self._start(np.arange(first, first + len(fresh)))
+        return np.fromiter((self.slots[device_id] for device_id in device_ids), dtype=np.intp, count=len(device_ids))
+
+    def _start(self, slots: np.ndarray) -> None:
+        self.values[slots] = self.rng.uniform(self.low, self.high, len(slots))
+
+    def _step(self, slots: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def _step_one(self, slot: int) -> float:
+        raise NotImplementedError
+
+    def advance(self, device_ids: Sequence[str]) -> np.ndarray:
+        """Move ``device_ids`` one message forward and return their new values."""
+        with self._lock:
+            slots = self._slots(device_ids)
+            self.values[slots] = self._step(slots)
+            return self.values[slots]
+
+    def advance_all(self) -> np.ndarray:
+        with self._lock:
+            count = len(self.slots)
+            self.values[:count] = self._step(np.arange(count))
+            return self.values[:count]
+
+    def advance_one(self, device_id: str) -> float:
+        with self._lock:
+            slot = self.slots.get(device_id)
+            if slot is None:
+                slot = int(self._slots([device_id])[0])
+            value = self._step_one(slot)
+            self.values[slot] = value
+            return value
+
+    def next(self, device_ids: Sequence[str]) -> list:
+        values = self.advance(device_ids)
+        if self.integer:
+            return np.rint(values).astype(np.int64).tolist()
+        return np.round(values, 3).tolist()
+
+    def next_one(self, device_id: str) -> int | float:
+        value = self.advance_one(device_id)
+        return int(round(value)) if self.integer else round(value, 3)
+
+
+class RandomWalk(Series):
+    kind = "walk"
+
+    def default_option(self) -> float:
+        return self.span / 50
+
+    def _step(self, slots: np.ndarray) -> np.ndarray:
+        moved = self.values[slots] + self.rng.normal(0.0, self.option, len(slots))
+        # reflect at the bounds so devices do not pile up on them
+        moved = np.where(moved > self.high, 2 * self.high - moved, moved)
+        moved = np.where(moved < self.low, 2 * self.low - moved, moved)
+        return np.clip(moved, self.low, self.high)
+
+    def _step_one(self, slot: int) -> float:
+        moved = float(self.values[slot]) + random.gauss(0.0, self.option)
+        if moved > self.high:
+            moved = 2 * self.high - moved
+        if moved < self.low:
+            moved = 2 * self.low - moved
+        return min(self.high, max(self.low, moved))
+
+
+class AR1(Series):
+    kind = "ar1"
+
+    def default_option(self) -> float:
+        return 0.9
+
+    @property
+    def mean(self) -> float:
+        return self.low + self.span / 2
+
+    @property
+    def sigma(self) -> float:
+        return self.span / 6 * math.sqrt(1 - self.option**2)
+
+    def _step(self, slots: np.ndarray) -> np.ndarray:
+        mean = self.mean
+        moved = mean + self.option * (self.values[slots] - mean) + self.rng.normal(0.0, self.sigma, len(slots))
+        return np.clip(moved, self.low, self.high)
+
+    def _step_one(self, slot: int) -> float:
+        mean = self.mean
+        moved = mean + self.option * (float(self.values[slot]) - mean) + random.gauss(0.0, self.sigma)
+        return min(self.high, max(self.low, moved))
+
+
+class Diurnal(Series):
+    """``values`` holds the last reading; ``offsets`` shifts each device's day by up to an hour."""
+
+    kind = "diurnal"
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.offsets = np.zeros(0)
+        super().__init__(*args, **kwargs)
+
+    def default_option(self) -> float:
+        return 14.0
+
+    def _resize(self, capacity: int) -> None:
+        super()._resize(capacity)
+        self.offsets = np.resize(self.offsets, capacity)
+
+    def _start(self, slots: np.ndarray) -> None:
+        self.offsets[slots] = self.rng.uniform(-3600.0, 3600.0, len(slots))
+
+    def _step(self, slots: np.ndarray) -> np.ndarray:
+        seconds = (time.time() - time.timezone + self.offsets[slots]) % SECONDS_PER_DAY
+        angle = (seconds / 3600.0 - self.option) / 24.0 * (2 * np.pi)
+        level = self.low + self.span * (1 + np.cos(angle)) / 2
+        return np.clip(level + self.rng.normal(0.0, self.span / 50, len(slots)), self.low, self.high)
+
+    def _step_one(self, slot: int) -> float:
+        seconds = (time.time() - time.timezone + float(self.offsets[slot])) % SECONDS_PER_DAY
+        angle = (seconds / 3600.0 - self.option) / 24.0 * math.tau
+        level = self.low + self.span * (1 + math.cos(angle)) / 2
+        return min(self.high, max(self.low, level + random.gauss(0.0, self.span / 50)))
+
+
+class Drain(Series):
+    kind = "drain"
+
+    def default_option(self) -> float:
+        return self.span / 500
+
+    def _step(self, slots: np.ndarray) -> np.ndarray:
+        drained = self.values[slots] - self.option * self.rng.uniform(0.5, 1.5, len(slots))
+        return np.where(drained <= self.low, self.high, drained)
+
+    def _step_one(self, slot: int) -> float:
+        drained = float(self.values[slot]) - self.option * random.uniform(0.5, 1.5)
+        return self.high if drained <= self.low else drained
+
+
+class Step(Series):
+    kind = "step"
+
+    def default_option(self) -> float:
+        return 0.05
+
+    def _step(self, slots: np.ndarray) -> np.ndarray:
+        jumps = self.rng.random(len(slots)) < self.option
+        return np.where(jumps, self.rng.uniform(self.low, self.high, len(slots)), self.values[slots])
+
+    def _step_one(self, slot: int) -> float:
+        if random.random() < self.option:
+            return random.uniform(self.low, self.high)
+        return float(self.values[slot])
+
+
+KINDS: Dict[str, type[Series]] = {kind.kind: kind for kind in (RandomWalk, AR1, Diurnal, Drain, Step)}
+
+
+def series_from_token(token: str) -> Series | None:
+    """``walk:30.0-55.0[:option]`` (or ``walk:-10.0-5.0``) -> Series, or None when the token names no series kind."""
+    kind, _, args = token.partition(":")
+    series = KINDS.get(kind)
+    if series is None or not args:
+        return None
+    bounds, _, option = args.partition(":")
+    match = BOUNDS.fullmatch(bounds)
+    if match is None:
+        raise ValueError(f"bad time series bounds in {{{token}}}: expected low-high")
+    low, high = match.groups()
+    integer = "." not in bounds
+    return series(float(low), float(high), float(option) if option else None, integer=integer)
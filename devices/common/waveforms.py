@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Vectorized waveform generation for persona telemetry.
+
+Every (device, kind) pair keeps its phase between payloads, so consecutive
+strips join up instead of restarting at zero. Shapes are computed with NumPy
+over a whole strip, and ``batch`` renders the same strip for many devices in
+one call.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, Sequence
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class WaveformSpec:
+    sample_rate: float  # samples per second
+    frequency: float  # cycles per second (heart rate for ecg)
+    samples: int = 20
+    amplitude: float = 1.0
+    noise: float = 0.05  # uniform +/- noise added to every sample
+
+
+DEFAULTS: Dict[str, WaveformSpec] = {
+    "ecg": WaveformSpec(sample_rate=250.0, frequency=1.2, noise=0.02),
+    "sinus": WaveformSpec(sample_rate=20.0, frequency=1.0),
+    "square": WaveformSpec(sample_rate=20.0, frequency=2.0, noise=0.0),
+    "sawtooth": WaveformSpec(sample_rate=20.0, frequency=1.0, noise=0.0),
+    "noise": WaveformSpec(sample_rate=20.0, frequency=0.0, noise=1.0),
+}
+
+# (centre, width, height) of the P, Q, R, S and T waves as fractions of one beat
+_ECG_WAVES = np.array(
+    [
+        (0.20, 0.025, 0.15),
+        (0.37, 0.010, -0.10),
+        (0.40, 0.008, 1.00),
+        (0.43, 0.010, -0.25),
+        (0.65, 0.040, 0.30),
+    ]
+)
+
+
+def _shape(kind: str, phase: np.ndarray) -> np.ndarray:
+    """Noise-free waveform for ``phase`` in cycles (any shape); unknown kinds are flat."""
+    cycle = phase % 1.0
+    if kind == "sinus":
+        return np.sin(cycle * (2 * np.pi))
+    if kind == "square":
+        return np.where(cycle < 0.5, 1.0, -1.0)
+    if kind == "sawtooth":
+        return 2.0 * cycle - 1.0
+    if kind == "ecg":
+        centre, width, height = (_ECG_WAVES[:, column].reshape((-1,) + (1,) * cycle.ndim) for column in range(3))
+        return (height * np.exp(-(((cycle - centre) / width) ** 2) / 2)).sum(axis=0)
+    return np.zeros_like(cycle)
+
+
+class WaveformEngine:
+    def __init__(self, seed: int | None = None) -> None:
+        self._rng = np.random.default_rng(seed)
+        self._phases: Dict[tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def spec(self, kind: str, **overrides: float) -> WaveformSpec:
+        base = DEFAULTS.get(kind, DEFAULTS["sinus"])
+        values = {key: value for key, value in overrides.items() if value is not None}
+        return WaveformSpec(**{**base.__dict__, **values}) if values else base
+
+    def batch(self, kind: str, device_ids: Sequence[str], spec: WaveformSpec | None = None) -> np.ndarray:
+        """One strip per device, shape ``(len(device_ids), spec.samples)``, continuing each device's phase."""
+        spec = spec or self.spec(kind)
+        step = spec.frequency / spec.sample_rate
+        with self._lock:
+            start = np.array([self._phases.get((kind, device_id), 0.0) for device_id in device_ids])
+            for device_id, phase in zip(device_ids, start):
+                self._phases[(kind, device_id)] = (phase + spec.samples * step) % 1.0
+            noise = (
+                self._rng.uniform(-spec.noise, spec.noise, (len(device_ids), spec.samples)) if spec.noise else 0.0
+            )
+        phase = start[:, None] + np.arange(spec.samples) * step
+        return spec.amplitude * _shape(kind, phase) + noise
+
+    def strip(self, kind: str, device_id: str, spec: WaveformSpec | None = None) -> np.ndarray:
+        return self.batch(kind, [device_id], spec)[0]
+
+    def payload(self, kind: str, device_id: str, spec: WaveformSpec | None = None) -> Dict[str, object]:
+        """``{"type", "samples"}`` as embedded in persona payloads (samples rounded to 3 places)."""
+        return {"type": kind, "samples": np.round(self.strip(kind, device_id, spec), 3).tolist()}
+
+    def reset(self, device_ids: Iterable[str] | None = None) -> None:
+        with self._lock:
+            if device_ids is None:
+                self._phases.clear()
+                return
+            targets = set(device_ids)
+            for key in [key for key in self._phases if key[1] in targets]:
+                del self._phases[key]
+
+
+WAVEFORMS = WaveformEngine()
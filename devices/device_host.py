@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Run many emulated devices in one process.
+
+Every device gets its own DeviceContext (id, firmware, MAC, role) built from
+the profiles.yaml catalog and is driven by its persona's ``cycle()`` from a
+single asyncio event loop. Cycles still do blocking protocol I/O, so they run
+on a bounded thread pool with the device's context bound; the loop only keeps
+each device's schedule. Server listeners are not started: a host can bind each
+persona port once, so server-only devices generate no client traffic and every
+device is registered with the hub without protocols for it to probe.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import random
+import signal
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, Iterable, List
+
+import requests
+import yaml
+
+PARENT_DIR = Path(__file__).resolve().parents[1]
+if str(PARENT_DIR) not in sys.path:
+    sys.path.insert(0, str(PARENT_DIR))
+
+from devices.scripts.common import (  # noqa: E402
+    LOG_WRITER,
+    DeviceContext,
+    device_context,
+    env,
+    json_log,
+    size_activity_pool,
+    use_device,
+)
+
+PROFILES_PATH = Path(env("DEVICE_PROFILES", str(Path(__file__).resolve().parent / "profiles.yaml")))
+HOST_THREADS = int(env("DEVICE_HOST_THREADS", "64"))
+RAMP_SECONDS = float(env("DEVICE_HOST_RAMP", "30"))
+STATS_INTERVAL = float(env("DEVICE_HOST_STATS_INTERVAL", "60"))
+ERROR_BACKOFF = float(env("DEVICE_HOST_ERROR_BACKOFF", "30"))
+REGISTER_BATCH = int(env("DEVICE_HOST_REGISTER_BATCH", "500"))
+REGISTER_REFRESH = float(env("HUB_REFRESH_INTERVAL", "60"))
+REGISTER_RETRY = float(env("HUB_RETRY_INTERVAL", "10"))
+HUB_PORT = env("HUB_API_PORT", "7000")
+
+
+@dataclass
+class HostedDevice:
+    context: DeviceContext
+    persona: Dict[str, Any]
+    module: ModuleType
+    state: Dict[str, Any] = field(default_factory=dict)
+    cycles: int = 0
+    errors: int = 0
+    busy_s: float = 0.0
+
+    @property
+    def generates_traffic(self) -> bool:
+        # Personas with listeners only act as clients when their role says so.
+        if not hasattr(self.module, "cycle"):
+            return False
+        return not hasattr(self.module, "start_servers") or self.context.role in {"client", "both"}
+
+
+def load_profiles(path: Path = PROFILES_PATH) -> Dict[str, Dict[str, Any]]:
+    return yaml.safe_load(path.read_text())["personas"]
+
+
+def parse_spec(spec: str) -> List[Dict[str, Any]]:
+    """``CAMERA_RTSP=10,ECG_MQTT=200`` -> fleet groups."""
+    groups = []
+    for item in spec.split(","):
+        if item.strip():
+            device_type, _, count = item.partition("=")
+            groups.append({"device_type": device_type.strip(), "count": int(count or 1)})
+    return groups
+
+
+def load_fleet(path: Path) -> List[Dict[str, Any]]:
+    """Fleet file: ``devices: [{device_type, count, id_prefix?, role?, firmware_version?}]``."""
+    return yaml.safe_load(path.read_text())["devices"]
+
+
+def device_mac(vendor_oui: str, device_id: str) -> str:
+    suffix = hashlib.blake2b(device_id.encode(), digest_size=3).hexdigest().upper()
+    return f"{vendor_oui.upper()}:{suffix[0:2]}:{suffix[2:4]}:{suffix[4:6]}"
+
+
+def build_devices(
+    groups: Iterable[Dict[str, Any]],
+    profiles: Dict[str, Dict[str, Any]],
+    base: DeviceContext,
+) -> List[HostedDevice]:
+    devices = []
+    modules: Dict[str, ModuleType] = {}
+    for group in groups:
+        device_type = group["device_type"]
+        persona = profiles.get(device_type)
+        if persona is None:
+            raise ValueError(f"Unknown DEVICE_TYPE {device_type}")
+        script = Path(persona["script"]).stem
+        if script not in modules:
+            modules[script] = importlib.import_module(f"devices.scripts.{script}")
+        prefix = group.get("id_prefix", f"{device_type.lower()}-")
+        firmware = str(group.get("firmware_version", persona.get("firmware_version", "0.0.0")))
+        for index in range(int(group.get("count", 1))):
+            device_id = f"{prefix}{index:04d}"
+            context = base.derive(
+                device_id=device_id,
+                device_type=device_type,
+                firmware_version=firmware,
+                role=str(group.get("role", persona.get("role", "client"))).lower(),
+                mac=device_mac(persona.get("vendor_oui", "00:11:22"), device_id),
+                vulnerability_profile=persona.get("vulnerability_profile", "none"),
+                payload_template=persona.get("payload_template", ""),
+            )
+            devices.append(HostedDevice(context, persona, modules[script]))
+    return devices
+
+
+def local_ip(hub_ip: str) -> str:
+    """Source address the kernel would use to reach ``hub_ip`` (nothing is sent), or "" if unroutable."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect((hub_ip, int(HUB_PORT)))
+            return sock.getsockname()[0]
+        except OSError:
+            return ""
+
+
+def host_context() -> DeviceContext:
+    """Base context for the fleet; DEVICE_IP is detected here when the entrypoint did not export it."""
+    base = DeviceContext.from_env()
+    return base if base.ip_address else base.derive(ip_address=local_ip(base.hub_ip))
+
+
+def registration(device: HostedDevice) -> Dict[str, Any]:
+    context = device.context
+    return {
+        "device_id": context.device_id,
+        "device_type": context.device_type,
+        "role": context.role,
+        "ip_address": context.ip_address,
+        # No listener is started in this process, so no protocol here would answer a hub probe.
+        "protocols": [],
+        "mac": context.mac,
+        "firmware": context.firmware_version,
+    }
+
+
+class DeviceHost:
+    def __init__(self, devices: List[HostedDevice], threads: int = HOST_THREADS, ramp: float = RAMP_SECONDS) -> None:
+        self.devices = devices
+        self.ramp = ramp
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="device")
+        # Personas with an ActivityScheduler share one activity pool; give each of them room in it.
+        size_activity_pool(
+            sum(1 for device in devices if device.generates_traffic and hasattr(device.module, "activities"))
+        )
+        self.session = requests.Session()
+        self.started = time.monotonic()
+
+    def _cycle(self, device: HostedDevice) -> float:
+        return device.module.cycle(device.state)
+
+    async def run_device(self, device: HostedDevice) -> None:
+        loop = asyncio.get_running_loop()
+        # Bound once per device; its cycles never overlap, so the context is never entered twice at once.
+        ctx = device_context(device.context)
+        await asyncio.sleep(random.uniform(0, self.ramp))
+        while True:
+            start = time.perf_counter()
+            try:
+                delay = await loop.run_in_executor(self.executor, ctx.run, self._cycle, device)
+            except Exception as exc:  # noqa: BLE001
+                device.errors += 1
+                with use_device(device.context):
+                    json_log("device_cycle_error", error=str(exc))
+                delay = ERROR_BACKOFF
+            device.cycles += 1
+            device.busy_s += time.perf_counter() - start
+            await asyncio.sleep(delay)
+
+    def register_all(self) -> bool:
+        url = f"http://{self.devices[0].context.hub_ip}:{HUB_PORT}/register/batch"
+        payloads = [registration(device) for device in self.devices]
+        for offset in range(0, len(payloads), REGISTER_BATCH):
+            batch = payloads[offset : offset + REGISTER_BATCH]
+            try:
+                resp = self.session.post(url, data=json.dumps(batch), timeout=10)
+            except requests.RequestException as exc:
+                json_log("device_host_register_error", error=str(exc))
+                return False
+            if resp.status_code != 200:
+                json_log("device_host_register_error", status=resp.status_code, body=resp.text)
+                return False
+        json_log("device_host_registered", devices=len(payloads))
+        return True
+
+    async def register_loop(self) -> None:
+        while True:
+            ok = await asyncio.to_thread(self.register_all)
+            await asyncio.sleep(REGISTER_REFRESH if ok else REGISTER_RETRY)
+
+    def stats(self) -> Dict[str, Any]:
+        cycles = sum(device.cycles for device in self.devices)
+        busy = sum(device.busy_s for device in self.devices)
+        by_type: Dict[str, int] = {}
+        for device in self.devices:
+            by_type[device.context.device_type] = by_type.get(device.context.device_type, 0) + device.cycles
+        return {
+            "devices": len(self.devices),
+            "active": sum(1 for device in self.devices if device.generates_traffic),
+            "cycles": cycles,
+            "errors": sum(device.errors for device in self.devices),
+            "mean_cycle_ms": round(busy / cycles * 1000, 2) if cycles else None,
+            "uptime_s": round(time.monotonic() - self.started, 1),
+            "cycles_by_type": by_type,
+            "log": LOG_WRITER.stats(),
+        }
+
+    async def stats_loop(self) -> None:
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            json_log("device_host_stats", **self.stats())
+
+    async def run(self, register: bool = True) -> None:
+        json_log("device_host_start", devices=len(self.devices), threads=self.executor._max_workers)
+        tasks = [asyncio.create_task(self.run_device(device)) for device in self.devices if device.generates_traffic]
+        tasks.append(asyncio.create_task(self.stats_loop()))
+        if register and self.devices:
+            tasks.append(asyncio.create_task(self.register_loop()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.close()
+
+    def close(self) -> None:
+        for device in self.devices:
+            close = getattr(device.module, "close", None)
+            if close is not None:
+                with use_device(device.context):
+                    try:
+                        close(device.state)
+                    except Exception as exc:  # noqa: BLE001
+                        json_log("device_close_error", error=str(exc))
+        self.executor.shutdown(wait=False)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Emulate many persona devices in one process.")
+    parser.add_argument("--fleet", default=env("DEVICE_HOST_FLEET"), help="YAML fleet file")
+    parser.add_argument("--spec", default=env("DEVICE_HOST_SPEC"), help="e.g. CAMERA_RTSP=10,ECG_MQTT=200")
+    parser.add_argument("--threads", type=int, default=HOST_THREADS)
+    parser.add_argument("--ramp", type=float, default=RAMP_SECONDS, help="Spread device start-up over N seconds")
+    parser.add_argument("--no-register", action="store_true", help="Skip hub registration")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    groups = load_fleet(Path(args.fleet)) if args.fleet else []
+    groups += parse_spec(args.spec) if args.spec else []
+    if not groups:
+        raise SystemExit("device_host: set --fleet/DEVICE_HOST_FLEET or --spec/DEVICE_HOST_SPEC")
+    devices = build_devices(groups, load_profiles(), host_context())
+    host = DeviceHost(devices, threads=args.threads, ramp=args.ramp)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(host.run(register=not args.no_register))
+    except KeyboardInterrupt:
+        json_log("device_host_shutdown")
+
+
+if __name__ == "__main__":
+    main()
@@ -210,6 +210,20 @@ PY
 : "${DEVICE_ID:=device-$(date +%s)}"
 : "${HUB_IP:=127.0.0.1}"
 : "${SERVER_IP:=${HUB_IP}}"
+
+if [[ -n "${DEVICE_HOST_FLEET:-}${DEVICE_HOST_SPEC:-}" ]]; then
+  # Hosted devices register with this container's address, so detect it before handing over.
+  if [[ -z "${DEVICE_IP:-}" ]]; then
+    DEVICE_IP="$(detect_preferred_ip || true)"
+  fi
+  export DEVICE_IP HUB_IP SERVER_IP
+  log_json "device_host_exec" fleet="${DEVICE_HOST_FLEET:-}" spec="${DEVICE_HOST_SPEC:-}" ip="${DEVICE_IP}"
+  if [[ "${DRY_RUN}" == "true" ]]; then
+    exit 0
+  fi
+  exec python3 /opt/iot/devices/device_host.py
+fi
+
 : "${ENABLE_DHCLIENT:=true}"
 : "${ENABLE_BROADCAST:=true}"
 : "${ENABLE_PAIRING:=true}"
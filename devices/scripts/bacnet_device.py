@@ -2,8 +2,7 @@
 from __future__ import annotations
 
 import json
-import socket
-import time
+from typing import Any, Dict
 
 from pathlib import Path
 import sys
@@ -12,45 +11,45 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, json_log, malicious_ping, pace, run_cycles, send_datagram
 
 
 def send_bacnet(message_type: str) -> None:
+    device = current_device()
     payload = json.dumps(
         {
             "type": message_type,
-            "device_id": DEVICE_ID,
-            "firmware": FIRMWARE_VERSION,
+            "device_id": device.device_id,
+            "firmware": device.firmware_version,
         }
     ).encode()
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    sock.sendto(payload, ("255.255.255.255", 47808))
-    sock.close()
+    send_datagram(payload, ("255.255.255.255", 47808), kind="broadcast")
     json_log("bacnet_message", message=message_type)
 
 
 def directed_request() -> None:
+    device = current_device()
     payload = json.dumps(
         {
             "type": "read-property",
-            "device_id": DEVICE_ID,
+            "device_id": device.device_id,
             "property": "presentValue",
         }
     ).encode()
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.sendto(payload, (SERVER_IP, 47808))
-    sock.close()
+    send_datagram(payload, (device.server_ip, 47808))
     json_log("bacnet_directed")
 
 
+def cycle(state: Dict[str, Any]) -> float:
+    send_bacnet("who-is")
+    send_bacnet("i-am")
+    directed_request()
+    malicious_ping("/bacnet")
+    return pace(30, messages=3)
+
+
 def main() -> None:
-    while True:
-        send_bacnet("who-is")
-        send_bacnet("i-am")
-        directed_request()
-        malicious_ping("/bacnet")
-        time.sleep(jitter(30))
+    run_cycles(cycle)
 
 
 if __name__ == "__main__":
@@ -8,19 +8,19 @@ import threading
 import time
 from datetime import datetime
 from pathlib import Path
+from typing import Any, Dict
 
 PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
 from devices.scripts.common import (  # noqa: E402
-    DEVICE_ID,
-    FIRMWARE_VERSION,
-    SERVER_IP,
+    current_device,
     is_client,
     is_server,
     json_log,
     malicious_ping,
+    run_cycles,
 )
 
 RTSP_SERVER_PORT = int(os.environ.get("RTSP_PORT", "8554"))
@@ -50,32 +50,36 @@ def run_rtsp_server() -> None:
     server.serve_forever()
 
 
-def run_rtsp_client() -> None:
-    target = SERVER_IP
+def cycle(state: Dict[str, Any]) -> float:
+    device = current_device()
+    target = device.server_ip
     message = (
         "OPTIONS rtsp://{0}:{1}/stream/{2} RTSP/1.0\r\n"
         "CSeq: 1\r\n"
         "User-Agent: Camera/{3}\r\n\r\n"
-    ).format(target, RTSP_SERVER_PORT, DEVICE_ID, FIRMWARE_VERSION)
-    while True:
-        try:
-            with socket.create_connection((target, RTSP_SERVER_PORT), timeout=5) as sock:
-                sock.sendall(message.encode())
-                json_log("rtsp_keepalive", status="sent")
-        except Exception as exc:  # noqa: BLE001
-            json_log("rtsp_client_error", error=str(exc))
-        malicious_ping("/camera")
-        time.sleep(15)
+    ).format(target, RTSP_SERVER_PORT, device.device_id, device.firmware_version)
+    try:
+        with socket.create_connection((target, RTSP_SERVER_PORT), timeout=5) as sock:
+            sock.sendall(message.encode())
+            json_log("rtsp_keepalive", status="sent")
+    except Exception as exc:  # noqa: BLE001
+        json_log("rtsp_client_error", error=str(exc))
+    malicious_ping("/camera")
+    return 15.0
+
+
+def start_servers() -> list[threading.Thread]:
+    server_thread = threading.Thread(target=run_rtsp_server, daemon=True)
+    server_thread.start()
+    return [server_thread]
 
 
 def main() -> None:
     threads: list[threading.Thread] = []
     if is_server():
-        server_thread = threading.Thread(target=run_rtsp_server, daemon=True)
-        server_thread.start()
-        threads.append(server_thread)
+        threads.extend(start_servers())
     if is_client():
-        run_rtsp_client()
+        run_cycles(cycle)
     else:
         while True:
             time.sleep(60)
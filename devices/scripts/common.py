@@ -1,17 +1,39 @@
 #!/usr/bin/env python3
 """
 Helper utilities shared across persona device scripts.
+
+Device identity lives in a ``DeviceContext``. A persona container has exactly
+one, built from the environment; ``devices/device_host.py`` runs many devices
+in one process and binds each device's context around its persona calls with
+``use_device``.
 """
 
 from __future__ import annotations
 
+import atexit
+import contextvars
 import json
 import os
 import random
+import signal
 import socket
 import sys
+import threading
 import time
-from typing import Any, Dict
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, TextIO
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:  # optional faster encoder; output is the same JSON schema
+    import orjson
+except ImportError:  # pragma: no cover - depends on the image
+    orjson = None
 
 
 def env(name: str, default: str = "") -> str:
@@ -25,60 +47,778 @@ DEVICE_TYPE = env("DEVICE_TYPE", "UNKNOWN")
 MALICIOUS_MODE = env("MALICIOUS_MODE", "false").lower() == "true"
 ROLE = env("ROLE", "client").lower()
 HUB_IP = env("HUB_IP", SERVER_IP)
+LOG_QUEUE_SIZE = int(env("DEVICE_LOG_QUEUE", "10000"))  # 0 writes every event synchronously
+LOG_FLUSH_INTERVAL = float(env("DEVICE_LOG_FLUSH_INTERVAL", "0.5"))
+LOG_FLUSH_BYTES = int(env("DEVICE_LOG_FLUSH_BYTES", "65536"))
+LOG_SAMPLE = env("DEVICE_LOG_SAMPLE")  # e.g. "modbus_read=0.1,heartbeat=0.25"
+LOG_RATE_LIMIT = env("DEVICE_LOG_RATE_LIMIT")  # events/s[/burst] per device, e.g. "coap_send=0.2/5,*=20"
+LOG_ROLLUP_INTERVAL = float(env("DEVICE_LOG_ROLLUP_INTERVAL", "60"))
+MULTICAST_TTL = int(env("DEVICE_MULTICAST_TTL", "2"))
+DATAGRAM_SNDBUF = int(env("DEVICE_DATAGRAM_SNDBUF", str(1 << 20)))
+HTTP_TIMEOUT = float(env("DEVICE_HTTP_TIMEOUT", "5"))
+HTTP_POOL_HOSTS = int(env("DEVICE_HTTP_POOL_HOSTS", "16"))
+HTTP_POOL_SIZE = int(env("DEVICE_HTTP_POOL_SIZE", "8"))  # keep-alive connections kept per host
+HTTP_POOL_BLOCK = env("DEVICE_HTTP_POOL_BLOCK", "false").lower() == "true"  # make POOL_SIZE a hard cap
+HTTP_CONNECT_RETRIES = int(env("DEVICE_HTTP_CONNECT_RETRIES", "1"))
+HTTP_RETRY_BACKOFF = float(env("DEVICE_HTTP_RETRY_BACKOFF", "0.5"))
+HTTP_FRESH = env("DEVICE_HTTP_FRESH", "false").lower() == "true"  # a new connection for every request
+LOAD_MULTIPLIER = env("DEVICE_LOAD_MULTIPLIER", "1")  # "10" or per persona "ECG_MQTT=50,*=10"
+LOAD_RATE = env("DEVICE_LOAD_RATE")  # messages/s[/burst] for the whole process
+LOAD_DEVICE_RATE = env("DEVICE_LOAD_DEVICE_RATE")  # messages/s[/burst] for each device
+ACTIVITY_THREADS = int(env("DEVICE_ACTIVITY_THREADS", "8"))  # floor; device_host grows it per hosted device
+ACTIVITY_MAX_THREADS = int(env("DEVICE_ACTIVITY_MAX_THREADS", "256"))
+ACTIVITY_PER_DEVICE = int(env("DEVICE_ACTIVITY_PER_DEVICE", "2"))  # pool threads one device may hold at once
+ACTIVITY_STATS_INTERVAL = float(env("DEVICE_ACTIVITY_STATS_INTERVAL", "300"))
+BEACON_PORT = int(env("DEVICE_BEACON_PORT", "8080"))
+BEACON_TIMEOUT = float(env("DEVICE_BEACON_TIMEOUT", "2"))  # connect and status line; the body is never read
+
+
+@dataclass(frozen=True)
+class DeviceContext:
+    device_id: str
+    device_type: str = "UNKNOWN"
+    firmware_version: str = "0.0.0"
+    server_ip: str = "127.0.0.1"
+    hub_ip: str = "127.0.0.1"
+    role: str = "client"
+    malicious_mode: bool = False
+    mac: str = ""
+    ip_address: str = ""
+    vulnerability_profile: str = "none"
+    payload_template: str = ""
+
+    @classmethod
+    def from_env(cls) -> "DeviceContext":
+        return cls(
+            device_id=DEVICE_ID,
+            device_type=DEVICE_TYPE,
+            firmware_version=FIRMWARE_VERSION,
+            server_ip=SERVER_IP,
+            hub_ip=HUB_IP,
+            role=ROLE,
+            malicious_mode=MALICIOUS_MODE,
+            mac=env("MAC_ADDRESS"),
+            ip_address=env("DEVICE_IP"),
+            vulnerability_profile=env("VULNERABILITY_PROFILE", "none"),
+            payload_template=env("PAYLOAD_TEMPLATE"),
+        )
+
+    def derive(self, **changes: Any) -> "DeviceContext":
+        return replace(self, **changes)
+
+
+_device: contextvars.ContextVar[DeviceContext] = contextvars.ContextVar("device", default=DeviceContext.from_env())
+
+
+def current_device() -> DeviceContext:
+    return _device.get()
+
+
+@contextmanager
+def use_device(device: DeviceContext) -> Iterator[DeviceContext]:
+    """Make ``device`` the current device for the calling thread or task."""
+    token = _device.set(device)
+    try:
+        yield device
+    finally:
+        _device.reset(token)
+
+
+def device_context(device: DeviceContext) -> contextvars.Context:
+    """A ``contextvars.Context`` with ``device`` bound, for ``Context.run`` in executor threads."""
+    ctx = contextvars.copy_context()
+    ctx.run(_device.set, device)
+    return ctx
 
 
 def role_is(target: str) -> bool:
-    return ROLE == target
+    return current_device().role == target
 
 
 def is_client() -> bool:
-    return ROLE in {"client", "both"}
+    return current_device().role in {"client", "both"}
 
 
 def is_server() -> bool:
-    return ROLE in {"server", "both"}
+    return current_device().role in {"server", "both"}
 
 
-def json_log(event: str, **fields: Any) -> None:
-    payload: Dict[str, Any] = {
+def encode_json(payload: Dict[str, Any]) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:  # values orjson rejects (e.g. >64-bit ints) go through json
+            pass
+    return json.dumps(payload)
+
+
+class LogWriter:
+    """Bounded buffer of encoded log lines written to stdout in batches.
+
+    A daemon thread writes the buffer every ``flush_interval`` seconds, or
+    sooner once ``flush_bytes`` are pending. When the buffer is full new lines
+    are dropped and counted; the next flush writes a ``log_dropped`` event
+    with the count so gaps are visible downstream.
+    """
+
+    def __init__(
+        self,
+        capacity: int = LOG_QUEUE_SIZE,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        flush_bytes: int = LOG_FLUSH_BYTES,
+        stream: TextIO | None = None,
+    ) -> None:
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self._stream = stream
+        self._lines: Deque[str] = deque()
+        self._pending_bytes = 0
+        self._flush_requested = False
+        self._dropped = 0
+        self.dropped_total = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def write(self, line: str) -> None:
+        if self.capacity <= 0:
+            self._emit([line])
+            return
+        with self._lock:
+            if len(self._lines) >= self.capacity:
+                self._dropped += 1
+                self.dropped_total += 1
+                return
+            self._lines.append(line)
+            self._pending_bytes += len(line) + 1
+            if self._pending_bytes >= self.flush_bytes and not self._flush_requested:
+                self._flush_requested = True
+                self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="json-log", daemon=True)
+                self._thread.start()
+
+    def flush(self) -> None:
+        with self._write_lock:
+            with self._lock:
+                lines = list(self._lines)
+                self._lines.clear()
+                self._pending_bytes = 0
+                self._flush_requested = False
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                lines.append(encode_json(_log_payload("log_dropped", {"dropped": dropped, "capacity": self.capacity})))
+            if lines:
+                self._emit(lines)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": len(self._lines), "written": self.written, "dropped": self.dropped_total}
+
+    def _emit(self, lines: list[str]) -> None:
+        stream = self._stream or sys.stdout
+        stream.write("\n".join(lines) + "\n")
+        stream.flush()
+        self.written += len(lines)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except (OSError, ValueError):  # stdout closed during shutdown
+                return
+
+
+def parse_event_settings(spec: str) -> Dict[str, str]:
+    settings = {}
+    for item in spec.split(","):
+        event, _, value = item.partition("=")
+        if event.strip() and value.strip():
+            settings[event.strip()] = value.strip()
+    return settings
+
+
+def parse_rate(value: str) -> tuple[float, float]:
+    """``"rate[/burst]"`` -> ``(rate, burst)``; the burst defaults to one second of tokens."""
+    rate, _, burst = value.partition("/")
+    return float(rate), float(burst) if burst else max(1.0, float(rate))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens/s up to ``burst``."""
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take ``tokens`` now, going into debt if needed; returns seconds until the debt is repaid."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class LogLimiter:
+    """Per-event-type sampling and token-bucket rate limits for ``json_log``.
+
+    ``sample`` keeps a random ``ratio`` of an event (kept events carry
+    ``sample_rate``); ``rates`` maps an event to ``(per_second, burst)``
+    tokens per device. ``*`` applies to every event without its own entry.
+    ``log_*`` events are never limited. Every ``rollup_interval`` seconds a
+    ``log_suppressed`` event per device reports how many of each event were
+    emitted and suppressed in the window.
+    """
+
+    def __init__(
+        self,
+        sample: Dict[str, float] | None = None,
+        rates: Dict[str, tuple[float, float]] | None = None,
+        rollup_interval: float = LOG_ROLLUP_INTERVAL,
+    ) -> None:
+        self.sample = dict(sample or {})
+        self.rates = dict(rates or {})
+        self.rollup_interval = rollup_interval
+        self.active = bool(self.sample or self.rates)
+        self._buckets: Dict[tuple[str, str], TokenBucket] = {}
+        self._windows: Dict[str, tuple[DeviceContext, Dict[str, list[int]]]] = {}
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "LogLimiter":
+        sample = {event: float(value) for event, value in parse_event_settings(LOG_SAMPLE).items()}
+        rates = {event: parse_rate(value) for event, value in parse_event_settings(LOG_RATE_LIMIT).items()}
+        return cls(sample, rates)
+
+    def admit(self, device: DeviceContext, event: str) -> tuple[bool, float | None]:
+        """``(keep, sample_rate)`` for one event; ``sample_rate`` is set when it was sampled."""
+        if event.startswith("log_"):
+            return True, None
+        ratio = self.sample.get(event, self.sample.get("*"))
+        rate = self.rates.get(event, self.rates.get("*"))
+        if ratio is None and rate is None:
+            return True, None
+        keep = ratio is None or random.random() < ratio
+        with self._lock:
+            if keep and rate is not None:
+                bucket = self._buckets.get((device.device_id, event))
+                if bucket is None:
+                    bucket = self._buckets[(device.device_id, event)] = TokenBucket(*rate)
+                keep = bucket.try_take()
+            _, counts = self._windows.setdefault(device.device_id, (device, {}))
+            counts.setdefault(event, [0, 0])[0 if keep else 1] += 1
+        return keep, ratio if ratio is not None and ratio < 1.0 else None
+
+    def rollup(self, force: bool = False) -> list[Dict[str, Any]]:
+        """``log_suppressed`` payloads for the closed window, or ``[]`` while it is still open."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._window_start < self.rollup_interval:
+                return []
+            windows, self._windows = self._windows, {}
+            window_s = round(now - self._window_start, 1)
+            self._window_start = now
+        payloads = []
+        for device, counts in windows.values():
+            suppressed = {event: dropped for event, (_, dropped) in counts.items() if dropped}
+            if suppressed:
+                emitted = {event: kept for event, (kept, _) in counts.items()}
+                payloads.append(
+                    _log_payload(
+                        "log_suppressed",
+                        {"window_s": window_s, "suppressed": suppressed, "emitted": emitted},
+                        device,
+                    )
+                )
+        return payloads
+
+
+LOG_WRITER = LogWriter()
+LOG_LIMITER = LogLimiter.from_env()
+
+
+def _flush_logs() -> None:
+    for payload in LOG_LIMITER.rollup(force=True):
+        LOG_WRITER.write(encode_json(payload))
+    LOG_WRITER.flush()
+
+
+atexit.register(_flush_logs)
+
+
+def _log_payload(event: str, fields: Dict[str, Any], device: DeviceContext | None = None) -> Dict[str, Any]:
+    device = device or current_device()
+    return {
         "event": event,
         "timestamp": time.time(),
-        "device_id": DEVICE_ID,
-        "device_type": DEVICE_TYPE,
-        "firmware_version": FIRMWARE_VERSION,
+        "device_id": device.device_id,
+        "device_type": device.device_type,
+        "firmware_version": device.firmware_version,
         **fields,
     }
-    print(json.dumps(payload), flush=True)
+
+
+def json_log(event: str, **fields: Any) -> None:
+    if LOG_LIMITER.active:
+        device = current_device()
+        for payload in LOG_LIMITER.rollup():
+            LOG_WRITER.write(encode_json(payload))
+        keep, sample_rate = LOG_LIMITER.admit(device, event)
+        if not keep:
+            return
+        if sample_rate is not None:
+            fields["sample_rate"] = sample_rate
+    LOG_WRITER.write(encode_json(_log_payload(event, fields)))
 
 
 def open_tcp_socket(port: int, timeout: float = 5.0) -> socket.socket:
-    sock = socket.create_connection((SERVER_IP, port), timeout=timeout)
+    sock = socket.create_connection((current_device().server_ip, port), timeout=timeout)
     return sock
 
 
+class DatagramTransport:
+    """Long-lived UDP sockets shared by the datagram personas.
+
+    There is one unconnected socket per ``kind``: ``unicast``, ``broadcast``
+    (SO_BROADCAST set) and ``multicast`` (IP_MULTICAST_TTL set). Sockets are
+    created on first use and reused by every device and thread in the process;
+    a socket that raises is discarded and reopened on the next send.
+    """
+
+    KINDS = ("unicast", "broadcast", "multicast")
+
+    def __init__(self, multicast_ttl: int = MULTICAST_TTL, sndbuf: int = DATAGRAM_SNDBUF) -> None:
+        self.multicast_ttl = multicast_ttl
+        self.sndbuf = sndbuf
+        self._sockets: Dict[str, socket.socket] = {}
+        self._lock = threading.Lock()
+
+    def socket(self, kind: str = "unicast") -> socket.socket:
+        sock = self._sockets.get(kind)
+        if sock is not None:
+            return sock
+        if kind not in self.KINDS:
+            raise ValueError(f"unknown datagram kind {kind}")
+        with self._lock:
+            sock = self._sockets.get(kind)
+            if sock is None:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+                if kind == "broadcast":
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                elif kind == "multicast":
+                    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.multicast_ttl)
+                self._sockets[kind] = sock
+        return sock
+
+    def send(self, payload: bytes, address: tuple[str, int], kind: str = "unicast") -> None:
+        sock = self.socket(kind)
+        try:
+            sock.sendto(payload, address)
+        except OSError:
+            self._discard(kind, sock)
+            raise
+
+    def send_many(self, datagrams: Iterable[tuple[bytes, tuple[str, int]]], kind: str = "unicast") -> int:
+        """Send a batch through one socket without per-datagram setup; returns how many were sent."""
+        sock = self.socket(kind)
+        sendto = sock.sendto
+        sent = 0
+        try:
+            for payload, address in datagrams:
+                sendto(payload, address)
+                sent += 1
+        except OSError:
+            self._discard(kind, sock)
+            raise
+        return sent
+
+    def close(self) -> None:
+        with self._lock:
+            sockets, self._sockets = self._sockets, {}
+        for sock in sockets.values():
+            sock.close()
+
+    def _discard(self, kind: str, sock: socket.socket) -> None:
+        with self._lock:
+            if self._sockets.get(kind) is sock:
+                del self._sockets[kind]
+        sock.close()
+
+
+DATAGRAMS = DatagramTransport()
+
+
+def send_datagram(payload: bytes, address: tuple[str, int], kind: str = "unicast") -> None:
+    DATAGRAMS.send(payload, address, kind)
+
+
 def jitter(base: float, variance: float = 0.2) -> float:
     return max(0.1, random.uniform(base * (1 - variance), base * (1 + variance)))
 
 
-def malicious_ping(endpoint: str = "/beacon") -> None:
-    if not MALICIOUS_MODE:
-        return
+class RateController:
+    """Paces persona cycles for load testing.
+
+    A persona's interval is divided by its load multiplier (per device type,
+    ``*`` for the rest), then held back by a per-device and a process-wide
+    token bucket, each charged ``messages`` per cycle. With multiplier 1 and
+    no rates configured (the default) intervals are returned unchanged.
+    """
+
+    def __init__(
+        self,
+        multipliers: Dict[str, float] | None = None,
+        global_rate: tuple[float, float] | None = None,
+        device_rate: tuple[float, float] | None = None,
+    ) -> None:
+        self.multipliers = dict(multipliers or {})
+        self.global_bucket = TokenBucket(*global_rate) if global_rate else None
+        self.device_rate = device_rate
+        self.active = bool(global_rate or device_rate or any(value != 1.0 for value in self.multipliers.values()))
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RateController":
+        try:
+            multipliers = {"*": float(LOAD_MULTIPLIER)}
+        except ValueError:
+            multipliers = {name: float(value) for name, value in parse_event_settings(LOAD_MULTIPLIER).items()}
+        return cls(
+            multipliers,
+            parse_rate(LOAD_RATE) if LOAD_RATE else None,
+            parse_rate(LOAD_DEVICE_RATE) if LOAD_DEVICE_RATE else None,
+        )
+
+    def multiplier(self, device_type: str) -> float:
+        return self.multipliers.get(device_type, self.multipliers.get("*", 1.0))
+
+    def next_delay(self, interval: float, device: DeviceContext, messages: float = 1.0) -> float:
+        if not self.active:
+            return interval
+        delay = interval / max(self.multiplier(device.device_type), 1e-9)
+        if self.device_rate is not None:
+            bucket = self._buckets.get(device.device_id)
+            if bucket is None:
+                with self._lock:
+                    bucket = self._buckets.setdefault(device.device_id, TokenBucket(*self.device_rate))
+            delay = max(delay, bucket.reserve(messages))
+        if self.global_bucket is not None:
+            delay = max(delay, self.global_bucket.reserve(messages))
+        return delay
+
+
+RATES = RateController.from_env()
+
+
+def pace(base: float, variance: float = 0.2, messages: float = 1.0) -> float:
+    """Delay before a persona's next cycle: ``jitter(base)`` adjusted by load mode.
+
+    ``messages`` is how much traffic one cycle sends, charged to the rate buckets.
+    """
+    return RATES.next_delay(jitter(base, variance), current_device(), messages)
+
+
+@dataclass
+class Activity:
+    """One independent piece of a persona's traffic with its own cadence."""
+
+    name: str
+    run: Callable[[], None]
+    period: float
+    timeout: float = 10.0
+    messages: float = 1.0
+
+
+@dataclass
+class ActivityStats:
+    runs: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    skipped: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_ms: float | None = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "skipped": self.skipped,
+            "mean_ms": round(self.total_ms / self.runs, 2) if self.runs else None,
+            "max_ms": round(self.max_ms, 2),
+            "last_ms": None if self.last_ms is None else round(self.last_ms, 2),
+        }
+
+
+@dataclass
+class _Slot:
+    activity: Activity
+    due: float = 0.0
+    started: float = 0.0
+    future: Future | None = None
+    stats: ActivityStats = field(default_factory=ActivityStats)
+
+
+_activity_pool: ThreadPoolExecutor | None = None
+_activity_pool_lock = threading.Lock()
+
+
+def activity_pool() -> ThreadPoolExecutor:
+    global _activity_pool
+    with _activity_pool_lock:
+        if _activity_pool is None:
+            _activity_pool = ThreadPoolExecutor(max_workers=ACTIVITY_THREADS, thread_name_prefix="activity")
+    return _activity_pool
+
+
+def size_activity_pool(devices: int) -> ThreadPoolExecutor:
+    """Grow the shared pool to ``ACTIVITY_PER_DEVICE`` threads for each of ``devices`` schedulers (capped)."""
+    global _activity_pool
+    workers = min(ACTIVITY_MAX_THREADS, max(ACTIVITY_THREADS, devices * ACTIVITY_PER_DEVICE))
+    with _activity_pool_lock:
+        previous = _activity_pool
+        if previous is None or previous._max_workers < workers:
+            _activity_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="activity")
+            if previous is not None:
+                previous.shutdown(wait=False)  # runs already submitted finish there
+    return _activity_pool
+
+
+class ActivityScheduler:
+    """Runs a persona's activities concurrently, each on its own ``pace(period)``.
+
+    ``tick()`` submits every due activity to a shared thread pool in the
+    caller's device context and returns the seconds until the next one is
+    due, so it fits a persona ``cycle``. An activity never overlaps itself:
+    if it is still running when due again, that run is skipped. So is any
+    run that would give the device more than ``max_running`` pool threads,
+    so a few devices stuck on dead endpoints cannot take the pool shared by
+    every hosted device. Activities running past ``timeout`` are counted
+    and logged once as ``activity_timeout``; the blocking call itself is
+    bounded by the activity's own I/O timeouts. Per-activity timings are
+    logged as ``activity_stats`` every ``stats_interval`` seconds and on close.
+    """
+
+    def __init__(
+        self,
+        activities: Iterable[Activity],
+        executor: ThreadPoolExecutor | None = None,
+        stats_interval: float = ACTIVITY_STATS_INTERVAL,
+        max_running: int = ACTIVITY_PER_DEVICE,
+    ) -> None:
+        self._slots = [_Slot(activity) for activity in activities]
+        self._executor = executor
+        self.max_running = max(1, max_running)
+        self.stats_interval = stats_interval
+        self._stats_due = time.monotonic() + stats_interval
+
+    def tick(self) -> float:
+        now = time.monotonic()
+        active = sum(1 for slot in self._slots if slot.future is not None and not slot.future.done())
+        for slot in self._slots:
+            running = slot.future is not None and not slot.future.done()
+            if running and slot.started and now - slot.started > slot.activity.timeout:
+                slot.stats.timeouts += 1
+                json_log("activity_timeout", activity=slot.activity.name, timeout=slot.activity.timeout)
+                slot.started = 0.0  # count each overrun once
+            if slot.due > now:
+                continue
+            slot.due = now + pace(slot.activity.period, messages=slot.activity.messages)
+            if running or active >= self.max_running:
+                slot.stats.skipped += 1
+                continue
+            active += 1
+            slot.started = now
+            ctx = contextvars.copy_context()
+            slot.future = (self._executor or activity_pool()).submit(ctx.run, self._run, slot)
+        if now >= self._stats_due:
+            self._stats_due = now + self.stats_interval
+            json_log("activity_stats", activities=self.stats())
+        return max(0.0, min(slot.due for slot in self._slots) - now) if self._slots else self.stats_interval
+
+    def _run(self, slot: _Slot) -> None:
+        start = time.perf_counter()
+        try:
+            slot.activity.run()
+        except Exception as exc:  # noqa: BLE001
+            slot.stats.failures += 1
+            json_log("activity_error", activity=slot.activity.name, error=str(exc))
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            slot.stats.runs += 1
+            slot.stats.total_ms += elapsed
+            slot.stats.max_ms = max(slot.stats.max_ms, elapsed)
+            slot.stats.last_ms = elapsed
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {slot.activity.name: slot.stats.snapshot() for slot in self._slots}
+
+    def close(self, timeout: float = 5.0) -> None:
+        deadline = time.monotonic() + timeout
+        for slot in self._slots:
+            if slot.future is not None:
+                try:
+                    slot.future.result(max(0.0, deadline - time.monotonic()))
+                except Exception:  # noqa: BLE001 - already counted, or still running at shutdown
+                    pass
+        json_log("activity_stats", activities=self.stats())
+
+
+class HttpTransport:
+    """Process-wide keep-alive HTTP client for persona traffic.
+
+    One ``requests.Session`` whose adapters keep up to ``pool_size`` idle
+    connections per host (``pool_block`` turns that into a hard cap) and
+    retry failed connects ``connect_retries`` times with ``retry_backoff``.
+    Reads and non-2xx statuses are never retried. ``fresh=True`` sends the
+    request on its own TCP connection with ``Connection: close``, for
+    personas whose traffic should show a handshake per request
+    (``DEVICE_HTTP_FRESH`` does this for every request).
+    """
+
+    def __init__(
+        self,
+        pool_hosts: int = HTTP_POOL_HOSTS,
+        pool_size: int = HTTP_POOL_SIZE,
+        pool_block: bool = HTTP_POOL_BLOCK,
+        connect_retries: int = HTTP_CONNECT_RETRIES,
+        retry_backoff: float = HTTP_RETRY_BACKOFF,
+        timeout: float = HTTP_TIMEOUT,
+        fresh: bool = HTTP_FRESH,
+    ) -> None:
+        self.pool_hosts = pool_hosts
+        self.pool_size = pool_size
+        self.pool_block = pool_block
+        self.retry = Retry(
+            total=None,
+            connect=connect_retries,
+            read=0,
+            status=0,
+            other=0,
+            redirect=5,
+            backoff_factor=retry_backoff,
+            raise_on_status=False,
+        )
+        self.timeout = timeout
+        self.fresh = fresh
+        self._session: requests.Session | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=self.pool_hosts,
+                        pool_maxsize=self.pool_size,
+                        pool_block=self.pool_block,
+                        max_retries=self.retry,
+                    )
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def request(self, method: str, url: str, fresh: bool = False, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        if fresh or self.fresh:
+            # outside the pool, so the request never lands on a kept-alive connection
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), "Connection": "close"}
+            return requests.request(method, url, **kwargs)
+        return self.session.request(method, url, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+
+HTTP = HttpTransport()
+
+
+def http_request(method: str, url: str, fresh: bool = False, **kwargs: Any) -> requests.Response:
+    return HTTP.request(method, url, fresh=fresh, **kwargs)
+
+
+_beacons: Dict[str, Future] = {}
+
+
+def _send_beacon(endpoint: str) -> None:
+    device = current_device()
     try:
-        with open_tcp_socket(8080) as sock:
-            payload = f"POST {endpoint} HTTP/1.1\r\nHost: {SERVER_IP}\r\nContent-Length: 0\r\n\r\n"
-            sock.sendall(payload.encode())
-            json_log("malicious_beacon", endpoint=endpoint, status="sent")
+        resp = http_request(
+            "POST", f"http://{device.server_ip}:{BEACON_PORT}{endpoint}", stream=True, timeout=BEACON_TIMEOUT
+        )
+        resp.close()
+        json_log("malicious_beacon", endpoint=endpoint, status="sent", status_code=resp.status_code)
     except Exception as exc:  # noqa: BLE001
         json_log("malicious_beacon_error", error=str(exc))
 
 
+def malicious_ping(endpoint: str = "/beacon") -> None:
+    """Fire-and-forget beacon: sent from the activity pool, never waited on by the persona cycle.
+
+    A device has at most one beacon in flight; a new one is dropped while the last is still pending.
+    """
+    device = current_device()
+    if not device.malicious_mode:
+        return
+    pending = _beacons.get(device.device_id)
+    if pending is not None and not pending.done():
+        return
+    ctx = contextvars.copy_context()
+    _beacons[device.device_id] = activity_pool().submit(ctx.run, _send_beacon, endpoint)
+
+
+def run_cycles(cycle: Callable[[Dict[str, Any]], float], close: Callable[[Dict[str, Any]], None] | None = None) -> None:
+    """Standalone driver for a persona ``cycle``: call it, sleep what it returns, repeat.
+
+    ``devices/device_host.py`` drives the same functions for many devices at once.
+    """
+    state: Dict[str, Any] = {}
+    # docker stop sends SIGTERM; exit through finally/atexit so close() runs and buffered logs are written
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            time.sleep(cycle(state))
+    finally:
+        if close is not None:
+            close(state)
+
+
 def heartbeat_loop(interval: float):
     """Simple heartbeat generator for scripts that do not implement custom loops."""
     try:
         while True:
             json_log("heartbeat")
             malicious_ping()
-            time.sleep(jitter(interval))
+            time.sleep(pace(interval))
     except KeyboardInterrupt:
         json_log("shutdown")
 
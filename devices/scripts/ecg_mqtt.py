@@ -1,14 +1,13 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import json
 import os
-import time
-from pathlib import Path
+from typing import Any, Dict
 
 import paho.mqtt.client as mqtt
 
-from devices.common.payload_generator import build_payload
+from devices.common.payload_generator import PayloadFrame, build_frame
+from devices.common.mqtt_fleet import MQTT_FLEET
 
 from pathlib import Path
 import sys
@@ -17,7 +16,7 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, json_log, malicious_ping, pace, run_cycles
 
 
 TEMPLATE = Path(
@@ -28,31 +27,46 @@ TEMPLATE = Path(
 )
 
 
-def generate_waveform() -> dict:
-    return build_payload(
-        TEMPLATE,
+def generate_waveform(state: Dict[str, Any]) -> PayloadFrame:
+    """Per-device frame: names and firmware are encoded once, waveform and battery per publish."""
+    device = current_device()
+    state["frame"] = build_frame(
+        Path(device.payload_template) if device.payload_template else TEMPLATE,
         {
-            "device_id": DEVICE_ID,
-            "firmware_version": FIRMWARE_VERSION,
-            "server_ip": SERVER_IP,
+            "device_id": device.device_id,
+            "firmware_version": device.firmware_version,
+            "server_ip": device.server_ip,
         },
+        previous=state.get("frame"),
     )
+    return state["frame"]
+
+
+def connect(state: Dict[str, Any]) -> mqtt.Client:
+    if "mqtt" not in state:
+        device = current_device()
+        client = MQTT_FLEET.connect(mqtt.Client(client_id=f"{device.device_id}-ecg"), device.server_ip)
+        state["mqtt"] = client
+    return state["mqtt"]
+
+
+def cycle(state: Dict[str, Any]) -> float:
+    client = connect(state)
+    frame = generate_waveform(state)
+    client.publish(f"ecg/{current_device().device_id}/telemetry", frame.render())
+    json_log("ecg_publish")
+    malicious_ping("/ecg")
+    return pace(10)
+
+
+def close(state: Dict[str, Any]) -> None:
+    client = state.pop("mqtt", None)
+    if client is not None:
+        MQTT_FLEET.disconnect(client)
 
 
 def main() -> None:
-    client = mqtt.Client(client_id=f"{DEVICE_ID}-ecg")
-    client.connect(SERVER_IP, 1883, keepalive=60)
-    client.loop_start()
-    try:
-        while True:
-            payload = generate_waveform()
-            client.publish(f"ecg/{DEVICE_ID}/telemetry", json.dumps(payload))
-            json_log("ecg_publish")
-            malicious_ping("/ecg")
-            time.sleep(jitter(10))
-    finally:
-        client.loop_stop()
-        client.disconnect()
+    run_cycles(cycle, close)
 
 
 if __name__ == "__main__":
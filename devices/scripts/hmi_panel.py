@@ -1,11 +1,9 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import json
 import os
-import time
+from typing import Any, Dict
 
-import requests
 from pymodbus.client import ModbusTcpClient
 
 from pathlib import Path
@@ -15,7 +13,7 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, http_request, jitter, json_log, malicious_ping, pace, run_cycles
 
 
 MODBUS_PORT = int(os.environ.get("MODBUS_PORT", "1502"))
@@ -23,7 +21,7 @@ MODBUS_PORT = int(os.environ.get("MODBUS_PORT", "1502"))
 
 def http_query() -> None:
     try:
-        resp = requests.get(f"http://{SERVER_IP}/hmi/overview", timeout=5)
+        resp = http_request("GET", f"http://{current_device().server_ip}/hmi/overview")
         json_log("http_query", status=resp.status_code)
     except Exception as exc:  # noqa: BLE001
         json_log("http_error", error=str(exc))
@@ -36,17 +34,23 @@ def modbus_cycle(client: ModbusTcpClient) -> None:
     json_log("modbus_write", register=12)
 
 
+def cycle(state: Dict[str, Any]) -> float:
+    if "modbus" not in state:
+        state["modbus"] = ModbusTcpClient(current_device().server_ip, port=MODBUS_PORT)
+        state["modbus"].connect()
+    http_query()
+    modbus_cycle(state["modbus"])
+    malicious_ping("/hmi")
+    return pace(30)
+
+
+def close(state: Dict[str, Any]) -> None:
+    if "modbus" in state:
+        state.pop("modbus").close()
+
+
 def main() -> None:
-    client = ModbusTcpClient(SERVER_IP, port=MODBUS_PORT)
-    client.connect()
-    try:
-        while True:
-            http_query()
-            modbus_cycle(client)
-            malicious_ping("/hmi")
-            time.sleep(jitter(30))
-    finally:
-        client.close()
+    run_cycles(cycle, close)
 
 
 if __name__ == "__main__":
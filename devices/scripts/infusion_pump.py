@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import json
-import time
+import os
+from typing import Any, Dict
 
 import paho.mqtt.client as mqtt
-import requests
 from pysnmp.hlapi import (
     CommunityData,
     ContextData,
@@ -16,6 +15,9 @@ from pysnmp.hlapi import (
     sendNotification,
 )
 
+from devices.common.mqtt_fleet import MQTT_FLEET
+from devices.common.payload_generator import build_frame
+
 from pathlib import Path
 import sys
 
@@ -23,19 +25,37 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import (
+    Activity,
+    ActivityScheduler,
+    current_device,
+    http_request,
+    jitter,
+    json_log,
+    malicious_ping,
+    run_cycles,
+)
+
+
+TEMPLATE = Path(
+    os.environ.get(
+        "PAYLOAD_TEMPLATE",
+        "devices/common/payload_templates/infusion_pump.json",
+    )
+)
 
 
 def send_snmp_trap() -> None:
+    device = current_device()
     error = sendNotification(
         SnmpEngine(),
         CommunityData("public"),
-        UdpTransportTarget((SERVER_IP, 162)),
+        UdpTransportTarget((device.server_ip, 162)),
         ContextData(),
         "trap",
         NotificationType(ObjectIdentity("1.3.6.1.4.1.4976.10.1")).addVarBinds(
-            ("1.3.6.1.4.1.4976.10.2", DEVICE_ID),
-            ("1.3.6.1.4.1.4976.10.3", FIRMWARE_VERSION),
+            ("1.3.6.1.4.1.4976.10.2", device.device_id),
+            ("1.3.6.1.4.1.4976.10.3", device.firmware_version),
         ),
     )
     if error:
@@ -45,42 +65,68 @@ def send_snmp_trap() -> None:
 
 
 def http_update() -> None:
+    device = current_device()
     payload = {
-        "device_id": DEVICE_ID,
-        "firmware": FIRMWARE_VERSION,
+        "device_id": device.device_id,
+        "firmware": device.firmware_version,
         "rate_ml_hr": round(20 + jitter(5), 2),
     }
     try:
-        resp = requests.post(f"https://{SERVER_IP}/pump/update", json=payload, timeout=5, verify=False)
+        resp = http_request("POST", f"https://{device.server_ip}/pump/update", json=payload, verify=False)
         json_log("http_update", status=resp.status_code)
     except Exception as exc:  # noqa: BLE001
         json_log("http_error", error=str(exc))
 
 
-def mqtt_publish(client: mqtt.Client) -> None:
-    payload = {
-        "device_id": DEVICE_ID,
-        "firmware": FIRMWARE_VERSION,
-        "volume_remaining_ml": round(150 + jitter(20), 2),
-    }
-    client.publish(f"pump/{DEVICE_ID}/telemetry", json.dumps(payload))
+def mqtt_publish(client: mqtt.Client, state: Dict[str, Any]) -> None:
+    device = current_device()
+    state["frame"] = build_frame(
+        Path(device.payload_template) if device.payload_template else TEMPLATE,
+        {
+            "device_id": device.device_id,
+            "firmware_version": device.firmware_version,
+            "server_ip": device.server_ip,
+        },
+        previous=state.get("frame"),
+    )
+    client.publish(f"pump/{device.device_id}/telemetry", state["frame"].render())
     json_log("mqtt_publish")
 
 
+def connect(state: Dict[str, Any]) -> mqtt.Client:
+    if "mqtt" not in state:
+        device = current_device()
+        client = MQTT_FLEET.connect(mqtt.Client(client_id=f"{device.device_id}-pump"), device.server_ip)
+        state["mqtt"] = client
+    return state["mqtt"]
+
+
+def activities(state: Dict[str, Any]) -> list[Activity]:
+    return [
+        Activity("snmp", send_snmp_trap, 30, timeout=8),
+        Activity("https", http_update, 30, timeout=6),
+        Activity("mqtt", lambda: mqtt_publish(connect(state), state), 30, timeout=6),
+        Activity("beacon", lambda: malicious_ping("/pump"), 30, timeout=6),
+    ]
+
+
+def cycle(state: Dict[str, Any]) -> float:
+    if "scheduler" not in state:
+        state["scheduler"] = ActivityScheduler(activities(state))
+    return state["scheduler"].tick()
+
+
+def close(state: Dict[str, Any]) -> None:
+    scheduler = state.pop("scheduler", None)
+    if scheduler is not None:
+        scheduler.close()
+    client = state.pop("mqtt", None)
+    if client is not None:
+        MQTT_FLEET.disconnect(client)
+
+
 def main() -> None:
-    client = mqtt.Client(client_id=f"{DEVICE_ID}-pump")
-    client.connect(SERVER_IP, 1883, keepalive=60)
-    client.loop_start()
-    try:
-        while True:
-            send_snmp_trap()
-            http_update()
-            mqtt_publish(client)
-            malicious_ping("/pump")
-            time.sleep(jitter(30))
-    finally:
-        client.loop_stop()
-        client.disconnect()
+    run_cycles(cycle, close)
 
 
 if __name__ == "__main__":
@@ -2,8 +2,7 @@
 from __future__ import annotations
 
 import random
-import socket
-import time
+from typing import Any, Dict
 
 from pathlib import Path
 import sys
@@ -12,44 +11,44 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, json_log, malicious_ping, pace, run_cycles, send_datagram
 
 
 def send_register(seq: int) -> None:
+    device = current_device()
+    device_id = device.device_id
     message = (
-        f"REGISTER sip:{SERVER_IP} SIP/2.0\r\n"
-        f"Via: SIP/2.0/UDP {DEVICE_ID}.lab;branch=z9hG4bK-{seq}\r\n"
-        f"From: <sip:{DEVICE_ID}@lab>\r\n"
-        f"To: <sip:{DEVICE_ID}@lab>\r\n"
-        f"Call-ID: {DEVICE_ID}-{seq}@lab\r\n"
+        f"REGISTER sip:{device.server_ip} SIP/2.0\r\n"
+        f"Via: SIP/2.0/UDP {device_id}.lab;branch=z9hG4bK-{seq}\r\n"
+        f"From: <sip:{device_id}@lab>\r\n"
+        f"To: <sip:{device_id}@lab>\r\n"
+        f"Call-ID: {device_id}-{seq}@lab\r\n"
         f"CSeq: {seq} REGISTER\r\n"
-        f"Contact: <sip:{DEVICE_ID}@{DEVICE_ID}.lab>\r\n"
-        f"User-Agent: VoipPhone/{FIRMWARE_VERSION}\r\n"
+        f"Contact: <sip:{device_id}@{device_id}.lab>\r\n"
+        f"User-Agent: VoipPhone/{device.firmware_version}\r\n"
         "Max-Forwards: 70\r\n"
         "Content-Length: 0\r\n\r\n"
     )
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.sendto(message.encode(), (SERVER_IP, 5060))
-    sock.close()
+    send_datagram(message.encode(), (device.server_ip, 5060))
     json_log("sip_register", cseq=seq)
 
 
 def send_keepalive() -> None:
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    payload = b"\x80"
-    sock.sendto(payload, (SERVER_IP, random.randint(16384, 16484)))
-    sock.close()
+    send_datagram(b"\x80", (current_device().server_ip, random.randint(16384, 16484)))
     json_log("rtp_keepalive")
 
 
+def cycle(state: Dict[str, Any]) -> float:
+    seq = state.get("seq", 1)
+    send_register(seq)
+    send_keepalive()
+    malicious_ping("/sip")
+    state["seq"] = seq + 1
+    return pace(30, messages=2)
+
+
 def main() -> None:
-    seq = 1
-    while True:
-        send_register(seq)
-        send_keepalive()
-        malicious_ping("/sip")
-        seq += 1
-        time.sleep(jitter(30))
+    run_cycles(cycle)
 
 
 if __name__ == "__main__":
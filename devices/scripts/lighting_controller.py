@@ -2,11 +2,12 @@
 from __future__ import annotations
 
 import json
-import socket
-import time
+from typing import Any, Dict
 
 import paho.mqtt.client as mqtt
 
+from devices.common.mqtt_fleet import MQTT_FLEET
+
 from pathlib import Path
 import sys
 
@@ -14,38 +15,49 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, json_log, malicious_ping, pace, run_cycles, send_datagram
+
+GROUPS = ["zone1", "zone2"]
+STATES = ["on", "off"]
 
 
 def send_coap_command(group: str, state: str) -> None:
-    payload = json.dumps({"group": group, "state": state, "firmware": FIRMWARE_VERSION}).encode()
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.sendto(payload, (SERVER_IP, 5683))
-    sock.close()
+    device = current_device()
+    payload = json.dumps({"group": group, "state": state, "firmware": device.firmware_version}).encode()
+    send_datagram(payload, (device.server_ip, 5683))
     json_log("coap_command", group=group, state=state)
 
 
+def connect(state: Dict[str, Any]) -> mqtt.Client:
+    if "mqtt" not in state:
+        device = current_device()
+        client = MQTT_FLEET.connect(mqtt.Client(client_id=f"{device.device_id}-lighting"), device.server_ip)
+        state["mqtt"] = client
+    return state["mqtt"]
+
+
+def cycle(state: Dict[str, Any]) -> float:
+    client = connect(state)
+    index = state.get("index", 0)
+    group = GROUPS[index % len(GROUPS)]
+    light_state = STATES[index % len(STATES)]
+    message = {"group": group, "state": light_state, "firmware": current_device().firmware_version}
+    client.publish(f"lighting/{group}/command", json.dumps(message))
+    json_log("mqtt_publish", topic=f"lighting/{group}/command", state=light_state)
+    send_coap_command(group, light_state)
+    malicious_ping("/lighting")
+    state["index"] = index + 1
+    return pace(20)
+
+
+def close(state: Dict[str, Any]) -> None:
+    client = state.pop("mqtt", None)
+    if client is not None:
+        MQTT_FLEET.disconnect(client)
+
+
 def main() -> None:
-    client = mqtt.Client(client_id=f"{DEVICE_ID}-lighting")
-    client.connect(SERVER_IP, 1883, keepalive=60)
-    client.loop_start()
-    try:
-        index = 0
-        groups = ["zone1", "zone2"]
-        states = ["on", "off"]
-        while True:
-            group = groups[index % len(groups)]
-            state = states[index % len(states)]
-            message = {"group": group, "state": state, "firmware": FIRMWARE_VERSION}
-            client.publish(f"lighting/{group}/command", json.dumps(message))
-            json_log("mqtt_publish", topic=f"lighting/{group}/command", state=state)
-            send_coap_command(group, state)
-            malicious_ping("/lighting")
-            index += 1
-            time.sleep(jitter(20))
-    finally:
-        client.loop_stop()
-        client.disconnect()
+    run_cycles(cycle, close)
 
 
 if __name__ == "__main__":
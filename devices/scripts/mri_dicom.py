@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import time
+from typing import Any, Dict
 
 from pydicom.dataset import Dataset, FileMetaDataset
 from pynetdicom import AE
@@ -14,17 +14,18 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, json_log, malicious_ping, pace, run_cycles
 
 
 def build_dataset(sequence: int) -> Dataset:
+    device = current_device()
     ds = Dataset()
     ds.PatientName = "MRI^PATIENT"
-    ds.PatientID = DEVICE_ID
+    ds.PatientID = device.device_id
     ds.StudyDescription = "Synthetic MRI Study"
     ds.SeriesDescription = f"Sequence {sequence}"
     ds.Modality = "MR"
-    base_uid = f"1.2.826.0.1.3680043.2.1125.{DEVICE_ID}"
+    base_uid = f"1.2.826.0.1.3680043.2.1125.{device.device_id}"
     ds.StudyInstanceUID = base_uid
     ds.SeriesInstanceUID = f"{base_uid}.{sequence}"
     ds.SOPInstanceUID = f"{base_uid}.{sequence}.1"
@@ -34,14 +35,14 @@ def build_dataset(sequence: int) -> Dataset:
     ds.file_meta.MediaStorageSOPClassUID = MRImageStorage.uid
     ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
     ds.file_meta.ImplementationClassUID = "1.2.826.0.1.3680043.8.498.2"
-    ds.file_meta.ImplementationVersionName = FIRMWARE_VERSION
+    ds.file_meta.ImplementationVersionName = device.firmware_version
     ds.is_little_endian = True
     ds.is_implicit_VR = False
     return ds
 
 
 def send_sequence(ae: AE, sequence: int) -> None:
-    assoc = ae.associate(SERVER_IP, 104)
+    assoc = ae.associate(current_device().server_ip, 104)
     if assoc.is_established:
         status = assoc.send_c_store(build_dataset(sequence))
         json_log("dicom_sequence", sequence=sequence, status=str(status.Status))
@@ -50,16 +51,21 @@ def send_sequence(ae: AE, sequence: int) -> None:
         json_log("dicom_error", sequence=sequence, error="association_failed")
 
 
+def cycle(state: Dict[str, Any]) -> float:
+    ae = state.get("ae")
+    if ae is None:
+        ae = state["ae"] = AE(ae_title=b"MRIDEVICE")
+        ae.add_requested_context(VerificationSOPClass)
+        ae.add_requested_context(MRImageStorage)
+    sequence = state.get("sequence", 1)
+    send_sequence(ae, sequence)
+    malicious_ping("/mri")
+    state["sequence"] = sequence + 1
+    return pace(90)
+
+
 def main() -> None:
-    ae = AE(ae_title=b"MRIDEVICE")
-    ae.add_requested_context(VerificationSOPClass)
-    ae.add_requested_context(MRImageStorage)
-    sequence = 1
-    while True:
-        send_sequence(ae, sequence)
-        malicious_ping("/mri")
-        sequence += 1
-        time.sleep(jitter(90))
+    run_cycles(cycle)
 
 
 if __name__ == "__main__":
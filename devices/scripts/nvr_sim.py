@@ -1,13 +1,11 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import json
 import os
 import socket
-import time
-from pathlib import Path
+from typing import Any, Dict
 
-from devices.common.payload_generator import build_payload
+from devices.common.payload_generator import build_frame
 
 from pathlib import Path
 import sys
@@ -16,7 +14,7 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, http_request, json_log, malicious_ping, pace, run_cycles
 
 
 TEMPLATE = Path(
@@ -29,43 +27,46 @@ TEMPLATE = Path(
 
 def fetch_rtsp_snapshot() -> None:
     try:
-        with socket.create_connection((SERVER_IP, 554), timeout=5) as sock:
+        with socket.create_connection((current_device().server_ip, 554), timeout=5) as sock:
             sock.sendall(b"DESCRIBE rtsp://server/stream RTSP/1.0\r\nCSeq: 1\r\n\r\n")
             json_log("rtsp_describe")
     except Exception as exc:  # noqa: BLE001
         json_log("rtsp_error", error=str(exc))
 
 
-def post_metadata() -> None:
-    payload = build_payload(
-        TEMPLATE,
+def post_metadata(state: Dict[str, Any]) -> None:
+    device = current_device()
+    frame = state["frame"] = build_frame(
+        Path(device.payload_template) if device.payload_template else TEMPLATE,
         {
-            "device_id": DEVICE_ID,
-            "firmware_version": FIRMWARE_VERSION,
-            "server_ip": SERVER_IP,
+            "device_id": device.device_id,
+            "firmware_version": device.firmware_version,
+            "server_ip": device.server_ip,
         },
+        previous=state.get("frame"),
     )
-    body = json.dumps(payload).encode()
+    body = frame.render()
     try:
-        with socket.create_connection((SERVER_IP, 80), timeout=5) as sock:
-            request = (
-                "POST /nvr/metadata HTTP/1.1\r\n"
-                f"Host: {SERVER_IP}\r\n"
-                "Content-Type: application/json\r\n"
-                f"Content-Length: {len(body)}\r\n\r\n"
-            ).encode() + body
-            sock.sendall(request)
-            json_log("metadata_post", size=len(body))
+        resp = http_request(
+            "POST",
+            f"http://{device.server_ip}/nvr/metadata",
+            data=body,
+            headers={"Content-Type": frame.content_type},
+        )
+        json_log("metadata_post", size=len(body), status_code=resp.status_code)
     except Exception as exc:  # noqa: BLE001
         json_log("metadata_error", error=str(exc))
 
 
+def cycle(state: Dict[str, Any]) -> float:
+    fetch_rtsp_snapshot()
+    post_metadata(state)
+    malicious_ping("/nvr")
+    return pace(40, messages=2)
+
+
 def main() -> None:
-    while True:
-        fetch_rtsp_snapshot()
-        post_metadata()
-        malicious_ping("/nvr")
-        time.sleep(jitter(40))
+    run_cycles(cycle)
 
 
 if __name__ == "__main__":
@@ -7,6 +7,7 @@ import sys
 import threading
 import time
 from pathlib import Path
+from typing import Any, Dict
 
 from pymodbus.client import ModbusTcpClient
 
@@ -15,14 +16,14 @@ if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
 from devices.scripts.common import (  # noqa: E402
-    DEVICE_ID,
-    FIRMWARE_VERSION,
-    SERVER_IP,
+    current_device,
     is_client,
     is_server,
     json_log,
     jitter,
     malicious_ping,
+    pace,
+    run_cycles,
 )
 
 MODBUS_PORT = int(os.environ.get("MODBUS_PORT", "1502"))
@@ -47,33 +48,41 @@ def run_modbus_server() -> None:
             break
 
 
-def run_modbus_client() -> None:
-    client = ModbusTcpClient(SERVER_IP, port=MODBUS_PORT)
-    if not client.connect():
-        json_log("modbus_error", error="connect_failed")
-        return
-    try:
-        while True:
-            rr = client.read_holding_registers(0, 10, unit=1)
-            registers = getattr(rr, "registers", "error")
-            json_log("modbus_read", registers=registers)
-            value = random.randint(0, 4095)
-            client.write_register(5, value, unit=1)
-            json_log("modbus_write", register=5, value=value)
-            malicious_ping("/plc")
-            time.sleep(jitter(20))
-    finally:
-        client.close()
+def cycle(state: Dict[str, Any]) -> float:
+    client = state.get("modbus")
+    if client is None:
+        client = ModbusTcpClient(current_device().server_ip, port=MODBUS_PORT)
+        if not client.connect():
+            json_log("modbus_error", error="connect_failed")
+            return jitter(20)
+        state["modbus"] = client
+    rr = client.read_holding_registers(0, 10, unit=1)
+    registers = getattr(rr, "registers", "error")
+    json_log("modbus_read", registers=registers)
+    value = random.randint(0, 4095)
+    client.write_register(5, value, unit=1)
+    json_log("modbus_write", register=5, value=value)
+    malicious_ping("/plc")
+    return pace(20)
+
+
+def close(state: Dict[str, Any]) -> None:
+    if "modbus" in state:
+        state.pop("modbus").close()
+
+
+def start_servers() -> list[threading.Thread]:
+    server_thread = threading.Thread(target=run_modbus_server, daemon=True)
+    server_thread.start()
+    return [server_thread]
 
 
 def main() -> None:
     workers: list[threading.Thread] = []
     if is_server():
-        server_thread = threading.Thread(target=run_modbus_server, daemon=True)
-        server_thread.start()
-        workers.append(server_thread)
+        workers.extend(start_servers())
     if is_client():
-        run_modbus_client()
+        run_cycles(cycle, close)
     else:
         while True:
             time.sleep(60)
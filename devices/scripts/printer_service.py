@@ -105,12 +105,7 @@ def run_snmp_server() -> None:
         snmp_engine.transportDispatcher.closeDispatcher()
 
 
-def main() -> None:
-    if not is_server():
-        json_log("printer_role_skip", reason="not_server")
-        while True:
-            time.sleep(60)
-
+def start_servers() -> list[threading.Thread]:
     threads = []
     ipp_thread = threading.Thread(target=run_ipp_server, daemon=True)
     ipp_thread.start()
@@ -119,7 +114,16 @@ def main() -> None:
     snmp_thread = threading.Thread(target=run_snmp_server, daemon=True)
     snmp_thread.start()
     threads.append(snmp_thread)
+    return threads
+
+
+def main() -> None:
+    if not is_server():
+        json_log("printer_role_skip", reason="not_server")
+        while True:
+            time.sleep(60)
 
+    start_servers()
     while True:
         time.sleep(60)
 
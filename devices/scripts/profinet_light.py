@@ -2,8 +2,7 @@
 from __future__ import annotations
 
 import json
-import socket
-import time
+from typing import Any, Dict
 
 from pathlib import Path
 import sys
@@ -12,31 +11,32 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, json_log, malicious_ping, pace, run_cycles, send_datagram
 
 
 def send_beacon(state: str) -> None:
+    device = current_device()
     payload = json.dumps(
         {
-            "device_id": DEVICE_ID,
-            "firmware": FIRMWARE_VERSION,
+            "device_id": device.device_id,
+            "firmware": device.firmware_version,
             "state": state,
         }
     ).encode()
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    sock.sendto(payload, ("255.255.255.255", 34964))
-    sock.close()
+    send_datagram(payload, ("255.255.255.255", 34964), kind="broadcast")
     json_log("profinet_beacon", state=state)
 
 
+def cycle(state: Dict[str, Any]) -> float:
+    beacon_state = state.get("state", "ready")
+    send_beacon(beacon_state)
+    malicious_ping("/profinet")
+    state["state"] = "standby" if beacon_state == "ready" else "ready"
+    return pace(25)
+
+
 def main() -> None:
-    state = "ready"
-    while True:
-        send_beacon(state)
-        malicious_ping("/profinet")
-        state = "standby" if state == "ready" else "ready"
-        time.sleep(jitter(25))
+    run_cycles(cycle)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import time
+from typing import Any, Dict
 
-import requests
 from pysnmp.hlapi import (
     CommunityData,
     ContextData,
@@ -21,19 +20,20 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, http_request, json_log, malicious_ping, pace, run_cycles
 
 
 def send_snmp_trap() -> None:
+    device = current_device()
     error_indication = sendNotification(
         SnmpEngine(),
         CommunityData("public"),
-        UdpTransportTarget((SERVER_IP, 162)),
+        UdpTransportTarget((device.server_ip, 162)),
         ContextData(),
         "trap",
         NotificationType(ObjectIdentity("1.3.6.1.4.1.32473.1.0")).addVarBinds(
-            ("1.3.6.1.4.1.32473.1.1.1", DEVICE_ID),
-            ("1.3.6.1.4.1.32473.1.1.2", FIRMWARE_VERSION),
+            ("1.3.6.1.4.1.32473.1.1.1", device.device_id),
+            ("1.3.6.1.4.1.32473.1.1.2", device.firmware_version),
         ),
     )
     if error_indication:
@@ -44,18 +44,21 @@ def send_snmp_trap() -> None:
 
 def http_config_check() -> None:
     try:
-        resp = requests.get(f"http://{SERVER_IP}/projector/config", timeout=5)
+        resp = http_request("GET", f"http://{current_device().server_ip}/projector/config")
         json_log("http_config", status=resp.status_code)
     except Exception as exc:  # noqa: BLE001
         json_log("http_error", error=str(exc))
 
 
+def cycle(state: Dict[str, Any]) -> float:
+    send_snmp_trap()
+    http_config_check()
+    malicious_ping("/projector")
+    return pace(45)
+
+
 def main() -> None:
-    while True:
-        send_snmp_trap()
-        http_config_check()
-        malicious_ping("/projector")
-        time.sleep(jitter(45))
+    run_cycles(cycle)
 
 
 if __name__ == "__main__":
@@ -3,11 +3,14 @@ from __future__ import annotations
 
 import json
 import os
-import time
+from typing import Any, Dict
 
 import paho.mqtt.client as mqtt
 from pymodbus.client import ModbusTcpClient
 
+from devices.common.mqtt_fleet import MQTT_FLEET
+from devices.common.payload_generator import build_payload
+
 from pathlib import Path
 import sys
 
@@ -15,35 +18,58 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, json_log, malicious_ping, pace, run_cycles
 
 
 MODBUS_PORT = int(os.environ.get("MODBUS_PORT", "1502"))
+TEMPLATE = Path(
+    os.environ.get(
+        "PAYLOAD_TEMPLATE",
+        "devices/common/payload_templates/scada_sensor.json",
+    )
+)
+
+
+def connect(state: Dict[str, Any]) -> tuple[mqtt.Client, ModbusTcpClient]:
+    device = current_device()
+    if "mqtt" not in state:
+        state["mqtt"] = MQTT_FLEET.connect(mqtt.Client(client_id=f"{device.device_id}-sensor"), device.server_ip)
+    if "modbus" not in state:
+        modbus_client = ModbusTcpClient(device.server_ip, port=MODBUS_PORT)
+        modbus_client.connect()
+        state["modbus"] = modbus_client
+    return state["mqtt"], state["modbus"]
+
+
+def cycle(state: Dict[str, Any]) -> float:
+    mqtt_client, modbus_client = connect(state)
+    registers = modbus_client.read_input_registers(0, 4, unit=2)
+    device = current_device()
+    telemetry = build_payload(
+        Path(device.payload_template) if device.payload_template else TEMPLATE,
+        {
+            "device_id": device.device_id,
+            "firmware_version": device.firmware_version,
+            "server_ip": device.server_ip,
+        },
+    )
+    telemetry["registers"] = registers.registers if registers else []
+    mqtt_client.publish(f"scada/{device.device_id}/telemetry", json.dumps(telemetry))
+    json_log("scada_publish")
+    malicious_ping("/scada")
+    return pace(35)
+
+
+def close(state: Dict[str, Any]) -> None:
+    if "modbus" in state:
+        state.pop("modbus").close()
+    mqtt_client = state.pop("mqtt", None)
+    if mqtt_client is not None:
+        MQTT_FLEET.disconnect(mqtt_client)
 
 
 def main() -> None:
-    mqtt_client = mqtt.Client(client_id=f"{DEVICE_ID}-sensor")
-    mqtt_client.connect(SERVER_IP, 1883, keepalive=60)
-    mqtt_client.loop_start()
-    modbus_client = ModbusTcpClient(SERVER_IP, port=MODBUS_PORT)
-    modbus_client.connect()
-    try:
-        while True:
-            registers = modbus_client.read_input_registers(0, 4, unit=2)
-            telemetry = {
-                "lux": round(400 + jitter(50), 2),
-                "vibration": round(0.3 + jitter(0.1) - 0.1, 3),
-                "firmware": FIRMWARE_VERSION,
-                "registers": registers.registers if registers else [],
-            }
-            mqtt_client.publish(f"scada/{DEVICE_ID}/telemetry", json.dumps(telemetry))
-            json_log("scada_publish")
-            malicious_ping("/scada")
-            time.sleep(jitter(35))
-    finally:
-        modbus_client.close()
-        mqtt_client.loop_stop()
-        mqtt_client.disconnect()
+    run_cycles(cycle, close)
 
 
 if __name__ == "__main__":
@@ -2,8 +2,10 @@
 from __future__ import annotations
 
 import json
-import socket
-import time
+import os
+from typing import Any, Dict
+
+from devices.common.payload_generator import build_payload
 
 from pathlib import Path
 import sys
@@ -12,32 +14,50 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, json_log, malicious_ping, pace, run_cycles, send_datagram
+
+
+TEMPLATE = Path(
+    os.environ.get(
+        "PAYLOAD_TEMPLATE",
+        "devices/common/payload_templates/smart_plug_coap.json",
+    )
+)
 
 
 def send_coap(method: str, path: str, payload: bytes | None = None) -> None:
+    device = current_device()
     message = {
         "method": method,
         "path": path,
-        "device": DEVICE_ID,
-        "firmware": FIRMWARE_VERSION,
+        "device": device.device_id,
+        "firmware": device.firmware_version,
     }
     if payload:
         message["payload"] = payload.decode(errors="ignore")
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.sendto(json.dumps(message).encode(), (SERVER_IP, 5683))
-    sock.close()
+    send_datagram(json.dumps(message).encode(), (device.server_ip, 5683))
     json_log("coap_send", method=method, path=path)
 
 
+def cycle(state: Dict[str, Any]) -> float:
+    state["on"] = not state.get("on", False)
+    device = current_device()
+    report = build_payload(
+        Path(device.payload_template) if device.payload_template else TEMPLATE,
+        {
+            "device_id": device.device_id,
+            "firmware_version": device.firmware_version,
+            "server_ip": device.server_ip,
+        },
+    )
+    report["payload"]["state"] = "on" if state["on"] else "off"  # the plug toggles; the template only draws watts
+    send_coap("PUT", "/device/state", json.dumps(report).encode())
+    malicious_ping("/coap")
+    return pace(25)
+
+
 def main() -> None:
-    state = False
-    while True:
-        state = not state
-        payload = json.dumps({"state": "on" if state else "off", "firmware": FIRMWARE_VERSION}).encode()
-        send_coap("PUT", "/device/state", payload)
-        malicious_ping("/coap")
-        time.sleep(jitter(25))
+    run_cycles(cycle)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import os
-import time
+from typing import Any, Dict
 
 import paho.mqtt.client as mqtt
 
 from devices.common.vulnerability_toggles import get_profile
 from devices.common.vuln_injector import mutate_mqtt_client_id
+from devices.common.mqtt_fleet import MQTT_FLEET
 
 from pathlib import Path
 import sys
@@ -16,46 +16,69 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import (  # noqa: E402
+    DeviceContext,
+    current_device,
+    json_log,
+    malicious_ping,
+    pace,
+    run_cycles,
+    use_device,
+)
 
 
-PROFILE = get_profile(os.environ.get("VULNERABILITY_PROFILE", "none"))
-TOPIC_BASE = f"speaker/{DEVICE_ID}"
+def topic_base() -> str:
+    return f"speaker/{current_device().device_id}"
 
 
-def on_message(_client, _userdata, msg):  # noqa: ANN001
-    json_log("mqtt_message", topic=msg.topic, payload=msg.payload.decode(errors="ignore"))
+def on_message(_client, userdata: DeviceContext, msg):  # noqa: ANN001
+    # callbacks run on the MQTT fleet thread, outside the device's context
+    with use_device(userdata):
+        json_log("mqtt_message", topic=msg.topic, payload=msg.payload.decode(errors="ignore"))
 
 
 def build_client() -> mqtt.Client:
-    client_id = mutate_mqtt_client_id(f"{DEVICE_ID}-speaker", PROFILE, FIRMWARE_VERSION)
-    client = mqtt.Client(client_id=client_id, clean_session=True)
-    if PROFILE.weak_tls:
+    device = current_device()
+    profile = get_profile(device.vulnerability_profile)
+    client_id = mutate_mqtt_client_id(f"{device.device_id}-speaker", profile, device.firmware_version)
+    client = mqtt.Client(client_id=client_id, clean_session=True, userdata=device)
+    if profile.weak_tls:
         client.tls_set()
         client.tls_insecure_set(True)
     client.on_message = on_message
     return client
 
 
+def connect(state: Dict[str, Any]) -> mqtt.Client:
+    if "mqtt" not in state:
+        client = MQTT_FLEET.connect(build_client(), current_device().server_ip)
+        client.subscribe(f"{topic_base()}/command")
+        state["mqtt"] = client
+    return state["mqtt"]
+
+
+def cycle(state: Dict[str, Any]) -> float:
+    client = connect(state)
+    device = current_device()
+    payload = {
+        "device_id": device.device_id,
+        "firmware": device.firmware_version,
+        "volume": 35,
+    }
+    client.publish(f"{topic_base()}/telemetry", payload=str(payload), qos=0)
+    json_log("mqtt_publish", topic=f"{topic_base()}/telemetry")
+    malicious_ping("/speaker")
+    return pace(20)
+
+
+def close(state: Dict[str, Any]) -> None:
+    client = state.pop("mqtt", None)
+    if client is not None:
+        MQTT_FLEET.disconnect(client)
+
+
 def main() -> None:
-    client = build_client()
-    client.connect(SERVER_IP, 1883, keepalive=60)
-    client.loop_start()
-    client.subscribe(f"{TOPIC_BASE}/command")
-    try:
-        while True:
-            payload = {
-                "device_id": DEVICE_ID,
-                "firmware": FIRMWARE_VERSION,
-                "volume": 35,
-            }
-            client.publish(f"{TOPIC_BASE}/telemetry", payload=str(payload), qos=0)
-            json_log("mqtt_publish", topic=f"{TOPIC_BASE}/telemetry")
-            malicious_ping("/speaker")
-            time.sleep(jitter(20))
-    finally:
-        client.loop_stop()
-        client.disconnect()
+    run_cycles(cycle, close)
 
 
 if __name__ == "__main__":
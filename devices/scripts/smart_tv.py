@@ -1,12 +1,9 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import os
 import socket
 import ssl
-import time
-
-import requests
+from typing import Any, Dict
 
 from devices.common.vulnerability_toggles import get_profile
 from devices.common.vuln_injector import apply_http_headers, legacy_cipher_suite
@@ -18,10 +15,16 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
-
-
-PROFILE = get_profile(os.environ.get("VULNERABILITY_PROFILE", "none"))
+from devices.scripts.common import (
+    Activity,
+    ActivityScheduler,
+    current_device,
+    http_request,
+    json_log,
+    malicious_ping,
+    run_cycles,
+    send_datagram,
+)
 
 
 def send_ssdp() -> None:
@@ -32,51 +35,69 @@ def send_ssdp() -> None:
         "MX: 2\r\n"
         "ST: urn:schemas-upnp-org:device:SmartTV:1\r\n\r\n"
     )
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-    sock.sendto(message.encode(), ("239.255.255.250", 1900))
-    sock.close()
+    send_datagram(message.encode(), ("239.255.255.250", 1900), kind="multicast")
     json_log("ssdp_discover")
 
 
 def http_interactions() -> None:
-    headers = apply_http_headers({"User-Agent": f"SmartTV/{FIRMWARE_VERSION}"}, PROFILE, FIRMWARE_VERSION)
+    device = current_device()
+    profile = get_profile(device.vulnerability_profile)
+    headers = apply_http_headers(
+        {"User-Agent": f"SmartTV/{device.firmware_version}"}, profile, device.firmware_version
+    )
     try:
-        resp = requests.get(f"http://{SERVER_IP}/status/tv", headers=headers, timeout=5)
+        resp = http_request("GET", f"http://{device.server_ip}/status/tv", headers=headers)
         json_log("http_status", status_code=resp.status_code)
     except Exception as exc:  # noqa: BLE001
         json_log("http_error", error=str(exc))
 
     try:
-        resp = requests.get(f"https://{SERVER_IP}/status/tv", headers=headers, timeout=5, verify=False)
+        resp = http_request("GET", f"https://{device.server_ip}/status/tv", headers=headers, verify=False)
         json_log("https_status", status_code=resp.status_code, verify="false")
     except Exception as exc:  # noqa: BLE001
         json_log("https_error", error=str(exc))
 
 
-def tls_handshake() -> None:
-    cipher = legacy_cipher_suite(PROFILE)
+def tls_handshake(timeout: float = 5.0) -> None:
+    device = current_device()
+    cipher = legacy_cipher_suite(get_profile(device.vulnerability_profile))
     context = ssl.create_default_context()
     if cipher:
         context.set_ciphers(cipher)
     context.check_hostname = False
     context.verify_mode = ssl.CERT_NONE
     try:
-        with socket.create_connection((SERVER_IP, 443), timeout=5) as sock:
-            with context.wrap_socket(sock, server_hostname=SERVER_IP) as tls_sock:
+        with socket.create_connection((device.server_ip, 443), timeout=timeout) as sock:
+            with context.wrap_socket(sock, server_hostname=device.server_ip) as tls_sock:
                 tls_sock.send(b"HEAD /status HTTP/1.1\r\nHost: server\r\n\r\n")
                 json_log("tls_handshake", cipher=tls_sock.cipher())
     except Exception as exc:  # noqa: BLE001
         json_log("tls_error", error=str(exc))
 
 
+def activities() -> list[Activity]:
+    return [
+        Activity("ssdp", send_ssdp, 25, timeout=1),
+        Activity("http", http_interactions, 25, timeout=12, messages=2),
+        Activity("tls", tls_handshake, 25, timeout=6),
+        Activity("beacon", lambda: malicious_ping("/tv"), 25, timeout=6),
+    ]
+
+
+def cycle(state: Dict[str, Any]) -> float:
+    if "scheduler" not in state:
+        state["scheduler"] = ActivityScheduler(activities())
+    return state["scheduler"].tick()
+
+
+def close(state: Dict[str, Any]) -> None:
+    scheduler = state.pop("scheduler", None)
+    if scheduler is not None:
+        scheduler.close()
+
+
 def main() -> None:
-    while True:
-        send_ssdp()
-        http_interactions()
-        tls_handshake()
-        malicious_ping("/tv")
-        time.sleep(jitter(25))
+    run_cycles(cycle, close)
 
 
 if __name__ == "__main__":
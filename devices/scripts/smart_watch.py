@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import time
+import os
+from typing import Any, Dict
 
-import requests
+from devices.common.payload_generator import build_frame
 
 from pathlib import Path
 import sys
@@ -12,21 +13,34 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, http_request, json_log, malicious_ping, pace, run_cycles
 
 
-def push_metrics() -> None:
-    payload = {
-        "device_id": DEVICE_ID,
-        "firmware": FIRMWARE_VERSION,
-        "steps": int(5000 + jitter(1000)),
-        "heart_rate": 70 + int(jitter(10)),
-    }
+TEMPLATE = Path(
+    os.environ.get(
+        "PAYLOAD_TEMPLATE",
+        "devices/common/payload_templates/smart_watch.json",
+    )
+)
+
+
+def push_metrics(state: Dict[str, Any]) -> None:
+    device = current_device()
+    frame = state["frame"] = build_frame(
+        Path(device.payload_template) if device.payload_template else TEMPLATE,
+        {
+            "device_id": device.device_id,
+            "firmware_version": device.firmware_version,
+            "server_ip": device.server_ip,
+        },
+        previous=state.get("frame"),
+    )
     try:
-        resp = requests.post(
-            f"https://{SERVER_IP}/wearable/metrics",
-            json=payload,
-            timeout=5,
+        resp = http_request(
+            "POST",
+            f"https://{device.server_ip}/wearable/metrics",
+            data=frame.render(),
+            headers={"Content-Type": frame.content_type},
             verify=False,
         )
         json_log("https_metrics", status=resp.status_code)
@@ -34,11 +48,14 @@ def push_metrics() -> None:
         json_log("https_error", error=str(exc))
 
 
+def cycle(state: Dict[str, Any]) -> float:
+    push_metrics(state)
+    malicious_ping("/watch")
+    return pace(15)
+
+
 def main() -> None:
-    while True:
-        push_metrics()
-        malicious_ping("/watch")
-        time.sleep(jitter(15))
+    run_cycles(cycle)
 
 
 if __name__ == "__main__":
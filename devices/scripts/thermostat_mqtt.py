@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import json
-import time
+import os
+from typing import Any, Dict
 
 import paho.mqtt.client as mqtt
 
+from devices.common.mqtt_fleet import MQTT_FLEET
+from devices.common.payload_generator import PayloadFrame, build_frame
+
 from pathlib import Path
 import sys
 
@@ -13,28 +16,56 @@ PARENT_DIR = Path(__file__).resolve().parents[2]
 if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
-from devices.scripts.common import DEVICE_ID, FIRMWARE_VERSION, SERVER_IP, json_log, jitter, malicious_ping
+from devices.scripts.common import current_device, json_log, malicious_ping, pace, run_cycles
+
+
+TEMPLATE = Path(
+    os.environ.get(
+        "PAYLOAD_TEMPLATE",
+        "devices/common/payload_templates/thermostat_mqtt.json",
+    )
+)
+
+
+def telemetry(state: Dict[str, Any]) -> PayloadFrame:
+    device = current_device()
+    state["frame"] = build_frame(
+        Path(device.payload_template) if device.payload_template else TEMPLATE,
+        {
+            "device_id": device.device_id,
+            "firmware_version": device.firmware_version,
+            "server_ip": device.server_ip,
+        },
+        previous=state.get("frame"),
+    )
+    return state["frame"]
+
+
+def connect(state: Dict[str, Any]) -> mqtt.Client:
+    if "mqtt" not in state:
+        device = current_device()
+        client = MQTT_FLEET.connect(mqtt.Client(client_id=f"{device.device_id}-thermo"), device.server_ip)
+        state["mqtt"] = client
+    return state["mqtt"]
+
+
+def cycle(state: Dict[str, Any]) -> float:
+    client = connect(state)
+    device = current_device()
+    client.publish(f"thermostat/{device.device_id}/telemetry", telemetry(state).render(), qos=0)
+    json_log("mqtt_publish", topic=f"thermostat/{device.device_id}/telemetry")
+    malicious_ping("/thermostat")
+    return pace(30)
+
+
+def close(state: Dict[str, Any]) -> None:
+    client = state.pop("mqtt", None)
+    if client is not None:
+        MQTT_FLEET.disconnect(client)
 
 
 def main() -> None:
-    client = mqtt.Client(client_id=f"{DEVICE_ID}-thermo")
-    client.connect(SERVER_IP, 1883, keepalive=60)
-    client.loop_start()
-    try:
-        while True:
-            telemetry = {
-                "device_id": DEVICE_ID,
-                "firmware": FIRMWARE_VERSION,
-                "temperature_c": round(21.0 + jitter(1.0) - 1.0, 2),
-                "humidity_pct": round(40.0 + jitter(0.5) - 0.5, 2),
-            }
-            client.publish(f"thermostat/{DEVICE_ID}/telemetry", json.dumps(telemetry), qos=0)
-            json_log("mqtt_publish", topic=f"thermostat/{DEVICE_ID}/telemetry")
-            malicious_ping("/thermostat")
-            time.sleep(jitter(30))
-    finally:
-        client.loop_stop()
-        client.disconnect()
+    run_cycles(cycle, close)
 
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@ import sys
 import threading
 import time
 from pathlib import Path
+from typing import Any, Dict
 
 from pydicom.dataset import Dataset, FileMetaDataset
 from pynetdicom import AE, evt
@@ -16,57 +17,58 @@ if str(PARENT_DIR) not in sys.path:
     sys.path.insert(0, str(PARENT_DIR))
 
 from devices.scripts.common import (  # noqa: E402
-    DEVICE_ID,
-    FIRMWARE_VERSION,
-    HUB_IP,
-    SERVER_IP,
+    current_device,
     is_client,
     is_server,
     json_log,
-    jitter,
     malicious_ping,
+    pace,
+    run_cycles,
 )
 
 DICOM_PORT = int(os.environ.get("DICOM_PORT", "11112"))
 
 
 def build_dataset() -> Dataset:
+    device = current_device()
     ds = Dataset()
     ds.PatientName = "XRAY^PATIENT"
-    ds.PatientID = f"{DEVICE_ID}"
+    ds.PatientID = f"{device.device_id}"
     ds.StudyDescription = "Synthetic X-Ray Study"
     ds.SeriesDescription = "Metadata only"
     ds.Modality = "DX"
-    ds.StudyInstanceUID = f"1.2.826.0.1.3680043.2.1125.{DEVICE_ID}"
-    ds.SeriesInstanceUID = f"1.2.826.0.1.3680043.2.1125.{DEVICE_ID}.1"
-    ds.SOPInstanceUID = f"1.2.826.0.1.3680043.2.1125.{DEVICE_ID}.1.1"
+    ds.StudyInstanceUID = f"1.2.826.0.1.3680043.2.1125.{device.device_id}"
+    ds.SeriesInstanceUID = f"1.2.826.0.1.3680043.2.1125.{device.device_id}.1"
+    ds.SOPInstanceUID = f"1.2.826.0.1.3680043.2.1125.{device.device_id}.1.1"
     ds.SOPClassUID = CTImageStorage.uid
     ds.file_meta = FileMetaDataset()
     ds.file_meta.TransferSyntaxUID = "1.2.840.10008.1.2.1"
     ds.file_meta.MediaStorageSOPClassUID = CTImageStorage.uid
     ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
     ds.file_meta.ImplementationClassUID = "1.2.826.0.1.3680043.8.498.1"
-    ds.file_meta.ImplementationVersionName = FIRMWARE_VERSION
+    ds.file_meta.ImplementationVersionName = device.firmware_version
     ds.is_little_endian = True
     ds.is_implicit_VR = False
     return ds
 
 
-def run_client() -> None:
-    target = SERVER_IP or HUB_IP
-    ae = AE(ae_title=b"XRAYDEVICE")
-    ae.add_requested_context(Verification)
-    ae.add_requested_context(CTImageStorage)
-    while True:
-        assoc = ae.associate(target, DICOM_PORT)
-        if assoc.is_established:
-            status = assoc.send_c_store(build_dataset())
-            json_log("dicom_c_store", status=str(status.Status))
-            assoc.release()
-        else:
-            json_log("dicom_error", error="association_failed")
-        malicious_ping("/dicom")
-        time.sleep(jitter(60))
+def cycle(state: Dict[str, Any]) -> float:
+    device = current_device()
+    target = device.server_ip or device.hub_ip
+    ae = state.get("ae")
+    if ae is None:
+        ae = state["ae"] = AE(ae_title=b"XRAYDEVICE")
+        ae.add_requested_context(Verification)
+        ae.add_requested_context(CTImageStorage)
+    assoc = ae.associate(target, DICOM_PORT)
+    if assoc.is_established:
+        status = assoc.send_c_store(build_dataset())
+        json_log("dicom_c_store", status=str(status.Status))
+        assoc.release()
+    else:
+        json_log("dicom_error", error="association_failed")
+    malicious_ping("/dicom")
+    return pace(60)
 
 
 def run_server() -> None:
@@ -101,14 +103,18 @@ def run_server() -> None:
             break
 
 
+def start_servers() -> list[threading.Thread]:
+    server_thread = threading.Thread(target=run_server, daemon=True)
+    server_thread.start()
+    return [server_thread]
+
+
 def main() -> None:
     threads: list[threading.Thread] = []
     if is_server():
-        server_thread = threading.Thread(target=run_server, daemon=True)
-        server_thread.start()
-        threads.append(server_thread)
+        threads.extend(start_servers())
     if is_client():
-        run_client()
+        run_cycles(cycle)
     else:
         while True:
             time.sleep(60)
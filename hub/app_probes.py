@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Application-level probes for the hub connection manager.
+
+Rather than only completing a TCP handshake, each protocol sends the smallest
+request its emulated server answers: a Modbus read of holding register 0, an
+RTSP OPTIONS, an IPP Get-Printer-Attributes POST and a DICOM C-ECHO. The
+connection (or DICOM association) is kept open for the next probe of the same
+target when the server allows it, and handshake and first-response latency
+are reported separately.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import itertools
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+MAX_IDLE_CONNECTIONS = int(os.environ.get("HUB_PROBE_MAX_IDLE_CONNECTIONS", "4096"))
+MODBUS_UNIT_ID = int(os.environ.get("HUB_PROBE_MODBUS_UNIT", "1"))
+DICOM_AE_TITLE = os.environ.get("HUB_PROBE_DICOM_AE_TITLE", "IOTHUBPROBE")
+DICOM_THREADS = int(os.environ.get("HUB_PROBE_DICOM_THREADS", "16"))
+DICOM_MAX_ASSOCIATIONS = int(os.environ.get("HUB_PROBE_DICOM_MAX_ASSOCIATIONS", "256"))
+
+Stream = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+# Reads one reply; returns (detail, ok, keep_alive).
+ReplyReader = Callable[[asyncio.StreamReader], Awaitable[tuple[str, bool, bool]]]
+
+
+class ProbeProtocolError(Exception):
+    pass
+
+
+class StaleReplyError(ProbeProtocolError):
+    """The reply answers some earlier request, e.g. a late one left on a reused connection."""
+
+
+@dataclass
+class AppProbeResult:
+    ok: bool
+    latency_ms: float
+    handshake_ms: float | None = None  # None when an open connection was reused
+    response_ms: float | None = None
+    detail: str = ""
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def _close(writer: asyncio.StreamWriter) -> None:
+    try:
+        writer.close()
+    except (OSError, RuntimeError):
+        pass
+
+
+class StreamCache:
+    """Idle connections per (host, port), least recently used closed first."""
+
+    def __init__(self, max_idle: int = MAX_IDLE_CONNECTIONS) -> None:
+        self.max_idle = max(0, max_idle)
+        self._idle: OrderedDict[tuple[str, int], Stream] = OrderedDict()
+        # Targets whose server closed a kept-alive connection; they always get a fresh one.
+        self.single_shot: set[tuple[str, int]] = set()
+
+    def take(self, key: tuple[str, int]) -> Stream | None:
+        stream = self._idle.pop(key, None)
+        if stream is not None and (stream[0].at_eof() or stream[1].is_closing()):
+            _close(stream[1])
+            return None
+        return stream
+
+    def put(self, key: tuple[str, int], stream: Stream) -> None:
+        if key in self.single_shot or not self.max_idle:
+            _close(stream[1])
+            return
+        self._idle[key] = stream
+        while len(self._idle) > self.max_idle:
+            _close(self._idle.popitem(last=False)[1][1])
+
+    def __len__(self) -> int:
+        return len(self._idle)
+
+    def close(self) -> None:
+        for _, writer in self._idle.values():
+            _close(writer)
+        self._idle.clear()
+
+
+async def exchange(
+    cache: StreamCache,
+    host: str,
+    port: int,
+    request: bytes,
+    read_reply: ReplyReader,
+    timeout: float,
+) -> AppProbeResult:
+    """Send ``request`` over a cached or new connection and time the reply."""
+    key = (host, port)
+    start = time.perf_counter()
+    deadline = start + timeout
+    stream = cache.take(key)
+    while True:
+        handshake_ms = None
+        if stream is None:
+            connect_start = time.perf_counter()
+            stream = await asyncio.wait_for(asyncio.open_connection(host, port), max(0.0, deadline - connect_start))
+            handshake_ms = _elapsed_ms(connect_start)
+        reader, writer = stream
+        sent = time.perf_counter()
+        try:
+            writer.write(request)
+            detail, ok, keep_alive = await asyncio.wait_for(read_reply(reader), max(0.0, deadline - sent))
+        except (asyncio.IncompleteReadError, ConnectionError) as exc:
+            _close(writer)
+            if handshake_ms is not None:
+                raise ProbeProtocolError(f"connection closed before reply: {exc}") from exc
+            # The server dropped the idle connection; stop reusing it and retry once on a fresh one.
+            cache.single_shot.add(key)
+            stream = None
+            continue
+        except StaleReplyError:
+            _close(writer)
+            if handshake_ms is not None:
+                raise
+            # The cached connection is out of step with our requests; drop it and retry once on a fresh one.
+            stream = None
+            continue
+        except BaseException:
+            _close(writer)
+            raise
+        response_ms = _elapsed_ms(sent)
+        if keep_alive:
+            cache.put(key, stream)
+        else:
+            _close(writer)
+        return AppProbeResult(ok, _elapsed_ms(start), handshake_ms, response_ms, detail)
+
+
+_modbus_ids = itertools.count(1)
+
+
+def modbus_read_request(transaction_id: int, unit_id: int = MODBUS_UNIT_ID) -> bytes:
+    """MBAP frame for function 0x03 (read holding registers), address 0, count 1."""
+    return struct.pack(">HHHBBHH", transaction_id & 0xFFFF, 0, 6, unit_id, 0x03, 0, 1)
+
+
+async def _read_modbus_reply(
+    reader: asyncio.StreamReader, transaction_id: int, unit_id: int = MODBUS_UNIT_ID
+) -> tuple[str, bool, bool]:
+    reply_id, protocol, length = struct.unpack(">HHH", await reader.readexactly(6))
+    body = await reader.readexactly(length)
+    if protocol != 0 or len(body) < 3:
+        raise ProbeProtocolError("malformed Modbus reply")
+    if reply_id != transaction_id & 0xFFFF or body[0] != unit_id:
+        raise StaleReplyError(
+            f"Modbus reply for transaction {reply_id} unit {body[0]}, sent {transaction_id & 0xFFFF} unit {unit_id}"
+        )
+    function = body[1]
+    if function & 0x80:
+        return f"modbus exception {body[2]}", False, True
+    if function != 0x03 or len(body) < 5:
+        raise ProbeProtocolError(f"unexpected Modbus function 0x{function:02x}")
+    return f"hr0={struct.unpack('>H', body[3:5])[0]}", True, True
+
+
+async def _read_head(reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str]]:
+    """Read an RTSP/HTTP status line and headers, plus any Content-Length body."""
+    head = (await reader.readuntil(b"\r\n\r\n")).decode(errors="replace")
+    status_line, *lines = head.split("\r\n")
+    headers = {}
+    for line in lines:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", "0") or 0)
+    if length:
+        await reader.readexactly(length)
+    parts = status_line.split(" ", 2)
+    if len(parts) < 2:
+        raise ProbeProtocolError(f"malformed status line {status_line!r}")
+    return parts[0], parts[1], headers
+
+
+def _keep_alive(version: str, headers: dict[str, str]) -> bool:
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.0":
+        return connection == "keep-alive"
+    return connection != "close"
+
+
+def rtsp_options_request(host: str, port: int, cseq: int) -> bytes:
+    return (
+        f"OPTIONS rtsp://{host}:{port}/ RTSP/1.0\r\n"
+        f"CSeq: {cseq}\r\n"
+        "User-Agent: iot-hub-probe\r\n\r\n"
+    ).encode()
+
+
+async def _read_rtsp_reply(reader: asyncio.StreamReader) -> tuple[str, bool, bool]:
+    version, status, headers = await _read_head(reader)
+    if not version.startswith("RTSP/"):
+        raise ProbeProtocolError(f"not an RTSP reply: {version}")
+    return f"RTSP {status}", status == "200", _keep_alive(version, headers)
+
+
+def _ipp_attribute(tag: int, name: str, value: str) -> bytes:
+    return struct.pack(">BH", tag, len(name)) + name.encode() + struct.pack(">H", len(value)) + value.encode()
+
+
+def ipp_get_attributes_request(host: str, port: int) -> bytes:
+    """HTTP POST carrying an IPP/2.0 Get-Printer-Attributes operation."""
+    body = (
+        struct.pack(">BBHI", 2, 0, 0x000B, 1)
+        + b"\x01"
+        + _ipp_attribute(0x47, "attributes-charset", "utf-8")
+        + _ipp_attribute(0x48, "attributes-natural-language", "en")
+        + _ipp_attribute(0x45, "printer-uri", f"ipp://{host}:{port}/ipp/print")
+        + b"\x03"
+    )
+    head = (
+        "POST /ipp/print HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        "Content-Type: application/ipp\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: keep-alive\r\n"
+        "User-Agent: iot-hub-probe\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+async def _read_http_reply(reader: asyncio.StreamReader) -> tuple[str, bool, bool]:
+    version, status, headers = await _read_head(reader)
+    if not version.startswith("HTTP/"):
+        raise ProbeProtocolError(f"not an HTTP reply: {version}")
+    return f"HTTP {status}", status.startswith("2"), _keep_alive(version, headers)
+
+
+class AppProber:
+    """Per-process application prober; TCP protocols share one connection cache."""
+
+    def __init__(self, max_idle: int = MAX_IDLE_CONNECTIONS) -> None:
+        self.streams = StreamCache(max_idle)
+        self.dicom = DicomEchoProber()
+        self._cseq = itertools.count(1)
+
+    async def probe(self, protocol: str, host: str, port: int, timeout: float) -> AppProbeResult:
+        if protocol == "ModbusTCP":
+            transaction_id = next(_modbus_ids)
+            request = modbus_read_request(transaction_id)
+            reader = functools.partial(_read_modbus_reply, transaction_id=transaction_id)
+        elif protocol == "RTSP":
+            request, reader = rtsp_options_request(host, port, next(self._cseq)), _read_rtsp_reply
+        elif protocol == "IPP":
+            request, reader = ipp_get_attributes_request(host, port), _read_http_reply
+        elif protocol == "DICOM":
+            return await self.dicom.echo(host, port, timeout)
+        else:
+            raise ValueError(f"no application probe for {protocol}")
+        return await exchange(self.streams, host, port, request, reader, timeout)
+
+    def close(self) -> None:
+        self.streams.close()
+        self.dicom.close()
+
+
+class DicomEchoProber:
+    """C-ECHO over associations kept open between probes.
+
+    pynetdicom is blocking, so echoes run on a small dedicated thread pool; an
+    association is only ever used by one probe at a time because the scheduler
+    never overlaps probes of the same target.
+    """
+
+    def __init__(self, max_associations: int = DICOM_MAX_ASSOCIATIONS, threads: int = DICOM_THREADS) -> None:
+        self.max_associations = max(0, max_associations)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="dicom-probe")
+        self._lock = threading.Lock()
+        self._idle: OrderedDict[tuple[str, int], object] = OrderedDict()
+        self._ae = None
+
+    def _application_entity(self, timeout: float):
+        if self._ae is None:
+            from pynetdicom import AE
+            from pynetdicom.sop_class import Verification
+
+            ae = AE(ae_title=DICOM_AE_TITLE)
+            ae.add_requested_context(Verification)
+            # Keep idle associations open; the peer may still drop them, which is detected on reuse.
+            ae.network_timeout = None
+            self._ae = ae
+        self._ae.acse_timeout = timeout
+        self._ae.dimse_timeout = timeout
+        self._ae.connection_timeout = timeout
+        return self._ae
+
+    def _release(self, assoc) -> None:
+        try:
+            assoc.release()
+        except Exception:  # noqa: BLE001 - the association is being discarded either way
+            pass
+
+    def _echo(self, host: str, port: int, timeout: float) -> AppProbeResult:
+        key = (host, port)
+        start = time.perf_counter()
+        with self._lock:
+            assoc = self._idle.pop(key, None)
+        ae = self._application_entity(timeout)
+        for attempt in range(2):
+            handshake_ms = None
+            if assoc is None or not assoc.is_established:
+                assoc = ae.associate(host, port)
+                handshake_ms = _elapsed_ms(start)
+                if not assoc.is_established:
+                    reason = "association rejected" if assoc.is_rejected else "association failed"
+                    return AppProbeResult(False, _elapsed_ms(start), handshake_ms, None, reason)
+            sent = time.perf_counter()
+            status = assoc.send_c_echo()
+            if status:
+                response_ms = _elapsed_ms(sent)
+                self._keep(key, assoc)
+                code = status.Status
+                return AppProbeResult(code == 0, _elapsed_ms(start), handshake_ms, response_ms, f"C-ECHO 0x{code:04x}")
+            self._release(assoc)
+            if handshake_ms is not None:
+                break
+            assoc = None  # stale association; retry once with a new one
+        return AppProbeResult(False, _elapsed_ms(start), handshake_ms, None, "no C-ECHO response")
+
+    def _keep(self, key: tuple[str, int], assoc) -> None:
+        evicted = []
+        with self._lock:
+            self._idle[key] = assoc
+            while len(self._idle) > self.max_associations:
+                evicted.append(self._idle.popitem(last=False)[1])
+        for stale in evicted:
+            self._release(stale)
+
+    async def echo(self, host: str, port: int, timeout: float) -> AppProbeResult:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._echo, host, port, timeout)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = list(self._idle.values()), OrderedDict()
+        for assoc in idle:
+            self._release(assoc)
+        self._executor.shutdown(wait=False)
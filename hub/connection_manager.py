@@ -1,25 +1,44 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import asyncio
 import json
 import os
-import socket
+import resource
+import signal
 import sqlite3
 import time
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Iterable, Iterator
 
-from pysnmp.hlapi import (
-    CommunityData,
-    ContextData,
-    ObjectIdentity,
-    ObjectType,
-    SnmpEngine,
-    UdpTransportTarget,
-    getCmd,
+import requests
+
+from app_probes import MAX_IDLE_CONNECTIONS, AppProber, ProbeProtocolError
+from probe_scheduler import ProbeScheduler
+from registry_store import (
+    ConnectionPool,
+    changes_in_ranges,
+    changes_since,
+    create_worker_table,
+    heartbeat_worker,
+    remove_worker,
 )
+from shard_ring import HashRing
+from snmp_client import SnmpError, SnmpGetClient
 
 DB_PATH = Path(os.environ.get("REGISTRY_DB_PATH", "/data/hub_registry.db"))
 POLL_INTERVAL = int(os.environ.get("HUB_POLL_INTERVAL", "20"))
+# 10k unreachable targets x 3 s timeout / 20 s interval needs ~1.5k probes in flight.
+PROBE_CONCURRENCY = int(os.environ.get("HUB_PROBE_CONCURRENCY", "2048"))
+REGISTRY_REFRESH = float(os.environ.get("HUB_REGISTRY_REFRESH", "5"))
+HUB_API_URL = os.environ.get("HUB_API_URL", f"http://127.0.0.1:{os.environ.get('HUB_API_PORT', '7000')}")
+REPORT_INTERVAL = float(os.environ.get("HUB_PROBE_REPORT_INTERVAL", "2"))
+REPORT_MAX_PENDING = int(os.environ.get("HUB_PROBE_REPORT_MAX_PENDING", "50000"))
+MAX_IDLE_SLEEP = 1.0
+# Set per process by entrypoint.sh when HUB_PROBE_WORKERS > 1; empty means probe the whole registry.
+WORKER_ID = os.environ.get("HUB_PROBE_WORKER_ID", "")
+WORKER_TTL = float(os.environ.get("HUB_PROBE_WORKER_TTL", str(3 * REGISTRY_REFRESH)))
 
 PROTOCOL_PORTS = {
     "ModbusTCP": int(os.environ.get("MODBUS_PORT", "1502")),
@@ -29,94 +48,376 @@ PROTOCOL_PORTS = {
     "SNMP": int(os.environ.get("SNMP_PORT", "16100")),
 }
 
+DEFAULT_PROBE_TIMEOUT = float(os.environ.get("HUB_PROBE_TIMEOUT", "3"))
+PROBE_TIMEOUTS = {
+    protocol: float(
+        os.environ.get(f"HUB_PROBE_TIMEOUT_{protocol.upper()}", "2" if protocol == "SNMP" else DEFAULT_PROBE_TIMEOUT)
+    )
+    for protocol in PROTOCOL_PORTS
+}
 
-def fetch_devices() -> list[dict[str, object]]:
-    if not DB_PATH.exists():
-        return []
-    with sqlite3.connect(DB_PATH) as conn:
-        rows = conn.execute(
-            "SELECT device_id, device_type, role, ip_address, protocols, last_seen FROM devices"
-        ).fetchall()
-    devices = []
-    for row in rows:
-        protocols = json.loads(row[4]) if row[4] else []
-        devices.append(
+PROBE_ROLES = ("server", "both")
+# "app" sends a protocol request (Modbus read, RTSP OPTIONS, IPP POST, DICOM C-ECHO); "tcp" only connects.
+PROBE_MODE = os.environ.get("HUB_PROBE_MODE", "app").lower()
+APP_PROBE_PROTOCOLS = ("ModbusTCP", "RTSP", "IPP", "DICOM")
+
+_pool: ConnectionPool | None = None
+_devices: dict[str, dict[str, object]] = {}
+_version = 0
+_ring: HashRing | None = None
+_ranges: list[tuple[int, int]] = []
+_snmp_client: SnmpGetClient | None = None
+_app_prober: AppProber | None = None
+
+
+@dataclass(frozen=True)
+class ProbeTarget:
+    device_id: str
+    host: str
+    port: int
+    protocol: str
+
+
+@dataclass
+class ProbeResult:
+    target: ProbeTarget
+    ok: bool
+    latency_ms: float
+    detail: str = ""
+    handshake_ms: float | None = None
+    response_ms: float | None = None
+
+
+class ProbeReporter:
+    """Batches probe results and posts them to the registry's /probes/results endpoint."""
+
+    def __init__(self, base_url: str = HUB_API_URL, max_pending: int = REPORT_MAX_PENDING) -> None:
+        self.url = f"{base_url.rstrip('/')}/probes/results"
+        self.max_pending = max_pending
+        self.session = requests.Session()
+        self.pending: list[dict[str, object]] = []
+        self.dropped = 0
+
+    def add(self, result: ProbeResult) -> None:
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        target = result.target
+        self.pending.append(
             {
-                "device_id": row[0],
-                "device_type": row[1],
-                "role": row[2],
-                "ip_address": row[3],
-                "protocols": protocols,
-                "last_seen": row[5],
+                "device_id": target.device_id,
+                "protocol": target.protocol,
+                "host": target.host,
+                "port": target.port,
+                "ok": result.ok,
+                "latency_ms": round(result.latency_ms, 3),
+                "timestamp": time.time(),
+                "error": "" if result.ok else result.detail,
+                "handshake_ms": _round(result.handshake_ms, 3),
+                "response_ms": _round(result.response_ms, 3),
             }
         )
-    return devices
+
+    def flush(self) -> int:
+        batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+        try:
+            resp = self.session.post(self.url, json=batch, timeout=5)
+            resp.raise_for_status()
+        except requests.RequestException as exc:
+            log_event("hub_probe_report_error", error=str(exc), dropped=len(batch))
+            return 0
+        if self.dropped:
+            log_event("hub_probe_report_overflow", dropped=self.dropped)
+            self.dropped = 0
+        return len(batch)
 
 
-def log_event(event: str, **fields: str) -> None:
+def _rebalance(conn: sqlite3.Connection) -> bool:
+    """Heartbeat this worker; returns True when the live worker set (and so our ranges) changed."""
+    global _ring, _ranges
+    workers = heartbeat_worker(conn, WORKER_ID, time.time(), WORKER_TTL, os.getpid())
+    if _ring is not None and _ring.workers == tuple(workers):
+        return False
+    _ring = HashRing(workers)
+    _ranges = _ring.ranges(WORKER_ID)
+    log_event("hub_probe_shard_rebalance", worker_id=WORKER_ID, workers=workers, ranges=len(_ranges))
+    return True
+
+
+def fetch_devices() -> list[dict[str, object]]:
+    """Return probe-eligible devices, reading only registry rows changed since the last call.
+
+    With ``HUB_PROBE_WORKER_ID`` set only this worker's shard is read; a change
+    in the set of live workers drops the local copy and reloads the new ranges.
+    """
+    global _pool, _version
+    if not DB_PATH.exists():
+        return []
+    try:
+        if _pool is None:
+            _pool = ConnectionPool(DB_PATH, size=1)
+            if WORKER_ID:
+                with _pool.connection() as conn:
+                    create_worker_table(conn)
+        with _pool.connection() as conn:
+            if WORKER_ID:
+                if _rebalance(conn):
+                    _devices.clear()
+                    _version = 0
+                head, changes = changes_in_ranges(conn, _ranges, _version)
+            else:
+                changes = changes_since(conn, _version)
+                head = changes[-1]["version"] if changes else _version
+    except sqlite3.OperationalError as exc:
+        log_event("hub_registry_unavailable", error=str(exc))
+        return list(_devices.values())
+    for device in changes:
+        if device["role"] in PROBE_ROLES:
+            _devices[device["device_id"]] = device
+        else:
+            _devices.pop(device["device_id"], None)
+    _version = head
+    return list(_devices.values())
+
+
+def iter_targets(devices: Iterable[dict[str, object]]) -> Iterator[ProbeTarget]:
+    for device in devices:
+        for protocol in device["protocols"]:
+            port = PROTOCOL_PORTS.get(protocol)
+            if port:
+                yield ProbeTarget(str(device["device_id"]), str(device["ip_address"]), port, protocol)
+
+
+def log_event(event: str, **fields: object) -> None:
     print(json.dumps({"event": event, **fields}), flush=True)
 
 
-def probe_tcp(host: str, port: int, protocol: str) -> None:
+def _round(value: float | None, digits: int) -> float | None:
+    return None if value is None else round(value, digits)
+
+
+def log_result(result: ProbeResult) -> None:
+    target = result.target
+    fields = {
+        "protocol": target.protocol,
+        "host": target.host,
+        "port": target.port,
+        "device_id": target.device_id,
+        "latency_ms": round(result.latency_ms, 2),
+    }
+    if result.handshake_ms is not None:
+        fields["handshake_ms"] = round(result.handshake_ms, 2)
+    if result.response_ms is not None:
+        fields["response_ms"] = round(result.response_ms, 2)
+    if result.ok:
+        if result.detail:
+            fields["value"] = result.detail
+        log_event("hub_probe_success", **fields)
+    else:
+        log_event("hub_probe_failed", error=result.detail, **fields)
+
+
+async def probe_tcp(target: ProbeTarget, timeout: float) -> ProbeResult:
+    start = time.perf_counter()
     try:
-        with socket.create_connection((host, port), timeout=3):
-            log_event("hub_probe_success", protocol=protocol, host=host, port=port)
-    except Exception as exc:  # noqa: BLE001
-        log_event("hub_probe_failed", protocol=protocol, host=host, port=port, error=str(exc))
+        _, writer = await asyncio.wait_for(asyncio.open_connection(target.host, target.port), timeout)
+    except asyncio.TimeoutError:
+        return ProbeResult(target, False, (time.perf_counter() - start) * 1000, "timed out")
+    except OSError as exc:
+        return ProbeResult(target, False, (time.perf_counter() - start) * 1000, str(exc))
+    latency = (time.perf_counter() - start) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return ProbeResult(target, True, latency, handshake_ms=latency)
+
 
+async def get_snmp_client() -> SnmpGetClient:
+    """Return the process-wide SNMP client, opening it on first use."""
+    global _snmp_client
+    if _snmp_client is None:
+        _snmp_client = await SnmpGetClient.open(os.environ.get("HUB_SNMP_COMMUNITY", "public"))
+    return _snmp_client
 
-def probe_snmp(host: str, port: int) -> None:
+
+async def probe_snmp(target: ProbeTarget, timeout: float) -> ProbeResult:
+    client = await get_snmp_client()
+    start = time.perf_counter()
     try:
-        iterator = getCmd(
-            SnmpEngine(),
-            CommunityData("public", mpModel=1),
-            UdpTransportTarget((host, port), timeout=2, retries=0),
-            ContextData(),
-            ObjectType(ObjectIdentity("1.3.6.1.2.1.1.1.0")),
-        )
-        error_indication, error_status, _, var_binds = next(iterator)
-        if error_indication:
-            log_event(
-                "hub_probe_failed",
-                protocol="SNMP",
-                host=host,
-                port=port,
-                error=str(error_indication),
-            )
-            return
-        if error_status:
-            log_event(
-                "hub_probe_failed",
-                protocol="SNMP",
-                host=host,
-                port=port,
-                error=str(error_status.prettyPrint()),
-            )
-            return
-        value = " = ".join([x.prettyPrint() for x in var_binds[0]]) if var_binds else "ok"
-        log_event("hub_probe_success", protocol="SNMP", host=host, port=port, value=value)
-    except Exception as exc:  # noqa: BLE001
-        log_event("hub_probe_failed", protocol="SNMP", host=host, port=port, error=str(exc))
+        response = await client.get(target.host, target.port, timeout=timeout)
+    except asyncio.TimeoutError:
+        error = "No SNMP response received before timeout"
+        return ProbeResult(target, False, (time.perf_counter() - start) * 1000, error)
+    except (SnmpError, OSError) as exc:
+        return ProbeResult(target, False, (time.perf_counter() - start) * 1000, str(exc))
+    return ProbeResult(target, True, response.rtt_ms, f"{response.oid} = {response.value}", response_ms=response.rtt_ms)
 
 
-def probe(host: str, port: int, protocol: str) -> None:
-    if protocol == "SNMP":
-        probe_snmp(host, port)
-    else:
-        probe_tcp(host, port, protocol)
+def get_app_prober() -> AppProber:
+    global _app_prober
+    if _app_prober is None:
+        _app_prober = AppProber()
+    return _app_prober
 
 
-def main() -> None:
+async def probe_app(target: ProbeTarget, timeout: float) -> ProbeResult:
+    start = time.perf_counter()
+    try:
+        outcome = await get_app_prober().probe(target.protocol, target.host, target.port, timeout)
+    except asyncio.TimeoutError:
+        return ProbeResult(target, False, (time.perf_counter() - start) * 1000, "timed out")
+    except (ProbeProtocolError, OSError, ValueError) as exc:
+        return ProbeResult(target, False, (time.perf_counter() - start) * 1000, str(exc))
+    return ProbeResult(
+        target, outcome.ok, outcome.latency_ms, outcome.detail, outcome.handshake_ms, outcome.response_ms
+    )
+
+
+async def probe(target: ProbeTarget) -> ProbeResult:
+    timeout = PROBE_TIMEOUTS.get(target.protocol, DEFAULT_PROBE_TIMEOUT)
+    if target.protocol == "SNMP":
+        return await probe_snmp(target, timeout)
+    if PROBE_MODE == "app" and target.protocol in APP_PROBE_PROTOCOLS:
+        return await probe_app(target, timeout)
+    return await probe_tcp(target, timeout)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def sweep_stats(results: list[ProbeResult], duration: float) -> dict[str, object]:
+    by_protocol: dict[str, list[ProbeResult]] = {}
+    for result in results:
+        by_protocol.setdefault(result.target.protocol, []).append(result)
+    protocols = {}
+    for protocol, items in sorted(by_protocol.items()):
+        latencies = [item.latency_ms for item in items if item.ok]
+        protocols[protocol] = {
+            "probes": len(items),
+            "failed": sum(1 for item in items if not item.ok),
+            "p50_ms": round(_percentile(latencies, 50), 2),
+            "p99_ms": round(_percentile(latencies, 99), 2),
+            "max_ms": round(max((item.latency_ms for item in items), default=0.0), 2),
+        }
+        handshakes = [item.handshake_ms for item in items if item.ok and item.handshake_ms is not None]
+        responses = [item.response_ms for item in items if item.ok and item.response_ms is not None]
+        for phase, values in (("handshake", handshakes), ("response", responses)):
+            if values:
+                protocols[protocol][f"{phase}_p50_ms"] = round(_percentile(values, 50), 2)
+                protocols[protocol][f"{phase}_p99_ms"] = round(_percentile(values, 99), 2)
+    return {
+        "targets": len(results),
+        "succeeded": sum(1 for result in results if result.ok),
+        "failed": sum(1 for result in results if not result.ok),
+        "duration_s": round(duration, 3),
+        "probes_per_sec": round(len(results) / duration, 1) if duration > 0 else 0.0,
+        "protocols": protocols,
+    }
+
+
+async def sweep(targets: list[ProbeTarget], concurrency: int = PROBE_CONCURRENCY) -> dict[str, object]:
+    """Probe every target with at most ``concurrency`` probes in flight."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(target: ProbeTarget) -> ProbeResult:
+        async with semaphore:
+            result = await probe(target)
+        log_result(result)
+        return result
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bounded(target) for target in targets))
+    return sweep_stats(results, time.perf_counter() - start)
+
+
+async def run() -> None:
+    """Probe each target when it falls due instead of sweeping everything at once.
+
+    Registry deltas are picked up every ``HUB_REGISTRY_REFRESH`` seconds, results
+    are posted to the registry every ``HUB_PROBE_REPORT_INTERVAL`` seconds and a
+    ``hub_probe_window`` summary is logged once per ``POLL_INTERVAL``.
+    """
+    scheduler: ProbeScheduler[ProbeTarget] = ProbeScheduler(POLL_INTERVAL)
+    semaphore = asyncio.Semaphore(max(1, PROBE_CONCURRENCY))
+    in_flight: set[asyncio.Task] = set()
+    window: list[ProbeResult] = []
+    window_start = next_refresh = next_report = time.monotonic()
+    reporter = ProbeReporter()
+    report_task: asyncio.Future | None = None
+
+    async def run_probe(target: ProbeTarget) -> None:
+        ok = False
+        try:
+            async with semaphore:
+                result = await probe(target)
+            ok = result.ok
+        finally:
+            # Always clear in_flight, or the target is never popped (and probed) again.
+            try:
+                scheduler.record(target, ok, time.monotonic())
+            except Exception as exc:  # noqa: BLE001
+                scheduler.release(target, time.monotonic())
+                log_event("hub_probe_schedule_error", device_id=target.device_id, error=str(exc))
+        log_result(result)
+        reporter.add(result)
+        window.append(result)
+
     while True:
-        for device in fetch_devices():
-            if device["role"] not in {"server", "both"}:
-                continue
-            host = device["ip_address"]
-            for protocol in device["protocols"]:
-                port = PROTOCOL_PORTS.get(protocol)
-                if port:
-                    probe(host, port, protocol)
-        time.sleep(POLL_INTERVAL)
+        now = time.monotonic()
+        if now >= next_refresh:
+            scheduler.sync(iter_targets(fetch_devices()), now)
+            next_refresh = now + REGISTRY_REFRESH
+        for target in scheduler.pop_due(now):
+            task = asyncio.create_task(run_probe(target))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if now >= next_report and (report_task is None or report_task.done()):
+            report_task = asyncio.ensure_future(asyncio.to_thread(reporter.flush))
+            next_report = now + REPORT_INTERVAL
+        if now - window_start >= POLL_INTERVAL:
+            stats = sweep_stats(window, now - window_start)
+            if WORKER_ID:
+                stats["worker_id"] = WORKER_ID
+            log_event("hub_probe_window", tracked=len(scheduler), in_flight=len(in_flight), **stats)
+            window = []
+            window_start = now
+        wake = min(next_refresh, next_report, window_start + POLL_INTERVAL, now + MAX_IDLE_SLEEP)
+        next_due = scheduler.next_due()
+        if next_due is not None:
+            wake = min(wake, next_due)
+        await asyncio.sleep(max(0.0, wake - time.monotonic()))
+
+
+def raise_fd_limit(wanted: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def _terminate(signum: int, frame: object) -> None:
+    raise SystemExit(0)
+
+
+def main() -> None:
+    raise_fd_limit(PROBE_CONCURRENCY + MAX_IDLE_CONNECTIONS + 256)
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        asyncio.run(run())
+    finally:
+        # Leave the ring right away so the remaining workers pick up this shard
+        # on their next refresh instead of after WORKER_TTL.
+        if WORKER_ID and _pool is not None:
+            with _pool.connection() as conn:
+                remove_worker(conn, WORKER_ID)
 
 
 if __name__ == "__main__":
@@ -3,12 +3,21 @@ set -euo pipefail
 
 export REGISTRY_DB_PATH="${REGISTRY_DB_PATH:-/data/hub_registry.db}"
 export HUB_API_PORT="${HUB_API_PORT:-7000}"
+HUB_PROBE_WORKERS="${HUB_PROBE_WORKERS:-1}"
 
 python3 -m uvicorn registry_service:app --host 0.0.0.0 --port "${HUB_API_PORT}" &
-REGISTRY_PID=$!
+PIDS=($!)
 
-python3 connection_manager.py &
-CONN_PID=$!
+if [ "${HUB_PROBE_WORKERS}" -gt 1 ]; then
+  # Each worker probes its consistent-hash shard of the registry.
+  for ((i = 0; i < HUB_PROBE_WORKERS; i++)); do
+    HUB_PROBE_WORKER_ID="probe-${i}" python3 connection_manager.py &
+    PIDS+=($!)
+  done
+else
+  python3 connection_manager.py &
+  PIDS+=($!)
+fi
 
-trap 'kill ${REGISTRY_PID} ${CONN_PID}' INT TERM
-wait ${REGISTRY_PID} ${CONN_PID}
+trap 'kill ${PIDS[*]}' INT TERM
+wait ${PIDS[*]}
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+In-memory store for hub probe outcomes: a ring buffer of recent results plus
+fixed-bucket latency histograms per protocol and per device. Per-device
+histograms not updated for ``HUB_PROBE_DEVICE_TTL`` seconds are dropped, and
+at most ``HUB_PROBE_MAX_DEVICE_SERIES`` are kept (least recently updated go
+first), so devices that leave the fleet do not grow memory or ``/metrics``.
+"""
+
+from __future__ import annotations
+
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass
+from typing import Iterable
+
+RING_SIZE = int(os.environ.get("HUB_PROBE_RING_SIZE", "10000"))
+DEVICE_SERIES_TTL = float(os.environ.get("HUB_PROBE_DEVICE_TTL", "3600"))
+MAX_DEVICE_SERIES = int(os.environ.get("HUB_PROBE_MAX_DEVICE_SERIES", "50000"))
+LATENCY_BUCKETS_MS = (1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0)
+
+
+@dataclass
+class ProbeRecord:
+    device_id: str
+    protocol: str
+    host: str
+    port: int
+    ok: bool
+    latency_ms: float
+    timestamp: float
+    error: str = ""
+    handshake_ms: float | None = None
+    response_ms: float | None = None
+
+
+PHASES = ("handshake", "response")
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total_ms = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    def observe(self, ok: bool, latency_ms: float) -> None:
+        if not ok:
+            self.failures += 1
+            return
+        self.successes += 1
+        self.total_ms += latency_ms
+        self.counts[bisect.bisect_left(self.buckets, latency_ms)] += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate the ``q`` quantile by linear interpolation inside its bucket."""
+        if not self.successes:
+            return None
+        rank = q * self.successes
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return round(lower + (upper - lower) * (rank - seen) / count, 3)
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self) -> dict[str, object]:
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "mean_ms": round(self.total_ms / self.successes, 3) if self.successes else None,
+            "p50_ms": self.quantile(0.5),
+            "p90_ms": self.quantile(0.9),
+            "p99_ms": self.quantile(0.99),
+        }
+
+    def prometheus(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.successes}')
+        lines.append(f"{name}_sum{{{labels}}} {round(self.total_ms, 3)}")
+        lines.append(f"{name}_count{{{labels}}} {self.successes}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class ProbeResultStore:
+    """Thread-safe aggregation point for probe reports posted by connection managers."""
+
+    def __init__(
+        self,
+        ring_size: int = RING_SIZE,
+        device_ttl: float = DEVICE_SERIES_TTL,
+        max_device_series: int = MAX_DEVICE_SERIES,
+    ) -> None:
+        self._lock = threading.Lock()
+        self._recent: deque[ProbeRecord] = deque(maxlen=ring_size)
+        self._by_protocol: dict[str, LatencyHistogram] = {}
+        # (device, protocol) -> (last update, histogram), least recently updated first
+        self._by_device: OrderedDict[tuple[str, str], tuple[float, LatencyHistogram]] = OrderedDict()
+        self.device_ttl = device_ttl
+        self.max_device_series = max(0, max_device_series)
+        self._by_phase: dict[tuple[str, str], LatencyHistogram] = {}
+        self._reachability: dict[tuple[str, str], ProbeRecord] = {}
+
+    def add(self, records: Iterable[ProbeRecord], now: float | None = None) -> int:
+        now = time.monotonic() if now is None else now
+        added = 0
+        with self._lock:
+            for record in records:
+                self._recent.append(record)
+                self._by_protocol.setdefault(record.protocol, LatencyHistogram()).observe(record.ok, record.latency_ms)
+                key = (record.device_id, record.protocol)
+                entry = self._by_device.pop(key, None)
+                hist = entry[1] if entry is not None else LatencyHistogram()
+                hist.observe(record.ok, record.latency_ms)
+                self._by_device[key] = (now, hist)
+                for phase in PHASES:
+                    latency = getattr(record, f"{phase}_ms")
+                    if record.ok and latency is not None:
+                        self._by_phase.setdefault((record.protocol, phase), LatencyHistogram()).observe(True, latency)
+                self._reachability[key] = record
+                added += 1
+            self._evict_devices(now)
+        return added
+
+    def _evict_devices(self, now: float) -> None:
+        while self._by_device:
+            key, (updated, _) = next(iter(self._by_device.items()))
+            if len(self._by_device) <= self.max_device_series and now - updated <= self.device_ttl:
+                break
+            del self._by_device[key]
+
+    def expire(self, now: float | None = None) -> None:
+        """Drop per-device histograms idle past the TTL; ``add`` also does this as results arrive."""
+        with self._lock:
+            self._evict_devices(time.monotonic() if now is None else now)
+
+    def drain_reachability(self) -> list[ProbeRecord]:
+        """Latest outcome per (device, protocol) since the previous drain."""
+        with self._lock:
+            pending, self._reachability = self._reachability, {}
+        return list(pending.values())
+
+    def requeue_reachability(self, records: Iterable[ProbeRecord]) -> None:
+        with self._lock:
+            for record in records:
+                self._reachability.setdefault((record.device_id, record.protocol), record)
+
+    def recent(self, limit: int = 100, device_id: str | None = None) -> list[dict[str, object]]:
+        with self._lock:
+            records = list(self._recent)
+        if device_id is not None:
+            records = [record for record in records if record.device_id == device_id]
+        return [asdict(record) for record in records[-limit:]]
+
+    def snapshot(self, device_id: str | None = None) -> dict[str, object]:
+        with self._lock:
+            protocols = {protocol: hist.summary() for protocol, hist in sorted(self._by_protocol.items())}
+            for (protocol, phase), hist in sorted(self._by_phase.items()):
+                summary = hist.summary()
+                protocols[protocol][phase] = {key: summary[key] for key in ("mean_ms", "p50_ms", "p99_ms")}
+            devices: dict[str, dict[str, object]] = {}
+            for (dev, protocol), (_, hist) in sorted(self._by_device.items()):
+                if device_id is None or dev == device_id:
+                    devices.setdefault(dev, {})[protocol] = hist.summary()
+            buffered = len(self._recent)
+        return {"buffered_results": buffered, "protocols": protocols, "devices": devices}
+
+    def render_prometheus(self, per_device: bool = False) -> str:
+        lines = [
+            "# HELP hub_probe_latency_ms Successful probe latency in milliseconds.",
+            "# TYPE hub_probe_latency_ms histogram",
+        ]
+        with self._lock:
+            protocols = sorted(self._by_protocol.items())
+            devices = sorted((key, hist) for key, (_, hist) in self._by_device.items()) if per_device else []
+            for protocol, hist in protocols:
+                lines.extend(hist.prometheus("hub_probe_latency_ms", f'protocol="{_escape(protocol)}"'))
+            lines.extend(
+                [
+                    "# HELP hub_probe_phase_latency_ms Handshake and first-response probe latency in milliseconds.",
+                    "# TYPE hub_probe_phase_latency_ms histogram",
+                ]
+            )
+            for (protocol, phase), hist in sorted(self._by_phase.items()):
+                labels = f'protocol="{_escape(protocol)}",phase="{phase}"'
+                lines.extend(hist.prometheus("hub_probe_phase_latency_ms", labels))
+            lines.extend(["# HELP hub_probe_total Probe outcomes.", "# TYPE hub_probe_total counter"])
+            for protocol, hist in protocols:
+                label = _escape(protocol)
+                lines.append(f'hub_probe_total{{protocol="{label}",outcome="success"}} {hist.successes}')
+                lines.append(f'hub_probe_total{{protocol="{label}",outcome="failure"}} {hist.failures}')
+            if devices:
+                lines.extend(
+                    [
+                        "# HELP hub_device_probe_latency_ms Successful probe latency per device in milliseconds.",
+                        "# TYPE hub_device_probe_latency_ms histogram",
+                    ]
+                )
+                for (device_id, protocol), hist in devices:
+                    labels = f'device_id="{_escape(device_id)}",protocol="{_escape(protocol)}"'
+                    lines.extend(hist.prometheus("hub_device_probe_latency_ms", labels))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Heap-based probe scheduler for the hub connection manager.
+
+Every (device, protocol) target keeps its own next-due time. New targets are
+spread uniformly across one base interval so probes trickle out instead of
+bursting, healthy targets are re-probed progressively less often, and failing
+targets back off exponentially.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import random
+from dataclasses import dataclass
+from typing import Generic, Hashable, Iterable, TypeVar
+
+HEALTHY_GROWTH = float(os.environ.get("HUB_PROBE_HEALTHY_GROWTH", "1.5"))
+MAX_HEALTHY_FACTOR = float(os.environ.get("HUB_PROBE_MAX_HEALTHY_FACTOR", "4"))
+MAX_BACKOFF = float(os.environ.get("HUB_PROBE_MAX_BACKOFF", "300"))
+JITTER = float(os.environ.get("HUB_PROBE_JITTER", "0.1"))
+
+T = TypeVar("T", bound=Hashable)
+
+
+@dataclass
+class TargetState(Generic[T]):
+    target: T
+    interval: float
+    due: float
+    entry: int = 0
+    successes: int = 0
+    failures: int = 0
+    in_flight: bool = False
+
+
+class ProbeScheduler(Generic[T]):
+    def __init__(
+        self,
+        base_interval: float,
+        *,
+        healthy_growth: float = HEALTHY_GROWTH,
+        max_healthy_factor: float = MAX_HEALTHY_FACTOR,
+        max_backoff: float = MAX_BACKOFF,
+        jitter: float = JITTER,
+        rng: random.Random | None = None,
+    ) -> None:
+        self.base_interval = base_interval
+        self.healthy_growth = healthy_growth
+        self.max_healthy = base_interval * max_healthy_factor
+        self.max_backoff = max(max_backoff, base_interval)
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        self._states: dict[T, TargetState[T]] = {}
+        self._heap: list[tuple[float, int, T]] = []
+        self._entries = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def _push(self, state: TargetState[T]) -> None:
+        state.entry = next(self._entries)
+        heapq.heappush(self._heap, (state.due, state.entry, state.target))
+
+    def sync(self, targets: Iterable[T], now: float) -> None:
+        """Track exactly ``targets``: new ones get a random offset within one interval."""
+        wanted = set(targets)
+        for target in list(self._states):
+            if target not in wanted:
+                del self._states[target]
+        for target in wanted:
+            if target not in self._states:
+                due = now + self.rng.uniform(0, self.base_interval)
+                state = TargetState(target, self.base_interval, due)
+                self._states[target] = state
+                self._push(state)
+
+    def next_due(self) -> float | None:
+        while self._heap:
+            due, entry, target = self._heap[0]
+            state = self._states.get(target)
+            if state is not None and state.entry == entry and not state.in_flight:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now: float) -> list[T]:
+        """Remove and return every target due at ``now``; they stay tracked until ``record``."""
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            _, entry, target = heapq.heappop(self._heap)
+            state = self._states.get(target)
+            if state is None or state.entry != entry or state.in_flight:
+                continue
+            state.in_flight = True
+            ready.append(target)
+        return ready
+
+    def release(self, target: T, now: float) -> None:
+        """Clear ``in_flight`` and re-queue ``target`` one base interval out, whatever its history."""
+        state = self._states.get(target)
+        if state is None:
+            return
+        state.in_flight = False
+        state.successes = state.failures = 0
+        state.interval = self.base_interval
+        state.due = now + self.base_interval
+        self._push(state)
+
+    def record(self, target: T, ok: bool, now: float) -> float | None:
+        """Reschedule ``target`` after a probe; returns the chosen interval."""
+        state = self._states.get(target)
+        if state is None:
+            return None
+        state.in_flight = False
+        # Grow the previous interval and clamp it rather than raising to the streak length,
+        # which overflows a float after a few thousand outcomes in a row.
+        if ok:
+            state.failures = 0
+            state.successes += 1
+            grown = state.interval * self.healthy_growth if state.successes > 1 else self.base_interval
+            interval = min(grown, self.max_healthy)
+        else:
+            state.successes = 0
+            state.failures += 1
+            grown = state.interval * 2 if state.failures > 1 else self.base_interval
+            interval = min(grown, self.max_backoff)
+        state.interval = interval
+        state.due = now + interval * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+        self._push(state)
+        return interval
@@ -1,46 +1,118 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import json
 import os
-import sqlite3
 import time
 from pathlib import Path
 from typing import List
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
+import registry_store
+from probe_metrics import ProbeRecord, ProbeResultStore
+from registry_store import (
+    ConnectionPool,
+    RegistrationBuffer,
+    changes_since,
+    current_version,
+    fetch_one,
+    query_devices,
+    registration_row,
+    update_reachability,
+)
+
 DB_PATH = Path(os.environ.get("REGISTRY_DB_PATH", "/data/hub_registry.db"))
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+MAX_BATCH_SIZE = int(os.environ.get("REGISTRY_MAX_BATCH", "5000"))
+FLUSH_INTERVAL = float(os.environ.get("REGISTRY_FLUSH_INTERVAL", "1.0"))
+MAX_PAGE_SIZE = int(os.environ.get("REGISTRY_MAX_PAGE", "5000"))
+STREAM_KEEPALIVE = float(os.environ.get("REGISTRY_STREAM_KEEPALIVE", "15"))
+METRICS_PER_DEVICE = os.environ.get("HUB_METRICS_PER_DEVICE", "false").lower() == "true"
 
 app = FastAPI(title="IoT Hub Registry")
+pool = ConnectionPool(DB_PATH)
+buffer = RegistrationBuffer(pool)
+probe_store = ProbeResultStore()
+_flush_task: asyncio.Task | None = None
+_feed_event = asyncio.Event()
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def log_event(event: str, **fields: object) -> None:
+    print(json.dumps({"event": event, **fields}), flush=True)
 
 
 def init_db() -> None:
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS devices (
-                device_id TEXT PRIMARY KEY,
-                device_type TEXT,
-                role TEXT,
-                ip_address TEXT,
-                protocols TEXT,
-                last_seen REAL,
-                firmware TEXT,
-                mac TEXT
-            )
-            """
-        )
-        # Ensure new columns exist when upgrading from older schema
-        for column in ("firmware", "mac"):
-            try:
-                conn.execute(f"ALTER TABLE devices ADD COLUMN {column} TEXT")
-            except sqlite3.OperationalError:
-                pass
-        conn.commit()
+    registry_store.init_db(pool)
+    buffer.prime()
+
+
+def flush_buffer() -> int:
+    try:
+        flushed = buffer.flush()
+    except Exception as exc:  # noqa: BLE001
+        log_event("registry_flush_error", error=str(exc), pending=buffer.pending())
+        return 0
+    if flushed:
+        _notify_feed()
+    return flushed
+
+
+def flush_reachability() -> int:
+    records = probe_store.drain_reachability()
+    if not records:
+        return 0
+    rows = [(r.device_id, r.protocol, r.ok, r.timestamp, r.latency_ms, r.error) for r in records]
+    try:
+        with pool.transaction() as conn:
+            update_reachability(conn, rows)
+    except Exception as exc:  # noqa: BLE001
+        probe_store.requeue_reachability(records)
+        log_event("registry_reachability_error", error=str(exc), pending=len(records))
+        return 0
+    return len(rows)
+
+
+def _wake_feed() -> None:
+    global _feed_event
+    _feed_event.set()
+    _feed_event = asyncio.Event()
+
+
+def _notify_feed() -> None:
+    """Wake /devices/stream readers after rows were committed.
+
+    Commits happen on worker threads (sync handlers, ``asyncio.to_thread``), so
+    the event is swapped on the loop rather than here.
+    """
+    if _loop is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_wake_feed)
+
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await asyncio.to_thread(flush_buffer)
+        await asyncio.to_thread(flush_reachability)
+        probe_store.expire()
+
+
+class ProbeReport(BaseModel):
+    device_id: str
+    protocol: str
+    host: str
+    port: int
+    ok: bool
+    latency_ms: float
+    timestamp: float
+    error: str = ""
+    handshake_ms: float | None = None
+    response_ms: float | None = None
 
 
 class Registration(BaseModel):
@@ -53,90 +125,216 @@ class Registration(BaseModel):
     mac: str | None = None
 
 
+def _row(payload: Registration, now: float) -> tuple:
+    return registration_row(
+        payload.device_id,
+        payload.device_type,
+        payload.role,
+        payload.ip_address,
+        payload.protocols,
+        now,
+        payload.firmware,
+        payload.mac,
+    )
+
+
 @app.on_event("startup")
 async def startup_event() -> None:
+    global _flush_task, _loop
+    _loop = asyncio.get_running_loop()
     init_db()
+    if FLUSH_INTERVAL > 0:
+        _flush_task = asyncio.create_task(_flush_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    if _flush_task is not None:
+        _flush_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _flush_task
+    flush_buffer()
+    flush_reachability()
+    pool.close()
+
+
+def _submit(rows: list[tuple]) -> None:
+    buffer.submit(rows)
+    # A non-positive interval disables write-behind: every request is written through.
+    if FLUSH_INTERVAL <= 0 and buffer.flush():
+        _notify_feed()
 
 
 @app.post("/register")
-async def register_device(payload: Registration) -> dict[str, str]:
-    now = time.time()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            INSERT INTO devices(device_id, device_type, role, ip_address, protocols, last_seen, firmware, mac)
-            VALUES(?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(device_id) DO UPDATE SET
-                device_type=excluded.device_type,
-                role=excluded.role,
-                ip_address=excluded.ip_address,
-                protocols=excluded.protocols,
-                last_seen=excluded.last_seen,
-                firmware=excluded.firmware,
-                mac=excluded.mac
-            """,
-            (
-                payload.device_id,
-                payload.device_type,
-                payload.role,
-                payload.ip_address,
-                json.dumps(payload.protocols),
-                now,
-                payload.firmware,
-                payload.mac,
-            ),
-        )
-        conn.commit()
+def register_device(payload: Registration) -> dict[str, str]:
+    _submit([_row(payload, time.time())])
     return {"status": "registered", "device_id": payload.device_id}
 
 
+@app.post("/register/batch")
+def register_batch(payloads: List[Registration]) -> dict[str, object]:
+    if len(payloads) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"batch exceeds {MAX_BATCH_SIZE} registrations")
+    now = time.time()
+    _submit([_row(payload, now) for payload in payloads])
+    return {"status": "registered", "count": len(payloads)}
+
+
 @app.get("/health")
 async def health() -> JSONResponse:
     return JSONResponse({"status": "ok"}, status_code=200)
 
 
-@app.get("/devices")
-async def list_devices() -> list[dict[str, object]]:
-    with sqlite3.connect(DB_PATH) as conn:
-        rows = conn.execute(
-            "SELECT device_id, device_type, role, ip_address, protocols, last_seen, firmware, mac FROM devices"
-        ).fetchall()
-    return [
-        {
-            "device_id": row[0],
-            "device_type": row[1],
-            "role": row[2],
-            "ip_address": row[3],
-            "protocols": json.loads(row[4]) if row[4] else [],
-            "last_seen": row[5],
-            "firmware": row[6],
-            "mac": row[7],
-        }
-        for row in rows
+@app.get("/registry/stats")
+async def registry_stats() -> dict[str, int]:
+    return buffer.stats()
+
+
+@app.post("/probes/results")
+def report_probes(reports: List[ProbeReport]) -> dict[str, int]:
+    """Ingest probe outcomes from connection managers; reachability is written on the next flush."""
+    accepted = probe_store.add(ProbeRecord(**report.model_dump()) for report in reports)
+    if FLUSH_INTERVAL <= 0:
+        flush_reachability()
+    return {"accepted": accepted}
+
+
+@app.get("/probes/stats")
+def probe_stats(device_id: str | None = None) -> dict[str, object]:
+    return probe_store.snapshot(device_id)
+
+
+@app.get("/probes/recent")
+def recent_probes(
+    limit: int = Query(default=100, ge=1, le=10000),
+    device_id: str | None = None,
+) -> list[dict[str, object]]:
+    return probe_store.recent(limit, device_id)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(per_device: bool = METRICS_PER_DEVICE) -> PlainTextResponse:
+    stats = buffer.stats()
+    registry_lines = [
+        "# TYPE hub_registry_devices gauge",
+        f"hub_registry_devices {stats['known_devices']}",
+        "# TYPE hub_registry_pending_writes gauge",
+        f"hub_registry_pending_writes {stats['pending_changes'] + stats['pending_last_seen']}",
     ]
+    body = probe_store.render_prometheus(per_device=per_device) + "\n".join(registry_lines) + "\n"
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
 
 
-@app.get("/devices/{device_id}")
-async def get_device(device_id: str) -> dict[str, object]:
-    with sqlite3.connect(DB_PATH) as conn:
-        row = conn.execute(
-            "SELECT device_id, device_type, role, ip_address, protocols, last_seen, firmware, mac FROM devices WHERE device_id=?",
-            (device_id,)
-        ).fetchone()
-    if row is None:
-        raise HTTPException(status_code=404, detail="device not found")
+@app.get("/devices")
+def list_devices(
+    response: Response,
+    device_type: List[str] = Query(default=[]),
+    role: List[str] = Query(default=[]),
+    protocol: str | None = None,
+    seen_after: float | None = None,
+    seen_before: float | None = None,
+    ip_prefix: str | None = None,
+    mac: str | None = None,
+    after: str | None = None,
+    limit: int | None = Query(default=None, ge=1),
+) -> list[dict[str, object]]:
+    """List devices, optionally filtered; ``after``/``limit`` page by device_id.
+
+    When a page is full the cursor for the next page is returned in the
+    ``X-Next-Cursor`` header, so unpaginated callers keep getting a plain list.
+    Reads never flush: new registrations show up after the next write-behind
+    flush, and ``last_seen`` (and the ``seen_*`` filters) use the in-memory value.
+    """
+    if limit is not None:
+        limit = min(limit, MAX_PAGE_SIZE)
+    # A stored last_seen lags memory by up to one persist interval plus a flush, so
+    # widen ``seen_after`` by that much in SQL and apply both bounds after the overlay.
+    lag = buffer.persist_after + max(FLUSH_INTERVAL, 0.0)
+    with pool.connection() as conn:
+        devices = query_devices(
+            conn,
+            device_types=device_type,
+            roles=role,
+            protocol=protocol,
+            seen_after=None if seen_after is None else seen_after - lag,
+            seen_before=seen_before,
+            ip_prefix=ip_prefix,
+            mac=mac,
+            after=after,
+            limit=limit,
+        )
+    if limit is not None and len(devices) == limit:
+        response.headers["X-Next-Cursor"] = str(devices[-1]["device_id"])
+    devices = buffer.overlay_last_seen(devices)
+    if seen_after is not None or seen_before is not None:
+        devices = [
+            device
+            for device in devices
+            if (seen_after is None or device["last_seen"] >= seen_after)
+            and (seen_before is None or device["last_seen"] < seen_before)
+        ]
+    return devices
+
+
+def _read_changes(since: int, limit: int) -> tuple[int, list[dict[str, object]]]:
+    with pool.connection() as conn:
+        return current_version(conn), changes_since(conn, since, limit)
+
+
+@app.get("/devices/changes")
+def device_changes(since: int = Query(default=0, ge=0), limit: int = Query(default=1000, ge=1)) -> dict[str, object]:
+    """Devices registered or changed after registry version ``since``.
+
+    Poll again with ``since`` set to the returned ``version``; ``more`` means
+    the page was truncated and the next call should follow immediately.
+    """
+    head, changes = _read_changes(since, min(limit, MAX_PAGE_SIZE))
+    version = changes[-1]["version"] if changes else max(since, head)
     return {
-        "device_id": row[0],
-        "device_type": row[1],
-        "role": row[2],
-        "ip_address": row[3],
-        "protocols": json.loads(row[4]) if row[4] else [],
-        "last_seen": row[5],
-        "firmware": row[6],
-        "mac": row[7],
+        "since": since,
+        "version": version,
+        "head": head,
+        "more": version < head,
+        "changes": buffer.overlay_last_seen(changes),
     }
 
 
+@app.get("/devices/stream")
+async def device_stream(
+    since: int | None = Query(default=None, ge=0),
+    last_event_id: str | None = Header(default=None),
+) -> StreamingResponse:
+    """Server-sent events: one ``device`` event per change, ``id`` is the registry version."""
+    if since is None:
+        since = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    async def events():
+        cursor = since
+        while True:
+            waiter = _feed_event
+            _, changes = await asyncio.to_thread(_read_changes, cursor, MAX_PAGE_SIZE)
+            for device in changes:
+                cursor = device["version"]
+                yield f"id: {cursor}\nevent: device\ndata: {json.dumps(device)}\n\n"
+            if len(changes) == MAX_PAGE_SIZE:
+                continue
+            try:
+                await asyncio.wait_for(waiter.wait(), timeout=STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/devices/{device_id}")
+def get_device(device_id: str) -> dict[str, object]:
+    with pool.connection() as conn:
+        device = fetch_one(conn, device_id)
+    if device is None:
+        raise HTTPException(status_code=404, detail="device not found")
+    return buffer.overlay_last_seen([device])[0]
+
+
 if __name__ == "__main__":
     import uvicorn
 
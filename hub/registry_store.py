@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+SQLite storage layer shared by the hub registry API and connection manager.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence
+
+from shard_ring import shard_key
+
+POOL_SIZE = int(os.environ.get("REGISTRY_POOL_SIZE", "4"))
+BUSY_TIMEOUT_MS = int(os.environ.get("REGISTRY_BUSY_TIMEOUT_MS", "5000"))
+LAST_SEEN_PERSIST_INTERVAL = float(os.environ.get("REGISTRY_LAST_SEEN_PERSIST", "300"))
+
+DEVICE_COLUMNS = (
+    "device_id",
+    "device_type",
+    "role",
+    "ip_address",
+    "protocols",
+    "last_seen",
+    "firmware",
+    "mac",
+    "version",
+    "reachable",
+    "last_probe",
+)
+
+UPSERT_DEVICE_SQL = """
+    INSERT INTO devices(
+        device_id, device_type, role, ip_address, protocols, last_seen, firmware, mac, version, shard_key
+    )
+    VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(device_id) DO UPDATE SET
+        device_type=excluded.device_type,
+        role=excluded.role,
+        ip_address=excluded.ip_address,
+        protocols=excluded.protocols,
+        last_seen=excluded.last_seen,
+        firmware=excluded.firmware,
+        mac=excluded.mac,
+        version=excluded.version
+"""
+
+UPDATE_LAST_SEEN_SQL = "UPDATE devices SET last_seen=? WHERE device_id=?"
+
+SELECT_DEVICES_SQL = f"SELECT {', '.join(DEVICE_COLUMNS)} FROM devices"
+
+PROTOCOL_PROBE_COLUMNS = (
+    ("reachable", "INTEGER"),
+    ("last_probe", "REAL"),
+    ("latency_ms", "REAL"),
+    ("probe_error", "TEXT"),
+)
+
+DEVICE_INDEXES = {
+    "idx_devices_type": "devices(device_type, device_id)",
+    "idx_devices_role": "devices(role, device_id)",
+    "idx_devices_last_seen": "devices(last_seen)",
+    "idx_devices_ip": "devices(ip_address)",
+    "idx_devices_mac": "devices(mac COLLATE NOCASE)",
+    "idx_devices_version": "devices(version)",
+    "idx_devices_shard": "devices(shard_key)",
+    "idx_device_protocols_device": "device_protocols(device_id)",
+}
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    # isolation_level=None leaves transaction control to ``transaction()`` so a
+    # batch is exactly one BEGIN/COMMIT (and one WAL fsync at most).
+    conn = sqlite3.connect(
+        db_path,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=256,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+class ConnectionPool:
+    """Fixed-size pool of long-lived WAL-mode connections to the registry database.
+
+    Connections are created once and handed out one caller at a time; sqlite3
+    keeps compiled statements per connection, so the upsert and select
+    statements stay prepared across requests.
+    """
+
+    def __init__(self, db_path: Path, size: int = POOL_SIZE) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.size = max(1, size)
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._all: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = _connect(self.db_path)
+                self._all.append(conn)
+                return conn
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                # A failed COMMIT (busy, deferred constraint) leaves the transaction
+                # open; never hand the connection back to the pool like that.
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+            self._idle = queue.LifoQueue()
+
+
+def init_db(pool: ConnectionPool) -> None:
+    with pool.transaction() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS devices (
+                device_id TEXT PRIMARY KEY,
+                device_type TEXT,
+                role TEXT,
+                ip_address TEXT,
+                protocols TEXT,
+                last_seen REAL,
+                firmware TEXT,
+                mac TEXT
+            )
+            """
+        )
+        # Ensure new columns exist when upgrading from older schema
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(devices)")}
+        for column in ("firmware", "mac"):
+            if column not in existing:
+                conn.execute(f"ALTER TABLE devices ADD COLUMN {column} TEXT")
+        if "version" not in existing:
+            conn.execute("ALTER TABLE devices ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        for column, kind in (("reachable", "INTEGER"), ("last_probe", "REAL"), ("shard_key", "INTEGER")):
+            if column not in existing:
+                conn.execute(f"ALTER TABLE devices ADD COLUMN {column} {kind}")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS device_protocols (
+                protocol TEXT NOT NULL,
+                device_id TEXT NOT NULL,
+                reachable INTEGER,
+                last_probe REAL,
+                latency_ms REAL,
+                probe_error TEXT,
+                PRIMARY KEY (protocol, device_id)
+            ) WITHOUT ROWID
+            """
+        )
+        create_worker_table(conn)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(device_protocols)")}
+        for column, kind in PROTOCOL_PROBE_COLUMNS:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE device_protocols ADD COLUMN {column} {kind}")
+        for name, target in DEVICE_INDEXES.items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        missing = [row[0] for row in conn.execute("SELECT device_id FROM devices WHERE shard_key IS NULL")]
+        conn.executemany(
+            "UPDATE devices SET shard_key=? WHERE device_id=?",
+            [(shard_key(device_id), device_id) for device_id in missing],
+        )
+        # Backfill the protocol table for databases created before it existed
+        if conn.execute("SELECT 1 FROM device_protocols LIMIT 1").fetchone() is None:
+            rows = conn.execute("SELECT device_id, protocols FROM devices WHERE protocols IS NOT NULL").fetchall()
+            _sync_protocols(conn, [(device_id, json.loads(protocols)) for device_id, protocols in rows])
+
+
+def registration_row(
+    device_id: str,
+    device_type: str,
+    role: str,
+    ip_address: str,
+    protocols: Sequence[str],
+    last_seen: float,
+    firmware: str | None,
+    mac: str | None,
+) -> tuple:
+    return (device_id, device_type, role, ip_address, json.dumps(list(protocols)), last_seen, firmware, mac)
+
+
+def _sync_protocols(conn: sqlite3.Connection, entries: Sequence[tuple[str, Sequence[str]]]) -> None:
+    """Make each device's protocol rows match its list, keeping the probe state of protocols it still has."""
+    conn.executemany(
+        "DELETE FROM device_protocols WHERE device_id=? AND protocol NOT IN (SELECT value FROM json_each(?))",
+        [(device_id, json.dumps(list(protocols))) for device_id, protocols in entries],
+    )
+    conn.executemany(
+        "INSERT INTO device_protocols(protocol, device_id) VALUES(?, ?) ON CONFLICT(protocol, device_id) DO NOTHING",
+        [(protocol, device_id) for device_id, protocols in entries for protocol in protocols],
+    )
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM devices").fetchone()[0]
+
+
+def upsert_devices(conn: sqlite3.Connection, rows: Iterable[tuple]) -> None:
+    """Upsert registration rows, stamping each with the next registry version.
+
+    Must run inside ``ConnectionPool.transaction()`` so reading the current
+    version and writing the new ones is atomic across writers.
+    """
+    rows = list(rows)
+    base = current_version(conn)
+    conn.executemany(
+        UPSERT_DEVICE_SQL,
+        [row + (base + offset, shard_key(row[0])) for offset, row in enumerate(rows, start=1)],
+    )
+    _sync_protocols(conn, [(row[0], json.loads(row[4]) if row[4] else []) for row in rows])
+
+
+def update_reachability(conn: sqlite3.Connection, results: Sequence[tuple[str, str, bool, float, float, str]]) -> None:
+    """Record probe outcomes given as (device_id, protocol, ok, timestamp, latency_ms, error).
+
+    A device counts as reachable while every protocol it was probed on last succeeded.
+    Reachability is operational state, so it does not bump the registry version.
+    """
+    conn.executemany(
+        """
+        UPDATE device_protocols SET reachable=?, last_probe=?, latency_ms=?, probe_error=?
+        WHERE protocol=? AND device_id=?
+        """,
+        [
+            (int(ok), ts, latency, error or None, protocol, device_id)
+            for device_id, protocol, ok, ts, latency, error in results
+        ],
+    )
+    devices = sorted({result[0] for result in results})
+    conn.executemany(
+        """
+        UPDATE devices SET
+            reachable=(SELECT MIN(reachable) FROM device_protocols WHERE device_id=devices.device_id),
+            last_probe=(SELECT MAX(last_probe) FROM device_protocols WHERE device_id=devices.device_id)
+        WHERE device_id=?
+        """,
+        [(device_id,) for device_id in devices],
+    )
+
+
+def row_to_device(row: Sequence[object]) -> dict[str, object]:
+    return {
+        "device_id": row[0],
+        "device_type": row[1],
+        "role": row[2],
+        "ip_address": row[3],
+        "protocols": json.loads(row[4]) if row[4] else [],
+        "last_seen": row[5],
+        "firmware": row[6],
+        "mac": row[7],
+        "version": row[8],
+        "reachable": None if row[9] is None else bool(row[9]),
+        "last_probe": row[10],
+    }
+
+
+def fetch_all(conn: sqlite3.Connection) -> list[dict[str, object]]:
+    return [row_to_device(row) for row in conn.execute(SELECT_DEVICES_SQL)]
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def query_devices(
+    conn: sqlite3.Connection,
+    *,
+    device_types: Sequence[str] = (),
+    roles: Sequence[str] = (),
+    protocol: str | None = None,
+    seen_after: float | None = None,
+    seen_before: float | None = None,
+    ip_prefix: str | None = None,
+    mac: str | None = None,
+    after: str | None = None,
+    limit: int | None = None,
+) -> list[dict[str, object]]:
+    """Filtered device listing ordered by device_id with keyset pagination via ``after``."""
+    columns = ", ".join(f"d.{column}" for column in DEVICE_COLUMNS)
+    sql = f"SELECT {columns} FROM devices d"
+    clauses: list[str] = []
+    params: list[object] = []
+    if protocol:
+        sql += " JOIN device_protocols p ON p.device_id = d.device_id AND p.protocol = ?"
+        params.append(protocol)
+    if device_types:
+        clauses.append(f"d.device_type IN ({', '.join('?' * len(device_types))})")
+        params.extend(device_types)
+    if roles:
+        clauses.append(f"d.role IN ({', '.join('?' * len(roles))})")
+        params.extend(roles)
+    if seen_after is not None:
+        clauses.append("d.last_seen >= ?")
+        params.append(seen_after)
+    if seen_before is not None:
+        clauses.append("d.last_seen < ?")
+        params.append(seen_before)
+    if ip_prefix:
+        clauses.append("d.ip_address >= ? AND d.ip_address < ?")
+        params.extend((ip_prefix, _prefix_upper_bound(ip_prefix)))
+    if mac:
+        clauses.append("d.mac = ? COLLATE NOCASE")
+        params.append(mac)
+    if after is not None:
+        clauses.append("d.device_id > ?")
+        params.append(after)
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY d.device_id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return [row_to_device(row) for row in conn.execute(sql, params)]
+
+
+def changes_since(conn: sqlite3.Connection, since: int, limit: int | None = None) -> list[dict[str, object]]:
+    """Devices whose registry version is newer than ``since``, oldest change first."""
+    sql = f"{SELECT_DEVICES_SQL} WHERE version > ? ORDER BY version"
+    params: list[object] = [since]
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return [row_to_device(row) for row in conn.execute(sql, params)]
+
+
+def changes_in_ranges(
+    conn: sqlite3.Connection, ranges: Sequence[tuple[int, int]], since: int = 0
+) -> tuple[int, list[dict[str, object]]]:
+    """Return (head version, devices changed after ``since`` whose shard_key is in ``ranges``).
+
+    Both come from one read snapshot, so a caller that resumes from the returned
+    head never misses a write that raced the query.
+    """
+    if not ranges:
+        return current_version(conn), []
+    in_ranges = " OR ".join("shard_key BETWEEN ? AND ?" for _ in ranges)
+    params: list[object] = [bound for span in ranges for bound in span]
+    sql = f"{SELECT_DEVICES_SQL} WHERE ({in_ranges})"
+    if since:
+        sql += " AND version > ?"
+        params.append(since)
+    conn.execute("BEGIN")
+    try:
+        head = current_version(conn)
+        devices = [row_to_device(row) for row in conn.execute(sql + " ORDER BY version", params)]
+    finally:
+        conn.execute("COMMIT")
+    return head, devices
+
+
+def create_worker_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS probe_workers (
+            worker_id TEXT PRIMARY KEY,
+            heartbeat REAL NOT NULL,
+            pid INTEGER
+        )
+        """
+    )
+
+
+def heartbeat_worker(conn: sqlite3.Connection, worker_id: str, now: float, ttl: float, pid: int) -> list[str]:
+    """Refresh ``worker_id``'s heartbeat and return every worker seen within ``ttl`` seconds."""
+    conn.execute(
+        "INSERT INTO probe_workers(worker_id, heartbeat, pid) VALUES(?, ?, ?) "
+        "ON CONFLICT(worker_id) DO UPDATE SET heartbeat=excluded.heartbeat, pid=excluded.pid",
+        (worker_id, now, pid),
+    )
+    rows = conn.execute("SELECT worker_id FROM probe_workers WHERE heartbeat >= ? ORDER BY worker_id", (now - ttl,))
+    return [row[0] for row in rows]
+
+
+def remove_worker(conn: sqlite3.Connection, worker_id: str) -> None:
+    conn.execute("DELETE FROM probe_workers WHERE worker_id=?", (worker_id,))
+
+
+def fetch_one(conn: sqlite3.Connection, device_id: str) -> dict[str, object] | None:
+    row = conn.execute(f"{SELECT_DEVICES_SQL} WHERE device_id=?", (device_id,)).fetchone()
+    return row_to_device(row) if row is not None else None
+
+
+def _identity(row: Sequence[object]) -> tuple:
+    # Everything that describes the device except last_seen (index 5) and version.
+    return tuple(row[1:5]) + tuple(row[6:8])
+
+
+class RegistrationBuffer:
+    """Write-behind buffer that coalesces registrations before they reach SQLite.
+
+    A registration whose identity columns (everything except ``last_seen``)
+    match what is already stored is absorbed in memory; only new or changed
+    devices are queued for the next flush. ``last_seen`` is tracked in memory
+    and written back in a narrow batched UPDATE once the stored value is older
+    than ``persist_after`` seconds, so steady-state heartbeats cost no I/O.
+    """
+
+    def __init__(self, pool: ConnectionPool, persist_after: float = LAST_SEEN_PERSIST_INTERVAL) -> None:
+        self.pool = pool
+        self.persist_after = persist_after
+        self._lock = threading.Lock()
+        self._identity: dict[str, tuple] = {}
+        self._last_seen: dict[str, float] = {}
+        self._persisted: dict[str, float] = {}
+        self._dirty: dict[str, tuple] = {}
+        self._touched: dict[str, float] = {}
+        self.absorbed = 0
+        self.flushed_rows = 0
+
+    def prime(self) -> None:
+        with self.pool.connection() as conn:
+            rows = conn.execute(SELECT_DEVICES_SQL).fetchall()
+        with self._lock:
+            for row in rows:
+                device_id, last_seen = row[0], row[5] or 0.0
+                self._identity[device_id] = _identity(row)
+                self._last_seen[device_id] = last_seen
+                self._persisted[device_id] = last_seen
+
+    def submit(self, rows: Iterable[tuple]) -> int:
+        """Queue registration rows; returns how many changed a device's identity."""
+        changed = 0
+        with self._lock:
+            for row in rows:
+                device_id, last_seen = row[0], row[5]
+                identity = _identity(row)
+                self._last_seen[device_id] = last_seen
+                if self._identity.get(device_id) != identity:
+                    self._identity[device_id] = identity
+                    self._dirty[device_id] = row
+                    self._touched.pop(device_id, None)
+                    changed += 1
+                elif device_id in self._dirty:
+                    self._dirty[device_id] = row
+                elif last_seen - self._persisted.get(device_id, 0.0) >= self.persist_after:
+                    self._touched[device_id] = last_seen
+                else:
+                    self.absorbed += 1
+        return changed
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._dirty) + len(self._touched)
+
+    def flush(self) -> int:
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            touched, self._touched = self._touched, {}
+        if not dirty and not touched:
+            return 0
+        try:
+            with self.pool.transaction() as conn:
+                upsert_devices(conn, dirty.values())
+                conn.executemany(UPDATE_LAST_SEEN_SQL, [(ts, device_id) for device_id, ts in touched.items()])
+        except Exception:
+            with self._lock:
+                for device_id, row in dirty.items():
+                    self._dirty.setdefault(device_id, row)
+                for device_id, ts in touched.items():
+                    if device_id not in self._dirty:
+                        self._touched.setdefault(device_id, ts)
+            raise
+        with self._lock:
+            for device_id, row in dirty.items():
+                self._persisted[device_id] = row[5]
+            self._persisted.update(touched)
+        written = len(dirty) + len(touched)
+        self.flushed_rows += written
+        return written
+
+    def overlay_last_seen(self, devices: list[dict[str, object]]) -> list[dict[str, object]]:
+        with self._lock:
+            for device in devices:
+                last_seen = self._last_seen.get(device["device_id"])
+                if last_seen is not None and last_seen > (device["last_seen"] or 0.0):
+                    device["last_seen"] = last_seen
+        return devices
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "known_devices": len(self._identity),
+                "pending_changes": len(self._dirty),
+                "pending_last_seen": len(self._touched),
+                "absorbed": self.absorbed,
+                "flushed_rows": self.flushed_rows,
+            }
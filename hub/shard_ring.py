@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Consistent-hash ring that splits the device registry between probe workers.
+
+Every worker owns ``vnodes`` points on a 63-bit ring and a device belongs to
+the first point at or after its ``shard_key``. The key is stored next to each
+device so a worker can read only its own key ranges, and a worker joining or
+leaving moves only the devices adjacent to its points.
+"""
+
+from __future__ import annotations
+
+import bisect
+import hashlib
+import os
+from typing import Iterable
+
+KEY_MAX = (1 << 63) - 1
+VNODES = int(os.environ.get("HUB_SHARD_VNODES", "128"))
+
+
+def shard_key(value: str) -> int:
+    """Stable 63-bit hash of ``value`` (fits a signed SQLite INTEGER)."""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big") >> 1
+
+
+class HashRing:
+    def __init__(self, workers: Iterable[str] = (), vnodes: int = VNODES) -> None:
+        self.vnodes = max(1, vnodes)
+        self.workers = tuple(sorted(set(workers)))
+        points = sorted(
+            (shard_key(f"{worker}#{index}"), worker) for worker in self.workers for index in range(self.vnodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [worker for _, worker in points]
+
+    def __len__(self) -> int:
+        return len(self.workers)
+
+    def owner(self, key: int) -> str | None:
+        if not self._points:
+            return None
+        return self._owners[bisect.bisect_left(self._points, key) % len(self._points)]
+
+    def owner_of(self, device_id: str) -> str | None:
+        return self.owner(shard_key(device_id))
+
+    def ranges(self, worker: str) -> list[tuple[int, int]]:
+        """Inclusive ``(low, high)`` key ranges owned by ``worker``, sorted and merged."""
+        spans: list[tuple[int, int]] = []
+        previous = -1
+        for point, owner in zip(self._points, self._owners):
+            if owner == worker:
+                spans.append((previous + 1, point))
+            previous = point
+        if self._owners and self._owners[0] == worker and previous < KEY_MAX:
+            spans.append((previous + 1, KEY_MAX))
+        merged: list[tuple[int, int]] = []
+        for low, high in spans:
+            if merged and merged[-1][1] + 1 >= low:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+            else:
+                merged.append((low, high))
+        return merged
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Minimal asyncio SNMPv2c GET client for the hub prober.
+
+A single UDP socket carries every outstanding request; responses are matched
+back to their waiter by request-id, so thousands of agents can be polled
+concurrently without building a pysnmp engine per GET.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import random
+import socket
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+SYS_DESCR_OID = "1.3.6.1.2.1.1.1.0"
+RECV_BUFFER_BYTES = int(os.environ.get("HUB_SNMP_RCVBUF", str(4 * 1024 * 1024)))
+MAX_IN_FLIGHT = int(os.environ.get("HUB_SNMP_MAX_IN_FLIGHT", "1024"))
+
+_SEQUENCE = 0x30
+_INTEGER = 0x02
+_OCTET_STRING = 0x04
+_NULL = 0x05
+_OID = 0x06
+_GET_REQUEST = 0xA0
+_GET_RESPONSE = 0xA2
+_EXCEPTIONS = {0x80: "noSuchObject", 0x81: "noSuchInstance", 0x82: "endOfMibView"}
+_ERROR_STATUS = {
+    1: "tooBig",
+    2: "noSuchName",
+    3: "badValue",
+    4: "readOnly",
+    5: "genErr",
+    6: "noAccess",
+}
+
+
+class SnmpError(Exception):
+    pass
+
+
+@dataclass
+class SnmpResponse:
+    host: str
+    port: int
+    oid: str
+    value: str
+    rtt_ms: float
+
+
+def _encode_length(length: int) -> bytes:
+    if length < 0x80:
+        return bytes([length])
+    body = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes([0x80 | len(body)]) + body
+
+
+def _tlv(tag: int, payload: bytes) -> bytes:
+    return bytes([tag]) + _encode_length(len(payload)) + payload
+
+
+def _encode_integer(value: int) -> bytes:
+    return _tlv(_INTEGER, value.to_bytes(max(1, (value.bit_length() + 8) // 8), "big", signed=True))
+
+
+def _encode_oid(oid: str) -> bytes:
+    arcs = [int(arc) for arc in oid.strip(".").split(".")]
+    body = bytearray([arcs[0] * 40 + arcs[1]])
+    for arc in arcs[2:]:
+        chunk = [arc & 0x7F]
+        arc >>= 7
+        while arc:
+            chunk.append(0x80 | (arc & 0x7F))
+            arc >>= 7
+        body.extend(reversed(chunk))
+    return _tlv(_OID, bytes(body))
+
+
+def encode_get(request_id: int, community: bytes, oid: str) -> bytes:
+    varbind = _tlv(_SEQUENCE, _encode_oid(oid) + b"\x05\x00")
+    pdu = _tlv(
+        _GET_REQUEST,
+        _encode_integer(request_id) + _encode_integer(0) + _encode_integer(0) + _tlv(_SEQUENCE, varbind),
+    )
+    return _tlv(_SEQUENCE, _encode_integer(1) + _tlv(_OCTET_STRING, community) + pdu)
+
+
+def _read_tlv(data: bytes, offset: int) -> tuple[int, int, int]:
+    """Return (tag, value_start, value_end) for the TLV at ``offset``."""
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        count = length & 0x7F
+        length = int.from_bytes(data[offset : offset + count], "big")
+        offset += count
+    end = offset + length
+    if end > len(data):
+        raise SnmpError("truncated message")
+    return tag, offset, end
+
+
+def _decode_oid(body: bytes) -> str:
+    arcs = [body[0] // 40, body[0] % 40]
+    value = 0
+    for byte in body[1:]:
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            arcs.append(value)
+            value = 0
+    return ".".join(str(arc) for arc in arcs)
+
+
+def _decode_value(tag: int, body: bytes) -> str:
+    if tag == _OCTET_STRING:
+        return body.decode(errors="replace")
+    if tag == _OID:
+        return _decode_oid(body)
+    if tag in _EXCEPTIONS:
+        raise SnmpError(_EXCEPTIONS[tag])
+    if tag == _NULL:
+        return ""
+    # INTEGER and the unsigned application types (Counter32, Gauge32, TimeTicks, Counter64)
+    return str(int.from_bytes(body, "big", signed=tag == _INTEGER))
+
+
+def decode_response(data: bytes) -> tuple[int, int, str, int, bytes]:
+    """Parse a GetResponse into (request_id, error_status, oid, value_tag, value_bytes)."""
+    _, start, _ = _read_tlv(data, 0)
+    _, _, offset = _read_tlv(data, start)  # version
+    _, _, offset = _read_tlv(data, offset)  # community
+    tag, offset, _ = _read_tlv(data, offset)
+    if tag != _GET_RESPONSE:
+        raise SnmpError(f"unexpected PDU 0x{tag:02x}")
+    _, start, offset = _read_tlv(data, offset)
+    request_id = int.from_bytes(data[start:offset], "big", signed=True)
+    _, start, offset = _read_tlv(data, offset)
+    error_status = int.from_bytes(data[start:offset], "big")
+    _, _, offset = _read_tlv(data, offset)  # error-index
+    _, offset, _ = _read_tlv(data, offset)  # varbind list
+    _, offset, _ = _read_tlv(data, offset)  # first varbind
+    _, start, offset = _read_tlv(data, offset)
+    oid = _decode_oid(data[start:offset])
+    tag, start, end = _read_tlv(data, offset)
+    return request_id, error_status, oid, tag, data[start:end]
+
+
+class SnmpGetClient(asyncio.DatagramProtocol):
+    """Shared SNMPv2c GET engine: one socket, many in-flight requests keyed by request-id."""
+
+    def __init__(self, community: str = "public", max_in_flight: int = MAX_IN_FLIGHT) -> None:
+        self.community = community.encode()
+        self.transport: asyncio.DatagramTransport | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(random.randint(1, 1 << 24))
+        self._window = asyncio.Semaphore(max(1, max_in_flight))
+        self.last_rtt_ms: dict[tuple[str, int], float] = {}
+
+    @classmethod
+    async def open(cls, community: str = "public", max_in_flight: int = MAX_IN_FLIGHT) -> "SnmpGetClient":
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
+        sock.bind(("0.0.0.0", 0))
+        sock.setblocking(False)
+        _, client = await loop.create_datagram_endpoint(lambda: cls(community, max_in_flight), sock=sock)
+        return client
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore[assignment]
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        try:
+            response = decode_response(data)
+        except (SnmpError, IndexError, ValueError):
+            return
+        future = self._pending.pop(response[0], None)
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def error_received(self, exc: Exception) -> None:
+        return
+
+    def close(self) -> None:
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        if self.transport is not None:
+            self.transport.close()
+
+    async def get(self, host: str, port: int, oid: str = SYS_DESCR_OID, timeout: float = 2.0) -> SnmpResponse:
+        if self.transport is None:
+            raise SnmpError("client is not open")
+        async with self._window:
+            request_id = next(self._ids) & 0x7FFFFFFF
+            future = asyncio.get_running_loop().create_future()
+            self._pending[request_id] = future
+            start = time.perf_counter()
+            try:
+                self.transport.sendto(encode_get(request_id, self.community, oid), (host, port))
+                _, error_status, resp_oid, tag, body = await asyncio.wait_for(future, timeout)
+            finally:
+                self._pending.pop(request_id, None)
+        rtt_ms = (time.perf_counter() - start) * 1000
+        self.last_rtt_ms[(host, port)] = rtt_ms
+        if error_status:
+            raise SnmpError(_ERROR_STATUS.get(error_status, f"errorStatus={error_status}"))
+        return SnmpResponse(host, port, resp_oid, _decode_value(tag, body), rtt_ms)
+
+    async def get_many(
+        self,
+        targets: Iterable[tuple[str, int]],
+        oid: str = SYS_DESCR_OID,
+        timeout: float = 2.0,
+    ) -> list[SnmpResponse | BaseException]:
+        """GET ``oid`` from every target concurrently; failures are returned in place."""
+        return await asyncio.gather(
+            *(self.get(host, port, oid, timeout) for host, port in targets),
+            return_exceptions=True,
+        )
@@ -2,36 +2,98 @@
 from __future__ import annotations
 
 import json
+import os
+import threading
+from collections import deque
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import List
+from typing import Deque, List
 
 DATA_DIR = Path("/data/logs")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE = DATA_DIR / "events.log"
+RING_SIZE = int(os.environ.get("LOGSHIPPER_RING_SIZE", "1000"))
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def read_tail(path: Path, limit: int, block_size: int = TAIL_BLOCK_SIZE) -> List[dict]:
+    """Last ``limit`` parseable entries of ``path``, read backwards block by block.
+
+    Only the blocks holding those entries are read, so the cost follows
+    ``limit`` rather than the file size. Blank and malformed lines are skipped.
+    """
+    if limit <= 0:
+        return []
+    try:
+        fh = path.open("rb")
+    except FileNotFoundError:
+        return []
+    newest_first: List[dict] = []
+    with fh:
+        position = fh.seek(0, os.SEEK_END)
+        partial = b""  # start of the line that straddles the previous block boundary
+        while position > 0 and len(newest_first) < limit:
+            size = min(block_size, position)
+            position -= size
+            fh.seek(position)
+            lines = (fh.read(size) + partial).split(b"\n")
+            partial = lines.pop(0) if position > 0 else b""
+            for line in reversed(lines):
+                if len(newest_first) >= limit:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    newest_first.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    newest_first.reverse()
+    return newest_first
+
+
+class LogRing:
+    """The most recent ingested entries, so GET /logs never has to read events.log.
+
+    The ring is primed once from the end of the file (an existing log after a
+    restart) and then fed by ``append_log``; tails longer than the ring fall
+    back to ``read_tail``.
+    """
+
+    def __init__(self, size: int = RING_SIZE) -> None:
+        self.entries: Deque[dict] = deque(maxlen=max(1, size))
+        self.primed = False
+        self.lock = threading.Lock()
+
+    def prime(self, path: Path) -> None:
+        # caller holds self.lock
+        if not self.primed:
+            self.entries.extend(read_tail(path, self.entries.maxlen or 0))
+            self.primed = True
+
+    def tail(self, path: Path, limit: int) -> List[dict]:
+        if limit > (self.entries.maxlen or 0):
+            return read_tail(path, limit)
+        with self.lock:
+            self.prime(path)
+            entries = list(self.entries)
+        return entries[-limit:] if limit > 0 else []
+
+
+RECENT = LogRing()
 
 
 def append_log(entry: dict) -> None:
-    with LOG_FILE.open("a") as fh:
-        fh.write(json.dumps(entry) + "\n")
+    # The lock keeps file order and ring order identical and stops concurrent
+    # ingest threads from interleaving partial lines.
+    with RECENT.lock:
+        RECENT.prime(LOG_FILE)
+        with LOG_FILE.open("a") as fh:
+            fh.write(json.dumps(entry) + "\n")
+        RECENT.entries.append(entry)
     print(json.dumps({"event": "log_ingest", **entry}), flush=True)
 
 
 def tail_logs(limit: int = 100) -> List[dict]:
-    if not LOG_FILE.exists():
-        return []
-    with LOG_FILE.open() as fh:
-        lines = fh.readlines()[-limit:]
-    out = []
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            out.append(json.loads(line))
-        except json.JSONDecodeError:
-            continue
-    return out
+    return RECENT.tail(LOG_FILE, limit)
 
 
 class LogHandler(BaseHTTPRequestHandler):
@@ -72,6 +134,7 @@ class LogHandler(BaseHTTPRequestHandler):
 
 
 def main() -> None:
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
     server = ThreadingHTTPServer(("0.0.0.0", 9300), LogHandler)
     print('{"event":"logshipper_listen","port":9300}', flush=True)
     server.serve_forever()
@@ -9,6 +9,8 @@ from typing import Any, Dict, List
 
 from fastapi import FastAPI
 
+from server.logshipper import read_tail
+
 app = FastAPI(title="IoT Emulator Status API")
 
 LOG_FILE = Path("/data/logs/events.log")
@@ -16,20 +18,7 @@ MAPPINGS_FILE = Path("/data/mappings.json")
 
 
 def read_logs(limit: int = 200) -> List[Dict[str, Any]]:
-    if not LOG_FILE.exists():
-        return []
-    with LOG_FILE.open() as fh:
-        lines = fh.readlines()[-limit:]
-    results = []
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            results.append(json.loads(line))
-        except json.JSONDecodeError:
-            continue
-    return results
+    return read_tail(LOG_FILE, limit)
 
 
 def protocol_summary(logs: List[Dict[str, Any]]) -> Dict[str, int]:
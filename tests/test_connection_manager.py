@@ -0,0 +1,297 @@
+import asyncio
+import socket
+import sys
+from pathlib import Path
+
+import pytest
+
+HUB_DIR = Path(__file__).resolve().parents[1] / "hub"
+if str(HUB_DIR) not in sys.path:
+    sys.path.insert(0, str(HUB_DIR))
+
+import connection_manager  # noqa: E402
+from connection_manager import ProbeTarget, iter_targets, sweep  # noqa: E402
+from snmp_client import SnmpGetClient, SnmpResponse  # noqa: E402
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_iter_targets_maps_known_protocols():
+    devices = [{"device_id": "plc1", "ip_address": "10.0.0.1", "protocols": ["ModbusTCP", "HTTP"]}]
+    assert [(t.protocol, t.port) for t in iter_targets(devices)] == [
+        ("ModbusTCP", connection_manager.PROTOCOL_PORTS["ModbusTCP"])
+    ]
+
+
+async def _rtsp_once(reader, writer):
+    """Answer one RTSP request and hang up, like devices/scripts/camera_rtsp.py."""
+    await reader.readuntil(b"\r\n\r\n")
+    writer.write(b"RTSP/1.0 200 OK\r\nCSeq: 1\r\n\r\n")
+    await writer.drain()
+    writer.close()
+
+
+def test_sweep_probes_concurrently_and_reports_stats(capsys):
+    async def scenario():
+        server = await asyncio.start_server(_rtsp_once, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        closed = _closed_port()
+        targets = [ProbeTarget(f"dev{i}", "127.0.0.1", port, "RTSP") for i in range(200)]
+        targets.append(ProbeTarget("down", "127.0.0.1", closed, "IPP"))
+        async with server:
+            return await sweep(targets, concurrency=50)
+
+    stats = asyncio.run(scenario())
+    assert stats["targets"] == 201
+    assert stats["succeeded"] == 200
+    assert stats["protocols"]["IPP"]["failed"] == 1
+    assert stats["protocols"]["RTSP"]["probes"] == 200
+    assert stats["protocols"]["RTSP"]["response_p50_ms"] > 0
+    assert "hub_probe_failed" in capsys.readouterr().out
+
+
+class _SysDescrAgent(asyncio.DatagramProtocol):
+    """Tiny SNMPv2c agent built on pysnmp's codec, answering every GET with sysDescr."""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        from pyasn1.codec.ber import decoder, encoder
+        from pysnmp.proto import api
+
+        pmod = api.protoModules[api.protoVersion2c]
+        request, _ = decoder.decode(data, asn1Spec=pmod.Message())
+        response = pmod.apiMessage.getResponse(request)
+        pdu = pmod.apiMessage.getPDU(response)
+        varbinds = pmod.apiPDU.getVarBinds(pmod.apiMessage.getPDU(request))
+        pmod.apiPDU.setVarBinds(pdu, [(oid, pmod.OctetString(f"agent {addr[1]}")) for oid, _ in varbinds])
+        self.transport.sendto(encoder.encode(response), addr)
+
+
+def test_shared_snmp_client_matches_responses_by_request_id():
+    pytest.importorskip("pysnmp")
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        agents = [await loop.create_datagram_endpoint(_SysDescrAgent, local_addr=("127.0.0.1", 0)) for _ in range(4)]
+        ports = [transport.get_extra_info("sockname")[1] for transport, _ in agents]
+        client = await SnmpGetClient.open()
+        try:
+            responses = await client.get_many([("127.0.0.1", ports[i % 4]) for i in range(400)])
+            timeouts = await client.get_many([("127.0.0.1", _closed_port())], timeout=0.2)
+        finally:
+            client.close()
+            for transport, _ in agents:
+                transport.close()
+        return ports, responses, timeouts
+
+    ports, responses, timeouts = asyncio.run(scenario())
+    assert all(isinstance(response, SnmpResponse) for response in responses)
+    assert [response.port for response in responses[:4]] == ports
+    assert responses[0].oid == "1.3.6.1.2.1.1.1.0"
+    assert responses[0].value.startswith("agent ")
+    assert isinstance(timeouts[0], asyncio.TimeoutError)
+
+
+def test_scheduler_spreads_targets_and_adapts_intervals():
+    import random
+
+    from probe_scheduler import ProbeScheduler
+
+    scheduler = ProbeScheduler(
+        20.0, healthy_growth=2.0, max_healthy_factor=4, max_backoff=120, jitter=0.0, rng=random.Random(7)
+    )
+    scheduler.sync([f"t{i}" for i in range(100)], now=0.0)
+    first_half = scheduler.pop_due(10.0)
+    assert 30 < len(first_half) < 70
+    assert len(scheduler.pop_due(20.0)) == 100 - len(first_half)
+    assert scheduler.pop_due(20.0) == []
+
+    assert [scheduler.record("t0", True, 0.0) for _ in range(4)] == [20.0, 40.0, 80.0, 80.0]
+    assert [scheduler.record("t1", False, 0.0) for _ in range(5)] == [20.0, 40.0, 80.0, 120.0, 120.0]
+    assert scheduler.record("t1", True, 0.0) == 20.0
+
+    scheduler.sync(["t0"], now=0.0)
+    assert len(scheduler) == 1
+    assert scheduler.next_due() == 80.0
+
+
+def test_scheduler_survives_long_streaks():
+    from probe_scheduler import ProbeScheduler
+
+    scheduler = ProbeScheduler(30.0, healthy_growth=1.5, max_healthy_factor=4, max_backoff=300, jitter=0.0)
+    scheduler.sync(["up", "down"], now=0.0)
+    for step in range(5000):
+        now = float(step)
+        assert set(scheduler.pop_due(now + 10_000)) == {"up", "down"}
+        assert scheduler.record("up", True, now) <= 120.0
+        assert scheduler.record("down", False, now) <= 300.0
+    assert scheduler.record("up", True, 0.0) == 120.0 and scheduler.record("down", False, 0.0) == 300.0
+    assert scheduler.record("down", True, 0.0) == 30.0
+
+
+def test_hash_ring_covers_key_space_and_moves_few_keys_on_join():
+    from shard_ring import KEY_MAX, HashRing
+
+    ring = HashRing([f"probe-{i}" for i in range(4)])
+    spans = sorted(span for worker in ring.workers for span in ring.ranges(worker))
+    assert spans[0][0] == 0 and spans[-1][1] == KEY_MAX
+    assert all(prev[1] + 1 == cur[0] for prev, cur in zip(spans, spans[1:]))
+
+    device_ids = [f"dev{i}" for i in range(4000)]
+    owners = {device_id: ring.owner_of(device_id) for device_id in device_ids}
+    counts = [list(owners.values()).count(worker) for worker in ring.workers]
+    assert max(counts) < 1.3 * len(device_ids) / 4
+
+    grown = HashRing([*ring.workers, "probe-4"])
+    moved = [device_id for device_id in device_ids if grown.owner_of(device_id) != owners[device_id]]
+    assert all(grown.owner_of(device_id) == "probe-4" for device_id in moved)
+    assert 0.1 < len(moved) / len(device_ids) < 0.3
+
+
+def test_sharded_workers_read_disjoint_slices_and_rebalance(tmp_path, monkeypatch):
+    from registry_store import ConnectionPool, init_db, registration_row, remove_worker, upsert_devices
+
+    db_path = tmp_path / "registry.db"
+    pool = ConnectionPool(db_path, size=1)
+    init_db(pool)
+    rows = [
+        registration_row(f"dev{i}", "CAMERA_RTSP", "server", "10.0.0.1", ["RTSP"], 1.0, None, None) for i in range(300)
+    ]
+    with pool.transaction() as conn:
+        upsert_devices(conn, rows)
+
+    def fetch_as(worker_id):
+        monkeypatch.setattr(connection_manager, "WORKER_ID", worker_id)
+        monkeypatch.setattr(connection_manager, "_devices", {})
+        monkeypatch.setattr(connection_manager, "_version", 0)
+        monkeypatch.setattr(connection_manager, "_ring", None)
+        return {device["device_id"] for device in connection_manager.fetch_devices()}
+
+    monkeypatch.setattr(connection_manager, "DB_PATH", db_path)
+    monkeypatch.setattr(connection_manager, "_pool", None)
+    alone = fetch_as("probe-a")
+    assert len(alone) == 300
+    second = fetch_as("probe-b")
+    first = fetch_as("probe-a")
+    assert first | second == alone and not first & second
+    assert 50 < len(first) < 250
+
+    with pool.connection() as conn:
+        remove_worker(conn, "probe-b")
+    assert {device["device_id"] for device in connection_manager.fetch_devices()} == alone
+
+
+def test_probe_shards_cover_registry_across_workers():
+    """Correctness only: throughput scaling is checked by bench_probe_shards.py --min-efficiency."""
+    sys.path.insert(0, str(HUB_DIR.parent / "benchmarks"))
+    import bench_probe_shards
+
+    results = bench_probe_shards.run(1000, [1, 2], 1, rounds=1, concurrency=64)
+    assert [result["workers"] for result in results] == [1, 2]
+    assert all(result["failed"] == 0 and result["probes"] == 1000 for result in results)
+
+
+def test_app_probes_reuse_connections_and_split_latency():
+    from app_probes import AppProber
+
+    connections = []
+
+    async def modbus(reader, writer):
+        connections.append("modbus")
+        while header := await reader.read(12):
+            writer.write(header[:4] + b"\x00\x05" + header[6:7] + b"\x03\x02\x00\x2a")
+
+    async def ipp(reader, writer):
+        connections.append("ipp")
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int(head.lower().split(b"content-length: ")[1].split(b"\r\n")[0])
+        await reader.readexactly(length)
+        writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}')
+        writer.close()
+
+    async def scenario():
+        servers = [await asyncio.start_server(handler, "127.0.0.1", 0) for handler in (modbus, _rtsp_once, ipp)]
+        ports = [server.sockets[0].getsockname()[1] for server in servers]
+        prober = AppProber()
+        try:
+            results = {}
+            for protocol, port in zip(("ModbusTCP", "RTSP", "IPP"), ports):
+                results[protocol] = [await prober.probe(protocol, "127.0.0.1", port, 2.0) for _ in range(3)]
+        finally:
+            prober.close()
+            for server in servers:
+                server.close()
+        return results
+
+    results = asyncio.run(scenario())
+    modbus_results = results["ModbusTCP"]
+    assert [r.detail for r in modbus_results] == ["hr0=42"] * 3
+    assert modbus_results[0].handshake_ms is not None
+    assert [r.handshake_ms for r in modbus_results[1:]] == [None, None]
+    assert connections.count("modbus") == 1
+    # RTSP server hangs up after every reply: the second probe retries on a fresh connection,
+    # after which the target is no longer kept alive.
+    assert all(r.ok and r.handshake_ms is not None and r.response_ms > 0 for r in results["RTSP"])
+    assert all(r.ok and r.detail == "HTTP 200" for r in results["IPP"])
+    assert connections.count("ipp") == 3
+
+
+def test_modbus_probe_drops_connection_on_mismatched_transaction_id():
+    from app_probes import AppProber
+
+    connections = []
+
+    async def modbus(reader, writer):
+        connections.append("modbus")
+        replies = 0
+        while header := await reader.read(12):
+            replies += 1
+            # the second reply on the first connection answers an older request
+            transaction = b"\xff\xff" if len(connections) == 1 and replies == 2 else header[:2]
+            writer.write(transaction + header[2:4] + b"\x00\x05" + header[6:7] + b"\x03\x02\x00\x2a")
+
+    async def scenario():
+        server = await asyncio.start_server(modbus, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        prober = AppProber()
+        try:
+            return [await prober.probe("ModbusTCP", "127.0.0.1", port, 2.0) for _ in range(3)]
+        finally:
+            prober.close()
+            server.close()
+
+    results = asyncio.run(scenario())
+    assert all(result.ok and result.detail == "hr0=42" for result in results)
+    assert results[1].handshake_ms is not None  # retried on a fresh connection
+    assert results[2].handshake_ms is None and connections.count("modbus") == 2
+
+
+def test_dicom_echo_reuses_association():
+    pynetdicom = pytest.importorskip("pynetdicom")
+    from pynetdicom.sop_class import Verification
+
+    from app_probes import DicomEchoProber
+
+    ae = pynetdicom.AE(ae_title="TESTSCP")
+    ae.add_supported_context(Verification)
+    server = ae.start_server(("127.0.0.1", 0), block=False)
+    port = server.server_address[1]
+    prober = DicomEchoProber(threads=1)
+
+    async def scenario():
+        return [await prober.echo("127.0.0.1", port, 5.0) for _ in range(2)]
+
+    try:
+        first, second = asyncio.run(scenario())
+    finally:
+        prober.close()
+        server.shutdown()
+    assert first.ok and second.ok and first.detail == "C-ECHO 0x0000"
+    assert first.handshake_ms is not None and second.handshake_ms is None
+    assert second.response_ms > 0
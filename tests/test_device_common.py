@@ -0,0 +1,198 @@
+import io
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from devices.scripts.common import (
+    Activity,
+    ActivityScheduler,
+    DatagramTransport,
+    DeviceContext,
+    HttpTransport,
+    LogLimiter,
+    LogWriter,
+    RateController,
+    encode_json,
+    use_device,
+)
+
+
+def test_log_writer_batches_and_reports_drops():
+    stream = io.StringIO()
+    writer = LogWriter(capacity=3, flush_interval=60, flush_bytes=1 << 20, stream=stream)
+    with use_device(DeviceContext("dev-log")):
+        for index in range(5):
+            writer.write(encode_json({"event": "tick", "n": index}))
+        assert stream.getvalue() == ""
+        writer.flush()
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [event["n"] for event in events[:3]] == [0, 1, 2]
+    assert events[3]["event"] == "log_dropped" and events[3]["dropped"] == 2
+    assert writer.stats() == {"queued": 0, "written": 4, "dropped": 2}
+    writer.flush()
+    assert len(stream.getvalue().splitlines()) == 4
+
+
+def test_log_writer_flushes_on_size_from_background_thread():
+    stream = io.StringIO()
+    writer = LogWriter(capacity=100, flush_interval=60, flush_bytes=64, stream=stream)
+    for index in range(10):
+        writer.write(encode_json({"event": "tick", "n": index}))
+    deadline = time.monotonic() + 2
+    while not stream.getvalue() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(stream.getvalue().splitlines()) >= 4
+
+
+def test_log_limiter_samples_rate_limits_and_rolls_up():
+    limiter = LogLimiter(sample={"heartbeat": 0.0}, rates={"coap_send": (0.001, 2)}, rollup_interval=3600)
+    device, other = DeviceContext("dev-a"), DeviceContext("dev-b")
+    assert [limiter.admit(device, "coap_send")[0] for _ in range(5)] == [True, True, False, False, False]
+    assert limiter.admit(other, "coap_send") == (True, None)
+    assert limiter.admit(device, "heartbeat") == (False, 0.0)
+    assert limiter.admit(device, "modbus_read") == (True, None)
+    assert limiter.admit(device, "log_dropped") == (True, None)
+    assert limiter.rollup() == []
+    (rollup,) = limiter.rollup(force=True)
+    assert rollup["event"] == "log_suppressed" and rollup["device_id"] == "dev-a"
+    assert rollup["suppressed"] == {"coap_send": 3, "heartbeat": 1}
+    assert rollup["emitted"] == {"coap_send": 2, "heartbeat": 0}
+    assert limiter.rollup(force=True) == []
+
+
+def test_datagram_transport_reuses_one_socket_per_kind():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(2)
+    address = receiver.getsockname()
+    transport = DatagramTransport()
+    try:
+        transport.send(b"one", address)
+        sock = transport.socket()
+        assert transport.send_many(((f"n{index}".encode(), address) for index in range(50))) == 50
+        assert transport.socket() is sock
+        assert transport.socket("broadcast").getsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST)
+        assert transport.socket("multicast").getsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL) == 2
+        received = [receiver.recv(64) for _ in range(51)]
+    finally:
+        transport.close()
+        receiver.close()
+    assert received[0] == b"one" and received[-1] == b"n49"
+
+
+class _CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = []
+
+    def setup(self):
+        super().setup()
+        self.connections.append(self.client_address)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_http_transport_keeps_connections_alive_unless_fresh():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CountingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/beacon"
+    transport = HttpTransport(connect_retries=0)
+    try:
+        assert [transport.request("POST", url, data=b"x").status_code for _ in range(3)] == [204, 204, 204]
+        assert len(_CountingHandler.connections) == 1
+        for _ in range(2):
+            transport.request("POST", url, fresh=True)
+        assert len(_CountingHandler.connections) == 3
+    finally:
+        transport.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_rate_controller_keeps_default_cadence_and_applies_load_mode():
+    device = DeviceContext("dev-a", device_type="ECG_MQTT")
+    assert RateController({"*": 1.0}).next_delay(12.5, device) == 12.5
+    controller = RateController({"ECG_MQTT": 10.0, "*": 2.0})
+    assert controller.next_delay(10.0, device) == 1.0
+    assert controller.next_delay(10.0, DeviceContext("dev-b", device_type="SMART_TV")) == 5.0
+    limited = RateController({"*": 1000.0}, global_rate=(100.0, 10.0), device_rate=(20.0, 1.0))
+    delays = [limited.next_delay(10.0, device, messages=2) for _ in range(3)]
+    assert delays[0] == pytest.approx(0.05, abs=0.01)
+    assert delays[2] == pytest.approx(0.25, abs=0.01)
+    other = limited.next_delay(10.0, DeviceContext("dev-b"), messages=2)
+    assert other == pytest.approx(0.05, abs=0.01)
+    assert limited.next_delay(10.0, DeviceContext("dev-c"), messages=4) == pytest.approx(0.15, abs=0.01)
+    # the process-wide bucket is now in debt, so it holds back a device that has tokens of its own
+    assert limited.next_delay(10.0, DeviceContext("dev-d")) == pytest.approx(0.03, abs=0.01)
+
+
+def test_activity_scheduler_keeps_fast_activities_running_past_a_slow_one():
+    fast_runs = []
+    release = threading.Event()
+    scheduler = ActivityScheduler(
+        [
+            Activity("slow", lambda: release.wait(2), period=0.1, timeout=0.2),
+            Activity("fast", lambda: fast_runs.append(time.monotonic()), period=0.1),
+        ],
+        executor=ThreadPoolExecutor(max_workers=2),
+    )
+    deadline = time.monotonic() + 0.8
+    while time.monotonic() < deadline:
+        time.sleep(min(scheduler.tick(), 0.05))
+    release.set()
+    scheduler.close()
+    stats = scheduler.stats()
+    assert len(fast_runs) >= 4 and stats["fast"]["runs"] == len(fast_runs)
+    assert stats["slow"]["runs"] == 1 and stats["slow"]["skipped"] >= 3
+    assert stats["slow"]["timeouts"] == 1 and stats["slow"]["max_ms"] >= 700
+
+
+def test_one_blocked_device_does_not_starve_the_shared_activity_pool():
+    pool = ThreadPoolExecutor(max_workers=2)
+    release = threading.Event()
+    blocked = ActivityScheduler(
+        [Activity(f"dead{index}", lambda: release.wait(2), period=0.05, timeout=5) for index in range(4)],
+        executor=pool,
+        max_running=1,
+    )
+    ran = threading.Event()
+    healthy = ActivityScheduler([Activity("ok", ran.set, period=0.05)], executor=pool, max_running=1)
+    start = time.monotonic()
+    blocked.tick()
+    healthy.tick()
+    assert ran.wait(1) and time.monotonic() - start < 0.5
+    assert sum(stats["skipped"] for stats in blocked.stats().values()) == 3
+    release.set()
+    blocked.close()
+    healthy.close()
+
+
+def test_malicious_ping_does_not_wait_for_a_silent_status_api(monkeypatch):
+    from devices.scripts import common
+
+    silent = socket.socket()
+    silent.bind(("127.0.0.1", 0))
+    silent.listen(8)  # accepts connections, never answers
+    monkeypatch.setattr(common, "BEACON_PORT", silent.getsockname()[1])
+    monkeypatch.setattr(common, "BEACON_TIMEOUT", 0.5)
+    device = DeviceContext("beacon-1", server_ip="127.0.0.1", malicious_mode=True)
+    with use_device(device):
+        start = time.monotonic()
+        common.malicious_ping("/beacon")
+        pending = common._beacons["beacon-1"]
+        common.malicious_ping("/beacon")  # dropped while the first is in flight
+        assert time.monotonic() - start < 0.2
+    assert common._beacons["beacon-1"] is pending
+    pending.result(timeout=5)  # the read timeout ends it; the error is logged, not raised
+    silent.close()
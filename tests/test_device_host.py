@@ -0,0 +1,63 @@
+import asyncio
+import json
+import types
+
+from devices.device_host import (
+    DeviceHost,
+    HostedDevice,
+    build_devices,
+    host_context,
+    load_profiles,
+    parse_spec,
+    registration,
+)
+from devices.scripts.common import LOG_WRITER, DeviceContext, json_log
+
+
+def test_fleet_spec_builds_distinct_device_contexts():
+    profiles = load_profiles()
+    devices = build_devices(parse_spec("CAMERA_RTSP=3,ECG_MQTT=2"), profiles, DeviceContext.from_env())
+    assert len(devices) == 5
+    assert len({device.context.device_id for device in devices}) == 5
+    assert len({device.context.mac for device in devices}) == 5
+    camera, ecg = devices[0], devices[-1]
+    assert camera.context.mac.startswith(profiles["CAMERA_RTSP"]["vendor_oui"].upper() + ":")
+    assert camera.context.role == "server" and not camera.generates_traffic
+    assert ecg.context.payload_template.endswith("ecg_mqtt.json") and ecg.generates_traffic
+
+
+def test_host_runs_cycles_in_each_device_context(capsys):
+    calls = []
+
+    def cycle(state):
+        state["n"] = state.get("n", 0) + 1
+        json_log("fake_cycle", n=state["n"])
+        calls.append(state["n"])
+        return 0.01
+
+    module = types.SimpleNamespace(cycle=cycle)
+    base = DeviceContext.from_env()
+    devices = [HostedDevice(base.derive(device_id=f"fake-{index}"), {}, module) for index in range(4)]
+    host = DeviceHost(devices, threads=2, ramp=0)
+
+    async def run_briefly():
+        task = asyncio.create_task(host.run(register=False))
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+    asyncio.run(run_briefly())
+    LOG_WRITER.flush()
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    cycled = {event["device_id"] for event in events if event["event"] == "fake_cycle"}
+    assert cycled == {f"fake-{index}" for index in range(4)}
+    assert all(device.cycles >= 2 and device.errors == 0 for device in devices)
+    assert len(calls) == sum(device.cycles for device in devices)
+
+
+def test_registration_has_an_address_and_only_served_protocols(monkeypatch):
+    monkeypatch.delenv("DEVICE_IP", raising=False)
+    devices = build_devices(parse_spec("CAMERA_RTSP=1,PLC_MODBUS=1,ECG_MQTT=1"), load_profiles(), host_context())
+    for device in devices:
+        payload = registration(device)
+        assert payload["ip_address"]
+        assert payload["protocols"] == []  # device_host starts no listeners for the hub to probe
@@ -0,0 +1,29 @@
+import json
+
+from server import logshipper
+from server.logshipper import LogRing, read_tail
+
+
+def test_read_tail_crosses_blocks_and_skips_bad_lines(tmp_path):
+    path = tmp_path / "events.log"
+    lines = [json.dumps({"event": "e", "n": index, "pad": "x" * (index % 7)}) for index in range(500)]
+    lines[-3] = "{not json"
+    path.write_text("\n".join(lines[:250]) + "\n\n" + "\n".join(lines[250:]) + "\n")
+
+    tail = read_tail(path, 10, block_size=64)
+    assert [entry["n"] for entry in tail] == [489, 490, 491, 492, 493, 494, 495, 496, 498, 499]
+    assert [entry["n"] for entry in read_tail(path, 1000, block_size=100)][:3] == [0, 1, 2]
+    assert read_tail(tmp_path / "missing.log", 10) == [] and read_tail(path, 0) == []
+
+
+def test_ring_primes_from_file_then_serves_ingests(tmp_path, monkeypatch):
+    path = tmp_path / "events.log"
+    path.write_text("".join(json.dumps({"n": index}) + "\n" for index in range(20)))
+    monkeypatch.setattr(logshipper, "LOG_FILE", path)
+    monkeypatch.setattr(logshipper, "RECENT", LogRing(size=5))
+
+    logshipper.append_log({"n": 20})
+    logshipper.append_log({"n": 21})
+    assert [entry["n"] for entry in logshipper.tail_logs(5)] == [17, 18, 19, 20, 21]
+    assert [entry["n"] for entry in logshipper.tail_logs(8)] == list(range(14, 22))  # beyond the ring: file
+    assert len(path.read_text().splitlines()) == 22
@@ -0,0 +1,105 @@
+import socket
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from devices.common.mqtt_fleet import MqttFleet
+
+
+class _Broker:
+    """Just enough MQTT 3.1.1 to accept sessions, count publishes and answer pings."""
+
+    def __init__(self):
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.client_ids = []
+        self.publishes = 0
+        self.connections = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self._accept, name="broker", daemon=True).start()
+
+    def _accept(self):
+        while True:
+            conn, _ = self.sock.accept()
+            with self.lock:
+                self.connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), name="broker", daemon=True).start()
+
+    @staticmethod
+    def _read(conn, size):
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def _serve(self, conn):
+        try:
+            while True:
+                header = self._read(conn, 1)[0]
+                length, shift = 0, 0
+                while True:
+                    byte = self._read(conn, 1)[0]
+                    length |= (byte & 0x7F) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = self._read(conn, length)
+                kind = header >> 4
+                if kind == 1:  # CONNECT: client id follows the 10-byte variable header
+                    id_len = int.from_bytes(body[10:12], "big")
+                    with self.lock:
+                        self.client_ids.append(body[12 : 12 + id_len].decode())
+                    conn.sendall(b"\x20\x02\x00\x00")
+                elif kind == 3:
+                    with self.lock:
+                        self.publishes += 1
+                elif kind == 12:
+                    conn.sendall(b"\xd0\x00")
+                elif kind == 14:
+                    break
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def drop_all(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.shutdown(socket.SHUT_RDWR)
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_fleet_drives_many_sessions_from_one_thread_and_reconnects():
+    broker = _Broker()
+    fleet = MqttFleet()
+    threads_before = set(threading.enumerate())
+    clients = [fleet.connect(mqtt.Client(client_id=f"dev-{index}"), "127.0.0.1", broker.port) for index in range(40)]
+    for client in clients:
+        for _ in range(3):
+            client.publish("t", b"x")
+    assert _wait_for(lambda: broker.publishes == 120)
+    assert sorted(broker.client_ids) == sorted(f"dev-{index}" for index in range(40))
+    new_threads = [thread.name for thread in set(threading.enumerate()) - threads_before if thread.name != "broker"]
+    assert new_threads == ["mqtt-fleet"]
+    assert _wait_for(lambda: fleet.stats() == {"sessions": 40, "connected": 40, "reconnects": 0})
+
+    broker.drop_all()
+    assert _wait_for(lambda: fleet.stats()["reconnects"] == 40 and fleet.stats()["connected"] == 40)
+    for client in clients:
+        client.publish("t", b"y")
+    assert _wait_for(lambda: broker.publishes == 160)
+
+    for client in clients:
+        fleet.disconnect(client)
+    assert _wait_for(lambda: fleet.stats()["sessions"] == 0)
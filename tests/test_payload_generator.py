@@ -1,6 +1,21 @@
+import json
+import os
+import uuid
 from pathlib import Path
 
-from devices.common.payload_generator import build_payload
+import numpy as np
+import pytest
+
+from devices.common.payload_generator import (
+    TEMPLATES,
+    TemplateCache,
+    build_frame,
+    build_payload,
+    build_payloads,
+    stream_payloads,
+)
+from devices.common.timeseries import series_from_token
+from devices.common.waveforms import WaveformEngine, WaveformSpec
 
 
 def test_payload_generator_renders_placeholders(tmp_path):
@@ -27,3 +42,125 @@ def test_waveform_placeholder():
     waveform = payload["payload"]["waveform"]
     assert waveform["type"] == "sinus"
     assert len(waveform["samples"]) == 20
+
+
+def test_template_cache_compiles_once_and_tracks_mtime(tmp_path):
+    template = tmp_path / "template.json"
+    template.write_text('{"value": "{choice:a}", "nested": [{"n": "{randint:1-1}"}]}')
+    cache = TemplateCache(size=2, recheck=0)
+    compiled = cache.get(template)
+    first, second = compiled.render({}), compiled.render({})
+    assert first == second == {"value": "a", "nested": [{"n": 1}]}
+    assert first["nested"] is not second["nested"]
+    assert cache.get(template) is compiled and (cache.hits, cache.misses) == (1, 1)
+
+    template.write_text('{"value": "{device_id}"}')
+    os.utime(template, ns=(0, template.stat().st_mtime_ns + 1_000_000))
+    assert cache.get(template).render({"device_id": "d1"}) == {"value": "d1"}
+    assert cache.misses == 2
+
+    others = [tmp_path / f"other{index}.json" for index in range(2)]
+    for other in others:
+        other.write_text("{}")
+        cache.get(other)
+    assert cache.get(template) is not compiled and cache.misses == 5
+
+
+def test_waveform_engine_keeps_phase_per_device_and_batches():
+    engine = WaveformEngine(seed=1)
+    spec = WaveformSpec(sample_rate=250.0, frequency=1.0, samples=100, noise=0.0)
+    first, second = engine.strip("sinus", "a", spec), engine.strip("sinus", "a", spec)
+    whole = WaveformEngine().strip("sinus", "a", WaveformSpec(250.0, 1.0, samples=200, noise=0.0))
+    assert np.allclose(np.concatenate([first, second]), whole)
+    assert np.allclose(engine.strip("sinus", "b", spec), first)
+
+    strips = engine.batch("ecg", ["a", "b", "c"], WaveformSpec(250.0, 1.0, samples=250, noise=0.0))
+    assert strips.shape == (3, 250)
+    assert np.allclose(strips[0], strips[1]) and strips[0].argmax() == 100  # R peak at 0.4 of the beat
+
+
+def test_batch_render_matches_single_render_shape(tmp_path):
+    template = tmp_path / "template.json"
+    template.write_text(
+        '{"id": "{device_id}", "n": "{randint:3-4}", "f": "{randfloat:1.0-2.0}", "c": "{choice:x,y}",'
+        ' "u": "{uuid}", "fixed": [1, {"fw": "{firmware_version}"}], "wave": "{waveform:square:10:5}"}'
+    )
+    contexts = [{"device_id": f"d{index}", "firmware_version": "2.0"} for index in range(50)]
+    payloads = build_payloads(template, contexts)
+    assert [payload["id"] for payload in payloads] == [context["device_id"] for context in contexts]
+    assert {payload["n"] for payload in payloads} == {3, 4} and all(1 <= p["f"] <= 2 for p in payloads)
+    assert all(payload["c"] in ("x", "y") for payload in payloads)
+    assert len({payload["u"] for payload in payloads}) == 50 and uuid.UUID(payloads[0]["u"]).version == 4
+    assert payloads[0]["fixed"] == [1, {"fw": "2.0"}] and payloads[0]["fixed"] is not payloads[1]["fixed"]
+    assert payloads[0]["wave"] == {"type": "square", "samples": [1.0, 1.0, 1.0, -1.0, -1.0], "sample_rate": 10.0}
+    assert payloads[0].keys() == build_payload(template, contexts[0]).keys()
+
+    encoded = list(stream_payloads(template, iter(contexts), batch_size=16))
+    assert len(encoded) == 50 and json.loads(encoded[7])["id"] == "d7"
+
+
+def test_payload_frame_patches_only_dynamic_slots(tmp_path):
+    template = tmp_path / "template.json"
+    template.write_text('{"name": "t", "fw": "{firmware_version}", "n": "{randint:1-9}", "tags": ["a", "{uuid}"]}')
+    frame = build_frame(template, {"device_id": "d1", "firmware_version": "3.1"})
+    assert len(frame.slots) == 2 and frame.chunks[0].startswith(b'{"name":"t","fw":"3.1","n":')
+    first, second = json.loads(frame.render()), json.loads(frame.render())
+    assert first.keys() == build_payload(template, {"firmware_version": "3.1"}).keys()
+    assert first["fw"] == "3.1" and 1 <= first["n"] <= 9 and first["tags"][1] != second["tags"][1]
+    assert build_frame(template, {}, previous=frame) is frame
+
+    msgpack = pytest.importorskip("msgpack")
+    packed = msgpack.unpackb(build_frame(template, {"firmware_version": "3.1"}, encoding="msgpack").render())
+    assert packed.keys() == first.keys() and packed["fw"] == "3.1"
+
+
+def test_time_series_placeholders_keep_per_device_state(tmp_path):
+    template = tmp_path / "template.json"
+    template.write_text('{"battery": "{drain:10-100:2}", "temp": "{walk:20.0-30.0:0.5}", "rate": "{ar1:55-120}"}')
+    contexts = [{"device_id": f"d{index}"} for index in range(200)]
+    readings = [build_payloads(template, contexts) for _ in range(20)]
+    for index in range(200):
+        battery = [payloads[index]["battery"] for payloads in readings]
+        temps = np.array([payloads[index]["temp"] for payloads in readings])
+        assert all(isinstance(value, int) and 10 <= value <= 100 for value in battery)
+        assert sum(later > earlier for earlier, later in zip(battery, battery[1:])) <= 1  # drains, refills at most once
+        assert np.abs(np.diff(temps)).max() < 4 and 20.0 <= temps.min() <= temps.max() <= 30.0
+
+    compiled = TEMPLATES.get(template)
+    drain = compiled.series["drain:10-100:2"]
+    before = drain.values[drain.slots["d0"]]
+    json.loads(compiled.frame({"device_id": "d0"}).render())
+    assert len(drain) == 200 and drain.values[drain.slots["d0"]] != before  # frames share the template's state
+
+    series = series_from_token("ar1:0.1-1.5")
+    series.advance([f"d{index}" for index in range(100_000)])
+    values = series.advance_all()
+    assert values.shape == (100_000,) and 0.1 <= values.min() <= values.max() <= 1.5
+
+    below_zero = series_from_token("walk:-10.0-5.0")
+    readings = [below_zero.next_one("d0") for _ in range(200)]
+    assert (below_zero.low, below_zero.high) == (-10.0, 5.0) and -10.0 <= min(readings) <= max(readings) <= 5.0
+    negative = series_from_token("step:-20--5")
+    assert (negative.low, negative.high, negative.integer) == (-20.0, -5.0, True)
+    with pytest.raises(ValueError):
+        series_from_token("walk:10")
+
+
+def test_personas_render_their_json_templates(monkeypatch):
+    from devices.scripts import smart_plug_coap, thermostat_mqtt
+    from devices.scripts.common import DeviceContext, use_device
+
+    with use_device(DeviceContext("thermo-1")):
+        payload = json.loads(thermostat_mqtt.telemetry({}).render())["payload"]
+    assert 18.0 <= payload["temperature_c"] <= 27.5 and 30.0 <= payload["humidity_pct"] <= 55.0
+
+    sent = []
+    monkeypatch.setattr(smart_plug_coap, "send_datagram", lambda data, address: sent.append(json.loads(data)))
+    monkeypatch.setattr(smart_plug_coap, "malicious_ping", lambda path: None)
+    state = {}
+    with use_device(DeviceContext("plug-1")):
+        smart_plug_coap.cycle(state)
+        smart_plug_coap.cycle(state)
+    reports = [json.loads(message["payload"])["payload"] for message in sent]
+    assert [report["state"] for report in reports] == ["on", "off"]
+    assert all(0 <= report["watts"] <= 1100 for report in reports)
@@ -0,0 +1,287 @@
+import importlib
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+HUB_DIR = Path(__file__).resolve().parents[1] / "hub"
+if str(HUB_DIR) not in sys.path:
+    sys.path.insert(0, str(HUB_DIR))
+
+from probe_metrics import ProbeRecord, ProbeResultStore  # noqa: E402
+from registry_store import (  # noqa: E402
+    ConnectionPool,
+    RegistrationBuffer,
+    fetch_all,
+    fetch_one,
+    init_db,
+    query_devices,
+    registration_row,
+    update_reachability,
+    upsert_devices,
+)
+
+
+def test_pool_uses_wal_and_batches_upserts(tmp_path):
+    pool = ConnectionPool(tmp_path / "registry.db", size=2)
+    init_db(pool)
+    rows = [
+        registration_row(f"dev{i}", "PLC_MODBUS", "both", f"10.0.0.{i}", ["ModbusTCP"], 1.0, "11.0.3", None)
+        for i in range(50)
+    ]
+    with pool.transaction() as conn:
+        upsert_devices(conn, rows)
+    with pool.transaction() as conn:
+        upsert_devices(conn, [registration_row("dev1", "PLC_MODBUS", "server", "10.0.0.99", [], 2.0, "12.0", None)])
+
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        devices = {device["device_id"]: device for device in fetch_all(conn)}
+    assert len(devices) == 50
+    assert devices["dev1"]["ip_address"] == "10.0.0.99"
+    assert devices["dev2"]["protocols"] == ["ModbusTCP"]
+    pool.close()
+
+
+def test_reregistration_keeps_probe_state_of_listed_protocols(tmp_path):
+    pool = ConnectionPool(tmp_path / "registry.db", size=1)
+    init_db(pool)
+
+    def register(ip, protocols):
+        with pool.transaction() as conn:
+            upsert_devices(conn, [registration_row("prt1", "PRINTER_SERVICE", "server", ip, protocols, 1.0, "1", None)])
+
+    register("10.3.0.1", ["IPP", "SNMP"])
+    with pool.transaction() as conn:
+        update_reachability(conn, [("prt1", "IPP", True, 5.0, 2.5, ""), ("prt1", "SNMP", False, 5.0, 900.0, "timeout")])
+    register("10.3.0.2", ["IPP", "HTTP"])  # new address, SNMP dropped, HTTP added
+
+    with pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT protocol, reachable, latency_ms FROM device_protocols WHERE device_id='prt1' ORDER BY protocol"
+        ).fetchall()
+    assert rows == [("HTTP", None, None), ("IPP", 1, 2.5)]
+    pool.close()
+
+
+def test_failed_commit_rolls_back_before_release(tmp_path):
+    pool = ConnectionPool(tmp_path / "registry.db", size=1)
+    with pool.connection() as conn:
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("CREATE TABLE parent (id INTEGER PRIMARY KEY)")
+        conn.execute(
+            "CREATE TABLE child (parent_id INTEGER REFERENCES parent(id) DEFERRABLE INITIALLY DEFERRED)"
+        )
+    with pytest.raises(sqlite3.IntegrityError):
+        with pool.transaction() as conn:
+            conn.execute("INSERT INTO child VALUES (1)")  # violation only surfaces at COMMIT
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM child").fetchone()[0] == 0
+    pool.close()
+
+
+def test_registration_buffer_absorbs_heartbeats(tmp_path):
+    pool = ConnectionPool(tmp_path / "registry.db", size=1)
+    init_db(pool)
+    buffer = RegistrationBuffer(pool, persist_after=60.0)
+
+    def row(ts, ip="10.0.0.1"):
+        return registration_row("plc01", "PLC_MODBUS", "both", ip, ["ModbusTCP"], ts, "11.0.3", None)
+
+    assert buffer.submit([row(100.0)]) == 1
+    assert buffer.flush() == 1
+    for ts in (110.0, 120.0, 130.0):
+        assert buffer.submit([row(ts)]) == 0
+    assert buffer.flush() == 0
+    with pool.connection() as conn:
+        stored = fetch_one(conn, "plc01")
+    assert stored["last_seen"] == 100.0
+    assert buffer.overlay_last_seen([stored])[0]["last_seen"] == 130.0
+
+    buffer.submit([row(170.0)])
+    assert buffer.flush() == 1
+    buffer.submit([row(171.0, ip="10.0.0.2")])
+    assert buffer.flush() == 1
+    with pool.connection() as conn:
+        stored = fetch_one(conn, "plc01")
+    assert (stored["ip_address"], stored["last_seen"]) == ("10.0.0.2", 171.0)
+    assert buffer.stats()["absorbed"] == 3
+    pool.close()
+
+
+@pytest.fixture
+def registry_client(tmp_path, monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setenv("REGISTRY_DB_PATH", str(tmp_path / "hub_registry.db"))
+    monkeypatch.setenv("REGISTRY_FLUSH_INTERVAL", "0")  # write-through, so reads see every request
+    sys.modules.pop("registry_service", None)
+    service = importlib.import_module("registry_service")
+    with TestClient(service.app) as client:
+        yield client
+    sys.modules.pop("registry_service", None)
+
+
+def test_register_batch_endpoint(registry_client):
+    batch = [
+        {"device_id": f"cam{i}", "device_type": "CAMERA_RTSP", "role": "server", "ip_address": f"10.1.0.{i}"}
+        for i in range(5)
+    ]
+    resp = registry_client.post("/register/batch", json=batch)
+    assert resp.status_code == 200
+    assert resp.json()["count"] == 5
+
+    resp = registry_client.post(
+        "/register",
+        json={"device_id": "cam0", "device_type": "CAMERA_RTSP", "role": "server", "ip_address": "10.1.0.50"},
+    )
+    assert resp.status_code == 200
+    assert registry_client.get("/devices/cam0").json()["ip_address"] == "10.1.0.50"
+    assert len(registry_client.get("/devices").json()) == 5
+
+
+def test_query_devices_filters_and_pages(tmp_path):
+    pool = ConnectionPool(tmp_path / "registry.db", size=1)
+    init_db(pool)
+    rows = [
+        registration_row("cam1", "CAMERA_RTSP", "server", "10.1.0.1", ["RTSP"], 10.0, "2.1.4", "00:1A:79:00:00:01"),
+        registration_row("plc1", "PLC_MODBUS", "both", "10.2.0.1", ["ModbusTCP"], 20.0, "11.0.3", None),
+        registration_row("plc2", "PLC_MODBUS", "both", "10.2.0.2", ["ModbusTCP"], 30.0, "11.0.3", None),
+        registration_row("hmi1", "HMI_PANEL", "client", "10.2.1.1", ["HTTP", "ModbusTCP"], 40.0, "5.0", None),
+    ]
+    with pool.transaction() as conn:
+        upsert_devices(conn, rows)
+        upsert_devices(conn, [registration_row("hmi1", "HMI_PANEL", "client", "10.2.1.1", ["HTTP"], 41.0, "5.0", None)])
+
+    def ids(**filters):
+        with pool.connection() as conn:
+            return [device["device_id"] for device in query_devices(conn, **filters)]
+
+    assert ids(protocol="ModbusTCP") == ["plc1", "plc2"]
+    assert ids(protocol="ModbusTCP", roles=["server"]) == []
+    assert ids(roles=["server", "both"]) == ["cam1", "plc1", "plc2"]
+    assert ids(device_types=["PLC_MODBUS"], seen_after=25.0) == ["plc2"]
+    assert ids(ip_prefix="10.2.") == ["hmi1", "plc1", "plc2"]
+    assert ids(mac="00:1a:79:00:00:01") == ["cam1"]
+    assert ids(limit=2) == ["cam1", "hmi1"]
+    assert ids(after="hmi1", limit=2) == ["plc1", "plc2"]
+    pool.close()
+
+
+def test_change_feed_reports_only_new_versions(registry_client):
+    registry_client.post("/register/batch", json=[
+        {"device_id": "cam1", "device_type": "CAMERA_RTSP", "role": "server", "ip_address": "10.1.0.1"},
+        {"device_id": "plc1", "device_type": "PLC_MODBUS", "role": "both", "ip_address": "10.2.0.1"},
+    ])
+    feed = registry_client.get("/devices/changes", params={"since": 0}).json()
+    assert [device["device_id"] for device in feed["changes"]] == ["cam1", "plc1"]
+    assert feed["version"] == feed["head"] == 2
+
+    registry_client.post(
+        "/register",
+        json={"device_id": "cam1", "device_type": "CAMERA_RTSP", "role": "server", "ip_address": "10.1.0.1"},
+    )
+    assert registry_client.get("/devices/changes", params={"since": 2}).json()["changes"] == []
+
+    registry_client.post(
+        "/register",
+        json={"device_id": "plc1", "device_type": "PLC_MODBUS", "role": "both", "ip_address": "10.2.0.9"},
+    )
+    feed = registry_client.get("/devices/changes", params={"since": 2}).json()
+    assert [(device["device_id"], device["version"]) for device in feed["changes"]] == [("plc1", 3)]
+
+
+def test_commits_wake_stream_readers(registry_client, monkeypatch):
+    service = sys.modules["registry_service"]
+
+    def woken(register):
+        waiter = service._feed_event
+        register()
+        deadline = time.monotonic() + 2.0
+        while not waiter.is_set() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return waiter.is_set()
+
+    camera = {"device_id": "cam1", "device_type": "CAMERA_RTSP", "role": "server", "ip_address": "10.1.0.1"}
+    assert woken(lambda: registry_client.post("/register", json=camera))  # write-through
+    monkeypatch.setattr(service, "FLUSH_INTERVAL", 1.0)
+    registry_client.post("/register", json={**camera, "ip_address": "10.1.0.2"})
+    assert woken(service.flush_buffer)  # write-behind: the timer's flush
+
+
+def test_reads_do_not_flush_the_write_behind_buffer(registry_client, monkeypatch):
+    service = sys.modules["registry_service"]
+    monkeypatch.setattr(service, "FLUSH_INTERVAL", 1.0)  # no flush task was started for the fixture
+    camera = {"device_id": "cam1", "device_type": "CAMERA_RTSP", "role": "server", "ip_address": "10.1.0.1"}
+    registry_client.post("/register", json=camera)
+    assert registry_client.get("/devices").json() == []
+    assert registry_client.get("/devices/cam1").status_code == 404
+    assert registry_client.get("/registry/stats").json()["pending_changes"] == 1
+
+    service.flush_buffer()
+    registry_client.post("/register", json=camera)  # heartbeat: absorbed, only last_seen moves
+    listed = registry_client.get("/devices", params={"seen_after": time.time() - 5}).json()
+    assert [device["device_id"] for device in listed] == ["cam1"]
+    assert registry_client.get("/devices", params={"seen_before": time.time() - 5}).json() == []
+
+
+def test_probe_results_feed_metrics_and_reachability(registry_client):
+    registration = {
+        "device_id": "prt1",
+        "device_type": "PRINTER_SERVICE",
+        "role": "server",
+        "ip_address": "10.3.0.1",
+        "protocols": ["IPP", "SNMP"],
+    }
+    registry_client.post("/register", json=registration)
+    registry_client.get("/devices")
+
+    def report(protocol, ok, latency, timestamp, error=""):
+        return {
+            "device_id": "prt1",
+            "protocol": protocol,
+            "host": "10.3.0.1",
+            "port": 6310 if protocol == "IPP" else 16100,
+            "ok": ok,
+            "latency_ms": latency,
+            "timestamp": timestamp,
+            "error": error,
+        }
+
+    reports = [report("IPP", True, latency, 100.0 + latency) for latency in (2.0, 3.0, 40.0)]
+    reports.append(report("SNMP", False, 2000.0, 150.0, "timeout"))
+    assert registry_client.post("/probes/results", json=reports).json() == {"accepted": 4}
+
+    stats = registry_client.get("/probes/stats").json()
+    assert stats["protocols"]["IPP"]["successes"] == 3
+    assert stats["devices"]["prt1"]["SNMP"]["failures"] == 1
+    metrics = registry_client.get("/metrics").text
+    assert 'hub_probe_latency_ms_bucket{protocol="IPP",le="2.5"} 1' in metrics
+    assert 'hub_probe_total{protocol="SNMP",outcome="failure"} 1' in metrics
+
+    device = registry_client.get("/devices/prt1").json()
+    assert device["reachable"] is False
+    assert device["last_probe"] == 150.0
+
+
+def test_per_device_probe_series_expire_and_are_capped():
+    store = ProbeResultStore(device_ttl=60.0, max_device_series=3)
+
+    def record(device_id):
+        return ProbeRecord(device_id, "IPP", "10.3.0.1", 6310, True, 2.0, 100.0)
+
+    store.add([record("prt1"), record("prt2")], now=0.0)
+    store.add([record("prt3")], now=50.0)
+    store.add([record("prt1")], now=55.0)
+    assert sorted(store.snapshot()["devices"]) == ["prt1", "prt2", "prt3"]
+    store.add([record("prt4")], now=56.0)  # over the cap: least recently updated (prt2) goes
+    assert sorted(store.snapshot()["devices"]) == ["prt1", "prt3", "prt4"]
+    store.expire(now=112.0)  # prt3 idle for 62s
+    assert sorted(store.snapshot()["devices"]) == ["prt1", "prt4"]
+    assert 'device_id="prt3"' not in store.render_prometheus(per_device=True)
+    assert store.snapshot()["protocols"]["IPP"]["successes"] == 5  # protocol totals are kept